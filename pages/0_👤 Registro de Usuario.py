@@ -1,5 +1,5 @@
 import streamlit as st
-from supabase import create_client
+from utils.repositorio import obtener_repositorio
 import hashlib
 
 # ✅ Verificación de sesión y rol
@@ -12,10 +12,8 @@ if rol != "admin":
     st.error("🚫 No tienes permiso para acceder a este módulo.")
     st.stop()
 
-# Conexión a Supabase
-url = st.secrets["SUPABASE_URL"]
-key = st.secrets["SUPABASE_KEY"]
-supabase = create_client(url, key)
+# Conexión a la base de datos
+repo = obtener_repositorio()
 
 st.title("👤 Registro de Nuevo Usuario")
 
@@ -44,7 +42,7 @@ with st.form("form_registro"):
                 "Password_Hash": hash_password(password)  # Para login
             }
             try:
-                supabase.table("Usuarios").insert(datos).execute()
+                repo.insertar("Usuarios", datos)
                 st.success(f"✅ Usuario {nombre} registrado correctamente.")
             except Exception as e:
                 st.error(f"❌ Error al registrar usuario: {e}")
@@ -2,7 +2,9 @@ import streamlit as st
 import pandas as pd
 import os
 from datetime import datetime
-from supabase import create_client
+from utils.cola_escritura import aviso_cola_escritura, escribir, notificar
+from utils.costos import COLUMNAS_DERIVADAS, calcular_tramo
+from utils.ids import obtener_asignador
 
 # ✅ Verificación de sesión y rol
 if "usuario" not in st.session_state:
@@ -14,10 +16,6 @@ if rol not in ["admin", "gerente", "ejecutivo"]:
     st.error("🚫 No tienes permiso para acceder a este módulo.")
     st.stop()
 
-url = st.secrets["SUPABASE_URL"]
-key = st.secrets["SUPABASE_KEY"]
-supabase = create_client(url, key)
-
 # Inicializa estado si no existe
 if "revisar_ruta" not in st.session_state:
     st.session_state.revisar_ruta = False
@@ -46,23 +44,30 @@ def guardar_datos_generales(valores):
     df = pd.DataFrame(valores.items(), columns=["Parametro", "Valor"])
     df.to_csv(RUTA_DATOS, index=False)
 
-def safe_number(x):
-    return 0 if (x is None or (isinstance(x, float) and pd.isna(x))) else x
+def tramo_de_captura(d):
+    """Datos del formulario con los nombres de columna de Rutas (entradas del motor de costos)."""
+    return {
+        "Tipo": d["tipo"], "Modo de Viaje": d["Modo de Viaje"], "KM": d["km"],
+        "Moneda": d["moneda_ingreso"], "Ingreso_Original": d["ingreso_flete"],
+        "Moneda_Cruce": d["moneda_cruce"], "Cruce_Original": d["ingreso_cruce"],
+        "Moneda Costo Cruce": d["moneda_costo_cruce"], "Costo Cruce": d["costo_cruce"],
+        "Casetas": d["casetas"], "Horas_Termo": d["horas_termo"], "Lavado_Termo": d["lavado_termo"],
+        "Movimiento_Local": d["movimiento_local"], "Puntualidad": d["puntualidad"], "Pension": d["pension"],
+        "Estancia": d["estancia"], "Fianza_Termo": d["fianza_termo"], "Renta_Termo": d["renta_termo"],
+        "Pistas_Extra": d["pistas_extra"], "Stop": d["stop"], "Falso": d["falso"],
+        "Gatas": d["gatas"], "Accesorios": d["accesorios"], "Guias": d["guias"],
+        "Extras_Cobrados": d.get("costos_extras_cobrados", False),
+    }
 
-# Generador de ID tipo IG000001
+# Generador de ID tipo IG000001 (bloques reservados en la base, servidos desde memoria)
 
 def generar_nuevo_id():
-    respuesta = supabase.table("Rutas").select("ID_Ruta").order("ID_Ruta", desc=True).limit(1).execute()
-    if respuesta.data:
-        ultimo = respuesta.data[0]["ID_Ruta"]
-        numero = int(ultimo[2:]) + 1
-    else:
-        numero = 1
-    return f"IG{numero:06d}"
+    return obtener_asignador("Rutas").siguiente()
 
 valores = cargar_datos_generales()
 
 st.title("🚛 Captura de Rutas + Datos Generales")
+aviso_cola_escritura()
 
 with st.expander("⚙️ Configurar Datos Generales"):
     col1, col2 = st.columns(2)
@@ -139,44 +144,15 @@ with st.form("captura_ruta"):
             "gatas": gatas, "accesorios": accesorios, "guias": guias,
             "costos_extras_cobrados": costos_extras_cobrados
         }
-        ingreso_total = (ingreso_flete * valores["Tipo de cambio USD"] if moneda_ingreso == "USD" else ingreso_flete)
-        ingreso_total += (ingreso_cruce * valores["Tipo de cambio USD"] if moneda_cruce == "USD" else ingreso_cruce)
-        
-        factor = 2 if Modo_de_Viaje == "Team" else 1
-
-        if tipo == "IMPORTACION":
-            pago_km = valores["Pago x km IMPORTACION"]
-            sueldo = km * pago_km * factor
-            bono = valores["Bono ISR IMSS"] * factor
-            costo_ind = ingreso_total * 0.35
-        elif tipo == "EXPORTACION":
-            pago_km = valores["Pago x km EXPORTACION"]
-            sueldo = km * pago_km * factor
-            bono = valores["Bono ISR IMSS"] * factor
-            costo_ind = ingreso_total * 0.35
-        else:
-            pago_km = 0.0
-            sueldo = valores["Pago fijo VACIO"] * factor
-            bono = 0.0
-            costo_ind = 0
-        puntualidad_val = puntualidad * factor
-        extras = sum(map(safe_number, [lavado_termo, movimiento_local, puntualidad_val, pension, estancia, fianza_termo, renta_termo, pistas_extra, stop, falso, gatas, accesorios, guias]))
-        
-        if costos_extras_cobrados: 
-            ingreso_total += extras
-
-        costo_cruce_convertido = costo_cruce * (valores["Tipo de cambio USD"] if moneda_costo_cruce == "USD" else 1)
-
-        costo_diesel_camion = (km / valores["Rendimiento Camion"]) * valores["Costo Diesel"]
-        costo_diesel_termo = horas_termo * valores["Rendimiento Termo"] * valores["Costo Diesel"]
-
-        costo_total = costo_diesel_camion + costo_diesel_termo + sueldo + bono + casetas + extras + costo_cruce_convertido
-        porcentaje_costo_directo = (costo_total / ingreso_total * 100) if ingreso_total > 0 else 0
-        utilidad_bruta = ingreso_total - costo_total
-        costos_indirectos = costo_ind
-        utilidad_neta = utilidad_bruta - costos_indirectos
-        porcentaje_bruta = (utilidad_bruta / ingreso_total * 100) if ingreso_total > 0 else 0
-        porcentaje_neta = (utilidad_neta / ingreso_total * 100) if ingreso_total > 0 else 0
+        r = calcular_tramo(tramo_de_captura(st.session_state.datos_captura), valores)
+        ingreso_total = r["Ingreso Total"]
+        costo_total = r["Costo_Total_Ruta"]
+        porcentaje_costo_directo = r["% Costo Directo"]
+        utilidad_bruta = r["Utilidad_Bruta"]
+        costos_indirectos = r["Costos_Indirectos"]
+        utilidad_neta = r["Utilidad_Neta"]
+        porcentaje_bruta = r["% Utilidad Bruta"]
+        porcentaje_neta = r["% Utilidad Neta"]
 
         def colored_bold(label, value, condition):
             color = "green" if condition else "red"
@@ -200,90 +176,27 @@ with st.form("captura_ruta"):
 if st.session_state.revisar_ruta and st.button("💾 Guardar Ruta"):
     d = st.session_state.datos_captura
 
-    tipo_cambio_flete = valores["Tipo de cambio USD"] if d["moneda_ingreso"] == "USD" else valores["Tipo de cambio MXP"]
-    tipo_cambio_cruce = valores["Tipo de cambio USD"] if d["moneda_cruce"] == "USD" else valores["Tipo de cambio MXP"]
-    tipo_cambio_costo_cruce = valores["Tipo de cambio USD"] if d["moneda_costo_cruce"] == "USD" else valores["Tipo de cambio MXP"]
-
-    ingreso_flete_convertido = d["ingreso_flete"] * tipo_cambio_flete
-    ingreso_cruce_convertido = d["ingreso_cruce"] * tipo_cambio_cruce
-    
-    factor = 2 if d["Modo de Viaje"] == "Team" else 1
-
-    if d["tipo"] == "IMPORTACION":
-        pago_km = valores["Pago x km IMPORTACION"]
-        sueldo = d["km"] * pago_km * factor
-        bono = valores["Bono ISR IMSS"] * factor
-    elif d["tipo"] == "EXPORTACION":
-        pago_km = valores["Pago x km EXPORTACION"]
-        sueldo = d["km"] * pago_km * factor
-        bono = valores["Bono ISR IMSS"] * factor
-    else:
-        pago_km = 0.0
-        sueldo = valores["Pago fijo VACIO"] * factor
-        bono = 0.0
-    
-    costos_extras_cobrados = d.get("costos_extras_cobrados", False)
-    puntualidad_val= d["puntualidad"] * factor
-    extras = sum([
-        safe_number(d["lavado_termo"]),
-        safe_number(d["movimiento_local"]),
-        safe_number(puntualidad_val),
-        safe_number(d["pension"]),
-        safe_number(d["estancia"]),
-        safe_number(d["fianza_termo"]),
-        safe_number(d["renta_termo"]),
-        safe_number(d["pistas_extra"]),
-        safe_number(d["stop"]),
-        safe_number(d["falso"]),
-        safe_number(d["gatas"]),
-        safe_number(d["accesorios"]),
-        safe_number(d["guias"]),
-    ])
-    # Ingreso total (tarifa total)
-    ingreso_total = ingreso_flete_convertido + ingreso_cruce_convertido
-    if costos_extras_cobrados:
-        ingreso_total += extras
-
-    costo_cruce_convertido = d["costo_cruce"] * tipo_cambio_costo_cruce
-    costo_diesel_camion = (d["km"] / valores["Rendimiento Camion"]) * valores["Costo Diesel"]
-    costo_diesel_termo = d["horas_termo"] * valores["Rendimiento Termo"] * valores["Costo Diesel"]
-
-    costo_total = costo_diesel_camion + costo_diesel_termo + sueldo + bono + d["casetas"] + extras + costo_cruce_convertido
+    # El ID se guarda con la captura: un reintento o doble clic no gasta otro ni duplica la ruta
+    if "ID_Ruta" not in d:
+        d["ID_Ruta"] = generar_nuevo_id()
+    nuevo_id = d["ID_Ruta"]
 
+    # Captura + columnas derivadas del motor de costos (Puntualidad se guarda sin el factor Team)
+    tramo = tramo_de_captura(d)
+    r = calcular_tramo(tramo, valores)
     nueva_ruta = {
-        "ID_Ruta": generar_nuevo_id(),
-        "Fecha": str(d["fecha"]), "Tipo": d["tipo"], "Cliente": d["cliente"], "Origen": d["origen"], "Destino": d["destino"], "Modo de Viaje": d["Modo de Viaje"], "KM": d["km"],
-        "Moneda": d["moneda_ingreso"], "Ingreso_Original": d["ingreso_flete"], "Tipo de cambio": tipo_cambio_flete,
-        "Ingreso Flete": ingreso_flete_convertido, "Moneda_Cruce": d["moneda_cruce"], "Cruce_Original": d["ingreso_cruce"],
-        "Tipo cambio Cruce": tipo_cambio_cruce, "Ingreso Cruce": ingreso_cruce_convertido,
-        "Moneda Costo Cruce": d["moneda_costo_cruce"], "Costo Cruce": d["costo_cruce"],
-        "Costo Cruce Convertido": costo_cruce_convertido,
-        "Ingreso Total": ingreso_total,
-        "Pago por KM": pago_km, "Sueldo_Operador": sueldo, "Bono": bono,
-        "Casetas": d["casetas"], "Horas_Termo": d["horas_termo"], "Lavado_Termo": d["lavado_termo"],
-        "Movimiento_Local": d["movimiento_local"], "Puntualidad": puntualidad_val, "Pension": d["pension"],
-        "Estancia": d["estancia"], "Fianza_Termo": d["fianza_termo"], "Renta_Termo": d["renta_termo"],
-        "Pistas_Extra": d["pistas_extra"], "Stop": d["stop"], "Falso": d["falso"],
-        "Gatas": d["gatas"], "Accesorios": d["accesorios"], "Guias": d["guias"],
-        "Costo_Diesel_Camion": costo_diesel_camion, "Costo_Diesel_Termo": costo_diesel_termo,
-        "Costo_Extras": extras, "Costo_Total_Ruta": costo_total, "Costo Diesel": valores["Costo Diesel"], "Rendimiento Camion": valores["Rendimiento Camion"], "Rendimiento Termo": valores["Rendimiento Termo"],
-        "Extras_Cobrados": costos_extras_cobrados,
+        "ID_Ruta": nuevo_id,
+        "Fecha": str(d["fecha"]), "Cliente": d["cliente"], "Origen": d["origen"], "Destino": d["destino"],
+        **tramo,
+        **{columna: r[columna] for columna in COLUMNAS_DERIVADAS},
     }
 
-    # Generar nuevo ID y verificar duplicado
-    nuevo_id = generar_nuevo_id()
-    existe = supabase.table("Rutas").select("ID_Ruta").eq("ID_Ruta", nuevo_id).execute()
-
-    if existe.data:
-        st.error("⚠️ Conflicto al generar ID. Intenta de nuevo.")
-    else:
-        nueva_ruta["ID_Ruta"] = nuevo_id
-        try:
-            supabase.table("Rutas").insert(nueva_ruta).execute()
-            st.success("✅ Ruta guardada exitosamente.")
-            st.session_state.revisar_ruta = False
-            del st.session_state["datos_captura"]
-            st.rerun()
-        except Exception as e:
-            st.error(f"❌ Error al guardar ruta: {e}")
-            st.json(nueva_ruta) 
+    try:
+        estado = escribir("Rutas", "insertar", nueva_ruta, llave=f"Rutas:insertar:{nuevo_id}")
+        notificar(estado, "✅ Ruta guardada exitosamente.")
+        st.session_state.revisar_ruta = False
+        del st.session_state["datos_captura"]
+        st.rerun()
+    except Exception as e:
+        st.error(f"❌ Error al guardar ruta: {e}")
+        st.json(nueva_ruta) 
@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
-from supabase import create_client
+import numpy as np
+from utils.costos import PORCENTAJE_INDIRECTOS, barrido_sensibilidad, calcular, normalizar_puntualidad, parametros_de_filas
+from utils.datos import aviso_datos_desactualizados, cargar_filas, cargar_tabla
 import os
 from fpdf import FPDF
 import tempfile
@@ -15,11 +17,6 @@ if rol not in ["admin", "gerente", "ejecutivo", "visitante"]:
     st.error("🚫 No tienes permiso para acceder a este módulo.")
     st.stop()
 
-# ✅ Conexión a Supabase
-url = st.secrets["SUPABASE_URL"]
-key = st.secrets["SUPABASE_KEY"]
-supabase = create_client(url, key)
-
 # ✅ Valores por defecto
 valores_por_defecto = {
     "Rendimiento Camion": 2.5,
@@ -36,20 +33,99 @@ if os.path.exists(RUTA_DATOS):
 else:
     valores = valores_por_defecto.copy()
 
-# ✅ Cargar rutas desde Supabase
-respuesta = supabase.table("Rutas").select("*").execute()
-df = pd.DataFrame(respuesta.data)
-
-# ✅ Asegurar formato correcto
-if not df.empty:
-    df["Fecha"] = pd.to_datetime(df["Fecha"]).dt.strftime("%Y-%m-%d")
-    df["Ingreso Total"] = pd.to_numeric(df["Ingreso Total"], errors="coerce").fillna(0)
-    df["Costo_Total_Ruta"] = pd.to_numeric(df["Costo_Total_Ruta"], errors="coerce").fillna(0)
+# ✅ Cargar rutas desde Supabase (solo lo que usan los selectores)
+COLUMNAS_BUSQUEDA = ["ID_Ruta", "Tipo", "Origen", "Destino", "Cliente"]
+df = cargar_tabla("Rutas", columnas=COLUMNAS_BUSQUEDA)
 
 st.title("🔍 Consulta Individual de Ruta")
+aviso_datos_desactualizados()
+
+def color_margen(v):
+    """Rojo = pérdida, amarillo = menos de 15% (meta de utilidad neta), verde = en meta."""
+    if pd.isna(v):
+        return ""
+    if v < 0:
+        return "background-color: #f8d7da"
+    return "background-color: #fff3cd" if v < 15 else "background-color: #d4edda"
+
+# =========================
+# 📊 Barrido de sensibilidad (todas las rutas)
+# =========================
+if st.toggle("📊 Barrido de sensibilidad (todas las rutas)"):
+    st.caption(
+        "Evalúa todas las rutas en una malla de precio del diésel × rendimiento del camión × tipo de cambio, "
+        "con el resto de Datos Generales actuales. Utilidad neta después de indirectos."
+    )
+    rutas = cargar_tabla("Rutas")
+    if rutas.empty:
+        st.warning("⚠️ No hay rutas guardadas todavía.")
+        st.stop()
+
+    diesel_base = float(valores.get("Costo Diesel", 24.0))
+    rend_base = float(valores.get("Rendimiento Camion", 2.5))
+    tc_base = float(valores.get("Tipo de cambio USD", 19.5))
+    col1, col2, col3 = st.columns(3)
+    rango_diesel = col1.slider("Costo Diesel ($/L)", round(diesel_base * 0.5, 1), round(diesel_base * 1.5, 1),
+                               (round(diesel_base * 0.8, 1), round(diesel_base * 1.2, 1)), step=0.1)
+    rango_rend = col2.slider("Rendimiento Camión (km/L)", round(rend_base * 0.5, 2), round(rend_base * 1.5, 2),
+                             (round(rend_base * 0.8, 2), round(rend_base * 1.2, 2)), step=0.05)
+    rango_tc = col3.slider("Tipo de cambio USD", round(tc_base * 0.7, 2), round(tc_base * 1.3, 2),
+                           (round(tc_base * 0.9, 2), round(tc_base * 1.1, 2)), step=0.05)
+    col1, col2 = st.columns(2)
+    pasos = col1.number_input("Pasos diésel y rendimiento", min_value=2, max_value=25, value=9)
+    pasos_tc = col2.number_input("Pasos tipo de cambio", min_value=1, max_value=9, value=3)
+
+    diesel = np.linspace(*rango_diesel, int(pasos))
+    rendimientos = np.linspace(*rango_rend, int(pasos))
+    tipos_cambio = np.linspace(*rango_tc, int(pasos_tc))
+    carriles = rutas["Origen"].astype(str) + " → " + rutas["Destino"].astype(str) + " (" + rutas["Tipo"].astype(str) + ")"
+    etiquetas, ingreso, utilidad = barrido_sensibilidad(rutas, valores, diesel, rendimientos, tipos_cambio, carriles)
+
+    tc_sel = st.select_slider("Tipo de cambio del mapa", options=list(tipos_cambio), value=tipos_cambio[len(tipos_cambio) // 2],
+                              format_func=lambda x: f"{x:.2f}")
+    k = int(np.flatnonzero(tipos_cambio == tc_sel)[0])
+    ingreso_flota = ingreso[..., k].sum(axis=0)
+    margen = np.where(ingreso_flota > 0, utilidad[..., k].sum(axis=0) / np.where(ingreso_flota > 0, ingreso_flota, 1) * 100, np.nan)
+    etiquetas_diesel = [f"${d:.2f}" for d in diesel]
+    etiquetas_rend = [f"{r:.2f} km/L" for r in rendimientos]
+
+    st.markdown("**% Utilidad Neta de toda la flota** (filas: diésel, columnas: rendimiento)")
+    st.dataframe(
+        pd.DataFrame(margen, index=etiquetas_diesel, columns=etiquetas_rend).style.format("{:.1f}%").map(color_margen),
+        use_container_width=True,
+    )
 
-def safe_number(x):
-    return 0 if pd.isna(x) else x
+    # Carriles cargados que hoy dejan utilidad y en el escenario no
+    tipo_carril = pd.Series(rutas["Tipo"].to_numpy(), index=carriles.to_numpy()).groupby(level=0).first().reindex(etiquetas)
+    utilidad_hoy = calcular(rutas, valores).groupby(carriles)["Utilidad_Neta"].sum().reindex(etiquetas).to_numpy()
+    vigilados = (tipo_carril.to_numpy() != "VACIO") & (utilidad_hoy >= 0)
+    se_pierden = vigilados[:, None, None] & (utilidad[..., k] < 0)
+
+    st.markdown("**Carriles que pasan a pérdida** (de los que hoy dejan utilidad)")
+    st.dataframe(
+        pd.DataFrame(se_pierden.sum(axis=0), index=etiquetas_diesel, columns=etiquetas_rend)
+        .style.map(lambda v: "background-color: #f8d7da" if v > 0 else ""),
+        use_container_width=True,
+    )
+
+    col1, col2 = st.columns(2)
+    i = etiquetas_diesel.index(col1.selectbox("Diésel", etiquetas_diesel, index=len(diesel) - 1))
+    j = etiquetas_rend.index(col2.selectbox("Rendimiento", etiquetas_rend, index=0))
+    perdidas = pd.DataFrame({
+        "Carril": etiquetas,
+        "Utilidad Neta hoy": utilidad_hoy,
+        "Utilidad Neta escenario": utilidad[:, i, j, k],
+        "% Utilidad Neta escenario": np.where(ingreso[:, i, j, k] > 0, utilidad[:, i, j, k] / np.where(ingreso[:, i, j, k] > 0, ingreso[:, i, j, k], 1) * 100, np.nan),
+    })[se_pierden[:, i, j]].sort_values("Utilidad Neta escenario")
+    if perdidas.empty:
+        st.success("✅ Ningún carril pasa a pérdida en ese escenario.")
+    else:
+        st.dataframe(
+            perdidas.style.format({"Utilidad Neta hoy": "${:,.2f}", "Utilidad Neta escenario": "${:,.2f}", "% Utilidad Neta escenario": "{:.1f}%"}),
+            hide_index=True,
+            use_container_width=True,
+        )
+    st.stop()
 
 def mostrar_resultados(ingreso_total, costo_total, porcentaje_costo_directo,
                        utilidad_bruta, costos_indirectos, utilidad_neta,
@@ -129,13 +205,17 @@ if ruta is None:
         format_func=lambda x: f"{df.loc[x, 'Cliente']} ({df.loc[x, 'Origen']} → {df.loc[x, 'Destino']})"
     )
     ruta = df.loc[index_sel]
-    
+
+# ✅ Registro completo solo de la ruta elegida, con formato correcto
+df_ruta = normalizar_puntualidad(cargar_filas("Rutas", [ruta["ID_Ruta"]]))
+if df_ruta.empty:
+    st.warning("⚠️ La ruta seleccionada ya no existe.")
+    st.stop()
+df_ruta["Fecha"] = df_ruta["Fecha"].dt.strftime("%Y-%m-%d")
+ruta = df_ruta.iloc[0]
+
 # Rendimiento registrado en la ruta (solo consulta)
-rend_reg = float(
-    safe_number(
-            ruta.get("Rendimiento_Camion", ruta.get("Rendimiento Camion", valores.get("Rendimiento Camion", 2.5)))
-    )
-)
+rend_reg = float(ruta.get("Rendimiento Camion", valores.get("Rendimiento Camion", 2.5)))
 
 # Campos simulables
 st.markdown("---")
@@ -158,26 +238,21 @@ if st.button("🔁 Simular"):
 
 # Mostrar resultados simulados si está activo
 if st.session_state.get("simular", False):
-    ingreso_total = safe_number(ruta["Ingreso Total"])
-    costo_diesel_camion = (safe_number(ruta["KM"]) / rendimiento_input) * costo_diesel_input
-    costo_diesel_termo = safe_number(ruta["Horas_Termo"]) * float(valores.get("Rendimiento Termo", 3.0)) * costo_diesel_input
-
-    costo_total = (
-        costo_diesel_camion +
-        costo_diesel_termo +
-        safe_number(ruta["Sueldo_Operador"]) +
-        safe_number(ruta["Bono"]) +
-        safe_number(ruta["Casetas"]) +
-        safe_number(ruta["Costo Cruce Convertido"]) +
-        safe_number(ruta["Costo_Extras"])
-    )
-
-    porcentaje_costo_directo = (costo_total / ingreso_total * 100) if ingreso_total > 0 else 0
-    utilidad_bruta = ingreso_total - costo_total
-    costos_indirectos = ingreso_total * 0.35
-    utilidad_neta = utilidad_bruta - costos_indirectos
-    porcentaje_bruta = (utilidad_bruta / ingreso_total * 100) if ingreso_total > 0 else 0
-    porcentaje_neta = (utilidad_neta / ingreso_total * 100) if ingreso_total > 0 else 0
+    # Motor de costos con los parámetros guardados en la ruta; solo diésel y rendimiento cambian
+    parametros = {
+        **parametros_de_filas(df_ruta, valores),
+        "Costo Diesel": costo_diesel_input,
+        "Rendimiento Camion": rendimiento_input,
+    }
+    sim = calcular(df_ruta, parametros).iloc[0]
+    ingreso_total = sim["Ingreso Total"]
+    costo_total = sim["Costo_Total_Ruta"]
+    porcentaje_costo_directo = sim["% Costo Directo"]
+    utilidad_bruta = sim["Utilidad_Bruta"]
+    costos_indirectos = sim["Costos_Indirectos"]
+    utilidad_neta = sim["Utilidad_Neta"]
+    porcentaje_bruta = sim["% Utilidad Bruta"]
+    porcentaje_neta = sim["% Utilidad Neta"]
 
     st.success("🔧 Estás viendo una simulación. Los valores han sido ajustados con los parámetros ingresados.")
     mostrar_resultados(ingreso_total, costo_total, porcentaje_costo_directo, utilidad_bruta, costos_indirectos, utilidad_neta, porcentaje_bruta, porcentaje_neta)
@@ -189,11 +264,11 @@ if st.session_state.get("simular", False):
 
 # Mostrar resultados reales por defecto
 else:
-    ingreso_total = safe_number(ruta["Ingreso Total"])
-    costo_total = safe_number(ruta["Costo_Total_Ruta"])
+    ingreso_total = ruta["Ingreso Total"]
+    costo_total = ruta["Costo_Total_Ruta"]
     porcentaje_costo_directo = (costo_total / ingreso_total * 100) if ingreso_total > 0 else 0
     utilidad_bruta = ingreso_total - costo_total
-    costos_indirectos = ingreso_total * 0.35
+    costos_indirectos = ingreso_total * PORCENTAJE_INDIRECTOS if ruta["Tipo"] != "VACIO" else 0
     utilidad_neta = utilidad_bruta - costos_indirectos
     porcentaje_bruta = (utilidad_bruta / ingreso_total * 100) if ingreso_total > 0 else 0
     porcentaje_neta = (utilidad_neta / ingreso_total * 100) if ingreso_total > 0 else 0
@@ -216,7 +291,7 @@ with col1:
     st.write(f"Modo: {ruta.get('Modo de Viaje', 'Operado')}")
     st.write(f"Cliente: {ruta['Cliente']}")
     st.write(f"Origen → Destino: {ruta['Origen']} → {ruta['Destino']}")
-    st.write(f"KM: {safe_number(ruta['KM']):,.2f}")
+    st.write(f"KM: {ruta['KM']:,.2f}")
     st.write(f"Rendimiento Camión (registrado): {rend_reg:.2f} km/L")
     if st.session_state.get("simular", False):
         st.write(f"Rendimiento Camión (simulación): {rendimiento_input:.2f} km/L")
@@ -224,45 +299,43 @@ with col1:
         
 with col2:
     st.write(f"Moneda Flete: {ruta['Moneda']}")
-    st.write(f"Ingreso Flete Original: ${safe_number(ruta['Ingreso_Original']):,.2f}")
-    st.write(f"Tipo de cambio: {safe_number(ruta['Tipo de cambio']):,.2f}")
-    st.write(f"Ingreso Flete Convertido: ${safe_number(ruta['Ingreso Flete']):,.2f}")
+    st.write(f"Ingreso Flete Original: ${ruta['Ingreso_Original']:,.2f}")
+    st.write(f"Tipo de cambio: {ruta['Tipo de cambio']:,.2f}")
+    st.write(f"Ingreso Flete Convertido: ${ruta['Ingreso Flete']:,.2f}")
     st.write(f"Moneda Cruce: {ruta['Moneda_Cruce']}")
-    st.write(f"Ingreso Cruce Original: ${safe_number(ruta['Cruce_Original']):,.2f}")
-    st.write(f"Tipo cambio Cruce: {safe_number(ruta['Tipo cambio Cruce']):,.2f}")
-    st.write(f"Ingreso Cruce Convertido: ${safe_number(ruta['Ingreso Cruce']):,.2f}")
+    st.write(f"Ingreso Cruce Original: ${ruta['Cruce_Original']:,.2f}")
+    st.write(f"Tipo cambio Cruce: {ruta['Tipo cambio Cruce']:,.2f}")
+    st.write(f"Ingreso Cruce Convertido: ${ruta['Ingreso Cruce']:,.2f}")
     st.write(f"Moneda Costo Cruce: {ruta['Moneda Costo Cruce']}")
-    st.write(f"Costo Cruce Original: ${safe_number(ruta['Costo Cruce']):,.2f}")
-    st.write(f"Costo Cruce Convertido: ${safe_number(ruta['Costo Cruce Convertido']):,.2f}")
+    st.write(f"Costo Cruce Original: ${ruta['Costo Cruce']:,.2f}")
+    st.write(f"Costo Cruce Convertido: ${ruta['Costo Cruce Convertido']:,.2f}")
     if st.session_state.get("simular", False):
-        costo_diesel_camion = (safe_number(ruta["KM"]) / rendimiento_input) * costo_diesel_input
-        st.write(f"Diesel Camión (Simulado): ${costo_diesel_camion:,.2f}")
+        st.write(f"Diesel Camión (Simulado): ${sim['Costo_Diesel_Camion']:,.2f}")
     else:
-        st.write(f"Diesel Camión: ${safe_number(ruta['Costo_Diesel_Camion']):,.2f}")
+        st.write(f"Diesel Camión: ${ruta['Costo_Diesel_Camion']:,.2f}")
     if st.session_state.get("simular", False):
-        costo_diesel_termo = safe_number(ruta["Horas_Termo"]) * safe_number(ruta["KM"]) * costo_diesel_input
-        st.write(f"Diesel Termo (Simulado): ${costo_diesel_termo:,.2f}")
+        st.write(f"Diesel Termo (Simulado): ${sim['Costo_Diesel_Termo']:,.2f}")
     else:
-        st.write(f"Diesel Termo: ${safe_number(ruta['Costo_Diesel_Termo']):,.2f}")
-    st.write(f"Sueldo Operador: ${safe_number(ruta['Sueldo_Operador']):,.2f}")
-    st.write(f"Bono: ${safe_number(ruta['Bono']):,.2f}")
-    st.write(f"Casetas: ${safe_number(ruta['Casetas']):,.2f}")
+        st.write(f"Diesel Termo: ${ruta['Costo_Diesel_Termo']:,.2f}")
+    st.write(f"Sueldo Operador: ${ruta['Sueldo_Operador']:,.2f}")
+    st.write(f"Bono: ${ruta['Bono']:,.2f}")
+    st.write(f"Casetas: ${ruta['Casetas']:,.2f}")
         
 with col3:
     st.write("**Extras:**")
-    st.write(f"- Lavado Termo: ${safe_number(ruta['Lavado_Termo']):,.2f}")
-    st.write(f"- Movimiento Local: ${safe_number(ruta['Movimiento_Local']):,.2f}")
-    st.write(f"- Puntualidad: ${safe_number(ruta['Puntualidad']):,.2f}")
-    st.write(f"- Pensión: ${safe_number(ruta['Pension']):,.2f}")
-    st.write(f"- Estancia: ${safe_number(ruta['Estancia']):,.2f}")
-    st.write(f"- Fianza Termo: ${safe_number(ruta['Fianza_Termo']):,.2f}")
-    st.write(f"- Renta Termo: ${safe_number(ruta['Renta_Termo']):,.2f}")
-    st.write(f"- Pistas Extra: ${safe_number(ruta.get('Pistas_Extra', 0)):,.2f}")
-    st.write(f"- Stop: ${safe_number(ruta.get('Stop', 0)):,.2f}")
-    st.write(f"- Falso: ${safe_number(ruta.get('Falso', 0)):,.2f}")
-    st.write(f"- Gatas: ${safe_number(ruta.get('Gatas', 0)):,.2f}")
-    st.write(f"- Accesorios: ${safe_number(ruta.get('Accesorios', 0)):,.2f}")
-    st.write(f"- Guías: ${safe_number(ruta.get('Guias', 0)):,.2f}")
+    st.write(f"- Lavado Termo: ${ruta['Lavado_Termo']:,.2f}")
+    st.write(f"- Movimiento Local: ${ruta['Movimiento_Local']:,.2f}")
+    st.write(f"- Puntualidad: ${ruta['Puntualidad']:,.2f}")
+    st.write(f"- Pensión: ${ruta['Pension']:,.2f}")
+    st.write(f"- Estancia: ${ruta['Estancia']:,.2f}")
+    st.write(f"- Fianza Termo: ${ruta['Fianza_Termo']:,.2f}")
+    st.write(f"- Renta Termo: ${ruta['Renta_Termo']:,.2f}")
+    st.write(f"- Pistas Extra: ${ruta.get('Pistas_Extra', 0):,.2f}")
+    st.write(f"- Stop: ${ruta.get('Stop', 0):,.2f}")
+    st.write(f"- Falso: ${ruta.get('Falso', 0):,.2f}")
+    st.write(f"- Gatas: ${ruta.get('Gatas', 0):,.2f}")
+    st.write(f"- Accesorios: ${ruta.get('Accesorios', 0):,.2f}")
+    st.write(f"- Guías: ${ruta.get('Guias', 0):,.2f}")
 
 # ✅ Función para limpiar caracteres no compatibles con PDF
 def safe_pdf_text(text):
@@ -285,7 +358,7 @@ pdf.cell(0, 10, safe_pdf_text(f"Tipo: {ruta['Tipo']}"), ln=True)
 pdf.cell(0, 10, safe_pdf_text(f"Modo: {ruta.get('Modo de Viaje', 'Operado')}"), ln=True)
 pdf.cell(0, 10, safe_pdf_text(f"Cliente: {ruta['Cliente']}"), ln=True)
 pdf.cell(0, 10, safe_pdf_text(f"Origen --> Destino: {ruta['Origen']} --> {ruta['Destino']}"), ln=True)
-pdf.cell(0, 10, safe_pdf_text(f"KM: {safe_number(ruta['KM']):,.2f}"), ln=True)
+pdf.cell(0, 10, safe_pdf_text(f"KM: {ruta['KM']:,.2f}"), ln=True)
 pdf.cell(0, 10, safe_pdf_text(f"Rendimiento Camión (registrado): {rend_reg:.2f} km/L"), ln=True)
 if st.session_state.get("simular", False):
     pdf.cell(0, 10, safe_pdf_text(f"Rendimiento Camión (simulación): {rendimiento_input:.2f} km/L"), ln=True)
@@ -304,14 +377,14 @@ pdf.cell(0, 10, safe_pdf_text(f"% Utilidad Neta: {porcentaje_neta:.2f}%"), ln=Tr
 
 pdf.ln(5)
 pdf.cell(0, 10, safe_pdf_text("Detalle de Costos y Extras:"), ln=True)
-pdf.cell(0, 10, safe_pdf_text(f"Ingreso Flete: ${safe_number(ruta['Ingreso Flete']):,.2f}"), ln=True)
-pdf.cell(0, 10, safe_pdf_text(f"Ingreso Cruce: ${safe_number(ruta['Ingreso Cruce']):,.2f}"), ln=True)
-pdf.cell(0, 10, safe_pdf_text(f"Costo Cruce: ${safe_number(ruta['Costo Cruce Convertido']):,.2f}"), ln=True)
-pdf.cell(0, 10, safe_pdf_text(f"Diesel Camión: ${safe_number(ruta['Costo_Diesel_Camion']):,.2f}"), ln=True)
-pdf.cell(0, 10, safe_pdf_text(f"Diesel Termo: ${safe_number(ruta['Costo_Diesel_Termo']):,.2f}"), ln=True)
-pdf.cell(0, 10, safe_pdf_text(f"Sueldo Operador: ${safe_number(ruta['Sueldo_Operador']):,.2f}"), ln=True)
-pdf.cell(0, 10, safe_pdf_text(f"Bono: ${safe_number(ruta['Bono']):,.2f}"), ln=True)
-pdf.cell(0, 10, safe_pdf_text(f"Casetas: ${safe_number(ruta['Casetas']):,.2f}"), ln=True)
+pdf.cell(0, 10, safe_pdf_text(f"Ingreso Flete: ${ruta['Ingreso Flete']:,.2f}"), ln=True)
+pdf.cell(0, 10, safe_pdf_text(f"Ingreso Cruce: ${ruta['Ingreso Cruce']:,.2f}"), ln=True)
+pdf.cell(0, 10, safe_pdf_text(f"Costo Cruce: ${ruta['Costo Cruce Convertido']:,.2f}"), ln=True)
+pdf.cell(0, 10, safe_pdf_text(f"Diesel Camión: ${ruta['Costo_Diesel_Camion']:,.2f}"), ln=True)
+pdf.cell(0, 10, safe_pdf_text(f"Diesel Termo: ${ruta['Costo_Diesel_Termo']:,.2f}"), ln=True)
+pdf.cell(0, 10, safe_pdf_text(f"Sueldo Operador: ${ruta['Sueldo_Operador']:,.2f}"), ln=True)
+pdf.cell(0, 10, safe_pdf_text(f"Bono: ${ruta['Bono']:,.2f}"), ln=True)
+pdf.cell(0, 10, safe_pdf_text(f"Casetas: ${ruta['Casetas']:,.2f}"), ln=True)
 
 pdf.ln(5)
 pdf.cell(0, 10, safe_pdf_text("Costos Detallados de Extras:"), ln=True)
@@ -321,7 +394,7 @@ extras = ["Lavado_Termo", "Movimiento_Local", "Puntualidad", "Pension", "Estanci
 
 for extra in extras:
     label = extra.replace("_", " ").title()
-    pdf.cell(0, 10, safe_pdf_text(f"{label}: ${safe_number(ruta.get(extra, 0)):,.2f}"), ln=True)
+    pdf.cell(0, 10, safe_pdf_text(f"{label}: ${ruta.get(extra, 0):,.2f}"), ln=True)
 
 temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
 pdf.output(temp_file.name)
@@ -1,6 +1,9 @@
 import streamlit as st
 import pandas as pd
-from supabase import create_client
+import numpy as np
+from utils.costos import PARAMETROS_POR_DEFECTO, normalizar_puntualidad, totales_viaje
+from utils.montecarlo import COLUMNAS_HISTORIAL, COLUMNAS_PLAN, SIMULACIONES, ajustar_distribuciones, resumen, simular
+from utils.datos import aviso_datos_desactualizados, cargar_filas, cargar_tabla
 import os
 from fpdf import FPDF
 import tempfile
@@ -15,29 +18,35 @@ if rol not in ["admin", "gerente", "ejecutivo", "visitante"]:
     st.error("🚫 No tienes permiso para acceder a este módulo.")
     st.stop()
 
-url = st.secrets["SUPABASE_URL"]
-key = st.secrets["SUPABASE_KEY"]
-supabase = create_client(url, key)
-
 st.title("🔁 Simulador de Vuelta Redonda")
 
 if "descargar_pdf" not in st.session_state:
     st.session_state.descargar_pdf = False
 
-def safe_number(x):
-    return 0 if (x is None or (isinstance(x, float) and pd.isna(x))) else x
+# Datos Generales actuales (centro de la simulación Monte Carlo)
+RUTA_DATOS = "datos_generales.csv"
+if os.path.exists(RUTA_DATOS):
+    valores = {**PARAMETROS_POR_DEFECTO, **pd.read_csv(RUTA_DATOS).set_index("Parametro")["Valor"].to_dict()}
+else:
+    valores = PARAMETROS_POR_DEFECTO.copy()
+
+# Columnas que necesita la búsqueda de combinaciones; el detalle completo
+# se pide después solo para los tramos elegidos
+COLUMNAS_SUGERENCIAS = [
+    "ID_Ruta", "Tipo", "Origen", "Destino", "Cliente", "Fecha", "Ingreso Total", "Costo_Total_Ruta",
+]
 
 # Cargar rutas desde Supabase
-respuesta = supabase.table("Rutas").select("*").execute()
-if not respuesta.data:
+df = cargar_tabla("Rutas", columnas=COLUMNAS_SUGERENCIAS)
+aviso_datos_desactualizados()
+if df.empty:
     st.warning("⚠️ No hay rutas guardadas en Supabase.")
     st.stop()
 
-df = pd.DataFrame(respuesta.data)
 df["Origen"] = df["Origen"].astype(str).str.strip().str.upper()
 df["Destino"] = df["Destino"].astype(str).str.strip().str.upper()
 df["Cliente"] = df["Cliente"].astype(str).str.strip().str.upper()
-df["Fecha"] = pd.to_datetime(df["Fecha"]).dt.strftime("%Y-%m-%d")
+df["Fecha"] = df["Fecha"].dt.strftime("%Y-%m-%d")
 df["Utilidad"] = df["Ingreso Total"] - df["Costo_Total_Ruta"]
 df["% Utilidad"] = (df["Utilidad"] / df["Ingreso Total"] * 100).round(2)
 
@@ -93,8 +102,8 @@ sugerencias = []
 # ➤ Rutas directas desde el destino actual
 directas = df[(df["Tipo"] == tipo_regreso) & (df["Origen"] == destino_origen)].copy()
 for _, row in directas.iterrows():
-    ingreso_total = safe_number(ruta_1["Ingreso Total"]) + safe_number(row["Ingreso Total"])
-    costo_total = safe_number(ruta_1["Costo_Total_Ruta"]) + safe_number(row["Costo_Total_Ruta"])
+    ingreso_total = ruta_1["Ingreso Total"] + row["Ingreso Total"]
+    costo_total = ruta_1["Costo_Total_Ruta"] + row["Costo_Total_Ruta"]
     utilidad = ingreso_total - costo_total
     porcentaje = (utilidad / ingreso_total) * 100 if ingreso_total else 0
     sugerencias.append({
@@ -109,8 +118,8 @@ for _, vacio in vacios.iterrows():
     origen_post = vacio["Destino"]
     candidatos = df[(df["Tipo"] == tipo_regreso) & (df["Origen"] == origen_post)].copy()
     for _, final in candidatos.iterrows():
-        ingreso_total = safe_number(ruta_1["Ingreso Total"]) + safe_number(final["Ingreso Total"])
-        costo_total = safe_number(ruta_1["Costo_Total_Ruta"]) + safe_number(vacio["Costo_Total_Ruta"]) + safe_number(final["Costo_Total_Ruta"])
+        ingreso_total = ruta_1["Ingreso Total"] + final["Ingreso Total"]
+        costo_total = ruta_1["Costo_Total_Ruta"] + vacio["Costo_Total_Ruta"] + final["Costo_Total_Ruta"]
         utilidad = ingreso_total - costo_total
         porcentaje = (utilidad / ingreso_total) * 100 if ingreso_total else 0
         descripcion = f"{final['Fecha']} — {final['Cliente']} (Vacío → {vacio['Origen']} → {vacio['Destino']}) → {final['Destino']} ({porcentaje:.2f}%)"
@@ -125,8 +134,8 @@ if tipo_principal == "VACIO":
     origen_vacio = ruta_1["Destino"]
     candidatos = df[(df["Tipo"].isin(["IMPORTACION", "EXPORTACION"])) & (df["Origen"] == origen_vacio)].copy()
     for _, final in candidatos.iterrows():
-        ingreso_total = safe_number(ruta_1["Ingreso Total"]) + safe_number(final["Ingreso Total"])
-        costo_total = safe_number(ruta_1["Costo_Total_Ruta"]) + safe_number(final["Costo_Total_Ruta"])
+        ingreso_total = ruta_1["Ingreso Total"] + final["Ingreso Total"]
+        costo_total = ruta_1["Costo_Total_Ruta"] + final["Costo_Total_Ruta"]
         utilidad = ingreso_total - costo_total
         porcentaje = (utilidad / ingreso_total) * 100 if ingreso_total else 0
         descripcion = f"{final['Fecha']} — {final['Cliente']} {final['Origen']} → {final['Destino']} ({porcentaje:.2f}%)"
@@ -137,7 +146,7 @@ if tipo_principal == "VACIO":
         })
 
 # Ordenar sugerencias por utilidad
-sugerencias = sorted(sugerencias, key=lambda x: (x["utilidad"] / (safe_number(ruta_1["Ingreso Total"]) + sum(safe_number(t.get("Ingreso Total", 0)) for t in x["tramos"]))), reverse=True)
+sugerencias = sorted(sugerencias, key=lambda x: (x["utilidad"] / (ruta_1["Ingreso Total"] + sum(t.get("Ingreso Total", 0) for t in x["tramos"]))), reverse=True)
 
 # Inicializar rutas seleccionadas
 rutas_seleccionadas = []
@@ -158,18 +167,32 @@ if sugerencias:
 else:
     st.warning("⚠️ No hay rutas de regreso disponibles.")
     rutas_seleccionadas = [ruta_1]
-    
+
+# Traer el registro completo solo de los tramos elegidos
+completas = normalizar_puntualidad(cargar_filas("Rutas", [r["ID_Ruta"] for r in rutas_seleccionadas]))
+
+def completar_tramo(r):
+    if r["ID_Ruta"] not in completas.index:
+        return r
+    completa = completas.loc[r["ID_Ruta"]].copy()
+    completa.update(r)  # conserva los valores normalizados (mayúsculas, fecha)
+    return completa
+
+rutas_seleccionadas = [completar_tramo(r) for r in rutas_seleccionadas]
+
 # 🔁 Simulación y visualización
 st.markdown("---")
 if "simulacion_realizada" not in st.session_state:
     st.session_state.simulacion_realizada = False
 
 if st.button("🚛 Simular Vuelta Redonda"):
-    ingreso_total = sum(safe_number(r.get("Ingreso Total", 0)) for r in rutas_seleccionadas)
-    costo_total_general = sum(safe_number(r.get("Costo_Total_Ruta", 0)) for r in rutas_seleccionadas)
-    utilidad_bruta = ingreso_total - costo_total_general
-    costos_indirectos = ingreso_total * 0.35
-    utilidad_neta = utilidad_bruta - costos_indirectos
+    # Mismos totales que el cierre del tráfico: los tramos VACIO no cargan indirectos
+    totales = totales_viaje(pd.DataFrame([dict(r) for r in rutas_seleccionadas]))
+    ingreso_total = totales["ingreso"]
+    costo_total_general = totales["costo"]
+    utilidad_bruta = totales["utilidad_bruta"]
+    costos_indirectos = totales["indirectos"]
+    utilidad_neta = totales["utilidad_neta"]
     pct_bruta = (utilidad_bruta / ingreso_total * 100) if ingreso_total > 0 else 0
     pct_neta = (utilidad_neta / ingreso_total * 100) if ingreso_total > 0 else 0
 
@@ -180,11 +203,11 @@ if st.button("🚛 Simular Vuelta Redonda"):
         st.markdown(f"**ID Ruta:** {r.get('ID_Ruta', 'N/A')}")
         st.markdown(f"- Fecha: {r.get('Fecha', 'N/A')}")
         st.markdown(f"- {r['Origen']} → {r['Destino']}")
-        st.markdown(f"- Ingreso Original: ${safe_number(r.get('Ingreso_Original')):,.2f}")
+        st.markdown(f"- Ingreso Original: ${r.get('Ingreso_Original', 0):,.2f}")
         st.markdown(f"- Moneda: {r.get('Moneda', 'N/A')}")
-        st.markdown(f"- Tipo de cambio: {safe_number(r.get('Tipo de cambio')):,.2f}")
-        st.markdown(f"- Ingreso Total: ${safe_number(r.get('Ingreso Total')):,.2f}")
-        st.markdown(f"- Costo Total Ruta: ${safe_number(r.get('Costo_Total_Ruta')):,.2f}")
+        st.markdown(f"- Tipo de cambio: {r.get('Tipo de cambio', 0):,.2f}")
+        st.markdown(f"- Ingreso Total: ${r.get('Ingreso Total', 0):,.2f}")
+        st.markdown(f"- Costo Total Ruta: ${r.get('Costo_Total_Ruta', 0):,.2f}")
 
     st.markdown("---")
     st.subheader("📊 Resultado General")
@@ -225,38 +248,38 @@ if st.button("🚛 Simular Vuelta Redonda"):
             f"Fecha: {r.get('Fecha', 'N/A')}",
             f"Cliente: {r.get('Cliente', 'N/A')}",
             f"Ruta: {r.get('Origen', 'N/A')} → {r.get('Destino', 'N/A')}",
-            f"KM: {safe_number(r.get('KM')):,.2f}",
-            f"Ingreso Original: ${safe_number(r.get('Ingreso_Original')):,.2f}",
+            f"KM: {r.get('KM', 0):,.2f}",
+            f"Ingreso Original: ${r.get('Ingreso_Original', 0):,.2f}",
             f"Moneda: {r.get('Moneda', 'N/A')}",
-            f"Tipo de cambio: {safe_number(r.get('Tipo de cambio')):,.2f}",
-            f"<span style='color:#007bff;font-weight:bold'>Ingreso Flete: ${safe_number(r.get('Ingreso Flete')):,.2f}</span>",
-            f"Cruce Original: ${safe_number(r.get('Cruce_Original')):,.2f}",
+            f"Tipo de cambio: {r.get('Tipo de cambio', 0):,.2f}",
+            f"<span style='color:#007bff;font-weight:bold'>Ingreso Flete: ${r.get('Ingreso Flete', 0):,.2f}</span>",
+            f"Cruce Original: ${r.get('Cruce_Original', 0):,.2f}",
             f"Moneda Cruce: {r.get('Moneda_Cruce', 'N/A')}",
-            f"Tipo de cambio: {safe_number(r.get('Tipo de cambio')):,.2f}",
-            f"<span style='color:#007bff;font-weight:bold'>Ingreso Cruce: ${safe_number(r.get('Ingreso Cruce')):,.2f}</span>",
-            f"<span style='color:#007bff;font-weight:bold'>Ingreso Total: ${safe_number(r.get('Ingreso Total')):,.2f}</span>",
-            f"Costo Diesel: ${safe_number(r.get('Costo Diesel')):,.2f}",
-            f"Rendimiento Camión: {safe_number(r.get('Rendimiento Camion')):,.2f} km/l",
-            f"Diesel Camión: ${safe_number(r.get('Costo_Diesel_Camion')):,.2f}",
-            f"Rendimiento Termo: {safe_number(r.get('Rendimiento Termo')):,.2f} l/hr",
-            f"Diesel Termo: ${safe_number(r.get('Costo_Diesel_Termo')):,.2f}",
-            f"Sueldo: ${safe_number(r.get('Sueldo_Operador')):,.2f}",
-            f"Casetas: ${safe_number(r.get('Casetas')):,.2f}",
-            f"Costo Cruce Convertido: ${safe_number(r.get('Costo Cruce Convertido')):,.2f}",
+            f"Tipo de cambio: {r.get('Tipo de cambio', 0):,.2f}",
+            f"<span style='color:#007bff;font-weight:bold'>Ingreso Cruce: ${r.get('Ingreso Cruce', 0):,.2f}</span>",
+            f"<span style='color:#007bff;font-weight:bold'>Ingreso Total: ${r.get('Ingreso Total', 0):,.2f}</span>",
+            f"Costo Diesel: ${r.get('Costo Diesel', 0):,.2f}",
+            f"Rendimiento Camión: {r.get('Rendimiento Camion', 0):,.2f} km/l",
+            f"Diesel Camión: ${r.get('Costo_Diesel_Camion', 0):,.2f}",
+            f"Rendimiento Termo: {r.get('Rendimiento Termo', 0):,.2f} l/hr",
+            f"Diesel Termo: ${r.get('Costo_Diesel_Termo', 0):,.2f}",
+            f"Sueldo: ${r.get('Sueldo_Operador', 0):,.2f}",
+            f"Casetas: ${r.get('Casetas', 0):,.2f}",
+            f"Costo Cruce Convertido: ${r.get('Costo Cruce Convertido', 0):,.2f}",
             "**Extras detallados:**",
-            f"Lavado Termo: ${safe_number(r.get('Lavado_Termo')):,.2f}",
-            f"Movimiento Local: ${safe_number(r.get('Movimiento_Local')):,.2f}",
-            f"Puntualidad: ${safe_number(r.get('Puntualidad')):,.2f}",
-            f"Pensión: ${safe_number(r.get('Pension')):,.2f}",
-            f"Estancia: ${safe_number(r.get('Estancia')):,.2f}",
-            f"Fianza Termo: ${safe_number(r.get('Fianza_Termo')):,.2f}",
-            f"Renta Termo: ${safe_number(r.get('Renta_Termo')):,.2f}",
-            f"Pistas Extra: ${safe_number(r.get('Pistas_Extra')):,.2f}",
-            f"Stop: ${safe_number(r.get('Stop')):,.2f}",
-            f"Falso: ${safe_number(r.get('Falso')):,.2f}",
-            f"Gatas: ${safe_number(r.get('Gatas')):,.2f}",
-            f"Accesorios: ${safe_number(r.get('Accesorios')):,.2f}",
-            f"Guías: ${safe_number(r.get('Guias')):,.2f}"
+            f"Lavado Termo: ${r.get('Lavado_Termo', 0):,.2f}",
+            f"Movimiento Local: ${r.get('Movimiento_Local', 0):,.2f}",
+            f"Puntualidad: ${r.get('Puntualidad', 0):,.2f}",
+            f"Pensión: ${r.get('Pension', 0):,.2f}",
+            f"Estancia: ${r.get('Estancia', 0):,.2f}",
+            f"Fianza Termo: ${r.get('Fianza_Termo', 0):,.2f}",
+            f"Renta Termo: ${r.get('Renta_Termo', 0):,.2f}",
+            f"Pistas Extra: ${r.get('Pistas_Extra', 0):,.2f}",
+            f"Stop: ${r.get('Stop', 0):,.2f}",
+            f"Falso: ${r.get('Falso', 0):,.2f}",
+            f"Gatas: ${r.get('Gatas', 0):,.2f}",
+            f"Accesorios: ${r.get('Accesorios', 0):,.2f}",
+            f"Guías: ${r.get('Guias', 0):,.2f}"
         ]
 
 
@@ -271,6 +294,33 @@ if st.button("🚛 Simular Vuelta Redonda"):
                 st.write("No aplica")
     
     st.session_state.simulacion_realizada = True
+
+# 🎲 Monte Carlo: la misma combinación bajo diésel, tipo de cambio, horas de termo y extras inciertos
+st.markdown("---")
+if st.toggle("🎲 Simulación Monte Carlo"):
+    historial = cargar_tabla("Traficos", columnas=COLUMNAS_HISTORIAL)
+    distribuciones = ajustar_distribuciones(historial, cargar_tabla("Rutas", columnas=COLUMNAS_PLAN))
+    st.caption(
+        f"Dispersión ajustada con {distribuciones['muestras']} tráficos: diésel ±{distribuciones['sigma_diesel'] * 100:.1f}%, "
+        f"tipo de cambio ±{distribuciones['sigma_tipo_cambio'] * 100:.1f}%, horas termo ±{distribuciones['sigma_horas_termo'] * 100:.1f}% "
+        "(desviación estándar), centrada en los Datos Generales actuales; extras por encima de lo planeado en la ruta según su frecuencia por tipo."
+    )
+    n_simulaciones = st.number_input("Escenarios", min_value=1000, max_value=200000, value=SIMULACIONES, step=1000)
+    simulacion = simular(pd.DataFrame(rutas_seleccionadas), valores, distribuciones, int(n_simulaciones))
+    res = resumen(simulacion)
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("% Utilidad Neta P5", f"{res['P5']:.2f}%")
+    col2.metric("% Utilidad Neta P50", f"{res['P50']:.2f}%")
+    col3.metric("% Utilidad Neta P95", f"{res['P95']:.2f}%")
+    col4.metric("Probabilidad de pérdida", f"{res['prob_perdida'] * 100:.1f}%")
+    st.write(f"**Utilidad Neta media:** ${res['utilidad_media']:,.2f}")
+
+    margenes = simulacion["margen"][np.isfinite(simulacion["margen"])]
+    if len(margenes):
+        conteo, bordes = np.histogram(margenes, bins=40)
+        st.bar_chart(pd.DataFrame({"Escenarios": conteo}, index=np.round((bordes[:-1] + bordes[1:]) / 2, 1)))
+
 st.markdown("---")
 st.subheader("📥 Generar PDF de la Simulación")
 pdf = FPDF()
@@ -287,9 +337,9 @@ for r in st.session_state.rutas_seleccionadas:
     pdf.cell(0, 10, f"ID Ruta: {r.get('ID_Ruta', 'N/A')}", ln=True)
     pdf.cell(0, 10, f"Fecha: {r.get('Fecha', 'N/A')}", ln=True)
     pdf.cell(0, 10, f"{r.get('Origen')} -> {r.get('Destino')}", ln=True)
-    pdf.cell(0, 10, f"Ingreso Original: ${safe_number(r.get('Ingreso_Original')):,.2f}", ln=True)
-    pdf.cell(0, 10, f"Ingreso Total: ${safe_number(r.get('Ingreso Total')):,.2f}", ln=True)
-    pdf.cell(0, 10, f"Costo Total Ruta: ${safe_number(r.get('Costo_Total_Ruta')):,.2f}", ln=True)
+    pdf.cell(0, 10, f"Ingreso Original: ${r.get('Ingreso_Original', 0):,.2f}", ln=True)
+    pdf.cell(0, 10, f"Ingreso Total: ${r.get('Ingreso Total', 0):,.2f}", ln=True)
+    pdf.cell(0, 10, f"Costo Total Ruta: ${r.get('Costo_Total_Ruta', 0):,.2f}", ln=True)
     pdf.cell(0, 10, "-----------------------------", ln=True)
 
 pdf.ln(5)
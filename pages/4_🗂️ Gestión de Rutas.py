@@ -2,7 +2,14 @@ import streamlit as st
 import pandas as pd
 import os
 from datetime import datetime
-from supabase import create_client
+from utils.cola_escritura import aviso_cola_escritura, escribir, notificar
+from utils.lote_escritura import TAM_MAXIMO, LoteEscritura, notificar_lote
+from utils.costos import (
+    AL_DIA, COLUMNAS_DERIVADAS, COLUMNAS_EXTRAS, DESACTUALIZADA, INCONSISTENTE, auditar_costos, calcular_tramo,
+    normalizar_puntualidad, puntualidad_legada, recalcular_rutas, reporte_deriva, resumen_delta, rutas_a_repreciar,
+)
+from utils.datos import aviso_datos_desactualizados, cargar_tabla
+from utils.repositorio import COLUMNA_MODIFICACION
 
 # ✅ Verificación de sesión y rol
 if "usuario" not in st.session_state:
@@ -14,11 +21,6 @@ if rol not in ["admin", "gerente", "ejecutivo"]:
     st.error("🚫 No tienes permiso para acceder a este módulo.")
     st.stop()
 
-# Configuración de conexión a Supabase
-url = st.secrets["SUPABASE_URL"]
-key = st.secrets["SUPABASE_KEY"]
-supabase = create_client(url, key)
-
 # =========================
 # Datos Generales (CSV)
 # =========================
@@ -67,25 +69,138 @@ def guardar_datos_generales(valores: dict) -> None:
     df = pd.DataFrame(registros, columns=["Parametro", "Valor"])
     df.to_csv(RUTA_DATOS, index=False)
 
-def safe_number(x):
-    return 0 if (x is None or (isinstance(x, float) and pd.isna(x))) else float(x)
+# Columnas que se pueden corregir en la tabla; las de COLUMNAS_DERIVADAS se recalculan
+COLUMNAS_EDITABLES = [
+    "Fecha", "Tipo", "Cliente", "Origen", "Destino", "Modo de Viaje", "KM",
+    "Moneda", "Ingreso_Original", "Moneda_Cruce", "Cruce_Original", "Moneda Costo Cruce", "Costo Cruce",
+    "Horas_Termo", *COLUMNAS_EXTRAS, "Casetas", "Extras_Cobrados",
+]
+
+def filas_completas(df: pd.DataFrame) -> list:
+    """
+    Filas enteras listas para upsert: sin updated_at (lo pone el backend), fechas en ISO
+    y NaN como null. Un upsert por bloque reemplaza la fila completa en una sola petición.
+    """
+    filas = df.drop(columns=[COLUMNA_MODIFICACION], errors="ignore").copy()
+    if "Fecha" in filas.columns:
+        # Una celda de fecha vaciada es NaT (que también tiene isoformat): se manda como null
+        filas["Fecha"] = filas["Fecha"].map(lambda f: None if pd.isna(f) else f.isoformat() if hasattr(f, "isoformat") else f)
+    filas = filas.astype(object).where(filas.notna(), None)
+    return filas.to_dict(orient="records")
+
+def cambios_en_tabla(original: pd.DataFrame, editado: pd.DataFrame, valores: dict):
+    """
+    Compara la tabla editada con la original. Devuelve (filas, eliminadas): las filas
+    con algún cambio, completas (celdas editadas + derivadas recalculadas) para un
+    upsert por bloque, y los ID que se quitaron de la tabla.
+    """
+    editado = editado.dropna(subset=["ID_Ruta"])  # filas nuevas sin ID: se capturan en Captura
+    eliminadas = sorted(set(original["ID_Ruta"]) - set(editado["ID_Ruta"]))
+
+    editables = [c for c in COLUMNAS_EDITABLES if c in original.columns]
+    antes = original.set_index("ID_Ruta")[editables]
+    despues = editado.set_index("ID_Ruta")[editables]
+    despues = despues[despues.index.isin(antes.index)]
+    antes = antes.loc[despues.index]
+    distinto = ~((antes == despues) | (antes.isna() & despues.isna()))
+    tocadas = distinto.any(axis=1)
+    if not tocadas.any():
+        return [], eliminadas
+
+    recalculadas = recalcular_rutas(editado[editado["ID_Ruta"].isin(tocadas[tocadas].index)], valores)
+    return filas_completas(recalculadas), eliminadas
 
 st.title("🗂️ Gestión de Rutas Guardadas")
 
 # Cargar rutas desde Supabase
-respuesta = supabase.table("Rutas").select("*").execute()
+df = cargar_tabla("Rutas")
+aviso_datos_desactualizados()
+aviso_cola_escritura()
 
 # Cargar Datos Generales desde CSV (única fuente de verdad)
 valores = cargar_datos_generales()
 
-if respuesta.data:
-    df = pd.DataFrame(respuesta.data)
+if not df.empty:
     # Normaliza fecha
     if "Fecha" in df.columns:
-        df["Fecha"] = pd.to_datetime(df["Fecha"]).dt.date
+        df["Fecha"] = df["Fecha"].dt.date
+
+    # Rutas Team guardadas con Puntualidad ya multiplicada por el factor: en pantalla y en
+    # los formularios se muestra por operador; la migración la deja así en la base
+    legadas = df[puntualidad_legada(df)]
+    df = normalizar_puntualidad(df)
+    if not legadas.empty:
+        st.warning(
+            f"⚠️ {len(legadas)} ruta(s) Team tienen la Puntualidad guardada con el factor Team ya aplicado "
+            "(captura anterior al motor de costos). Normalízalas antes de recalcular costos."
+        )
+        if st.button(f"🩹 Normalizar Puntualidad de {len(legadas)} ruta(s)"):
+            filas = filas_completas(df.loc[legadas.index])
+            with LoteEscritura() as lote:
+                lote.upsert("Rutas", filas)
+            notificar_lote(lote.resultado, f"✅ Puntualidad normalizada en {len(filas)} ruta(s).")
+            st.rerun()
+
+    # Auditoría de costos en cada carga: totales guardados vs. motor de costos
+    auditoria = auditar_costos(df, valores)
+    n_desactualizadas = int((auditoria["Estado"] == DESACTUALIZADA).sum())
+    n_inconsistentes = int((auditoria["Estado"] == INCONSISTENTE).sum())
+    if n_desactualizadas or n_inconsistentes:
+        st.warning(
+            f"⚠️ {n_desactualizadas} ruta(s) con costos de Datos Generales anteriores y "
+            f"{n_inconsistentes} que no cuadran ni con sus propios parámetros. "
+            "Puedes actualizarlas en ♻️ Recalcular costos guardados."
+        )
+        with st.expander("📉 Deriva de costos"):
+            agrupar = st.radio("Agrupar por", ["Ruta", "Cliente"], horizontal=True, key="deriva_por")
+            reporte = reporte_deriva(auditoria, agrupar)
+            st.dataframe(
+                reporte.style.format("{:,.2f}", subset=["Δ Costo", "|Δ Costo|"]),
+                use_container_width=True,
+            )
+            st.markdown("**Rutas con deriva**")
+            st.dataframe(
+                auditoria[auditoria["Estado"] != AL_DIA].sort_values("Δ Costo", key=abs, ascending=False),
+                hide_index=True,
+                use_container_width=True,
+            )
 
     st.subheader("📋 Rutas Registradas")
-    st.dataframe(df, use_container_width=True)
+    if st.toggle("✏️ Editar en tabla (varias rutas a la vez)"):
+        st.caption(
+            "Corrige celdas o borra filas y guarda: los costos de las rutas tocadas se recalculan "
+            "con los Datos Generales actuales y todo se envía en un solo lote."
+        )
+        tabla = df.reset_index(drop=True)
+        editables = [c for c in COLUMNAS_EDITABLES if c in tabla.columns]
+        editado = st.data_editor(
+            tabla,
+            key="editor_rutas",
+            num_rows="dynamic",
+            hide_index=True,
+            use_container_width=True,
+            disabled=[c for c in tabla.columns if c not in editables],
+            column_config={
+                "Tipo": st.column_config.SelectboxColumn(options=["IMPORTACION", "EXPORTACION", "VACIO"]),
+                "Modo de Viaje": st.column_config.SelectboxColumn(options=["Operador", "Team"]),
+                "Moneda": st.column_config.SelectboxColumn(options=["MXP", "USD"]),
+                "Moneda_Cruce": st.column_config.SelectboxColumn(options=["MXP", "USD"]),
+                "Moneda Costo Cruce": st.column_config.SelectboxColumn(options=["MXP", "USD"]),
+            },
+        )
+        filas_cambiadas, ids_quitados = cambios_en_tabla(tabla, editado, valores)
+        if filas_cambiadas or ids_quitados:
+            st.info(f"{len(filas_cambiadas)} ruta(s) modificada(s), {len(ids_quitados)} por eliminar.")
+            if st.button("💾 Guardar cambios de la tabla"):
+                # Un upsert por bloque de TAM_MAXIMO filas y un solo delete con in_()
+                with LoteEscritura() as lote:
+                    lote.upsert("Rutas", filas_cambiadas)
+                    lote.eliminar("Rutas", ids_quitados)
+                notificar_lote(lote.resultado, "✅ Cambios de la tabla guardados.")
+                st.session_state.pop("editor_rutas", None)
+                st.rerun()
+    else:
+        st.dataframe(df, use_container_width=True)
     st.markdown(f"**Total de rutas registradas:** {len(df)}")
     st.markdown("---")
 
@@ -94,11 +209,53 @@ if respuesta.data:
     ids_a_eliminar = st.multiselect("Selecciona los ID de ruta a eliminar", ids_disponibles)
 
     if st.button("Eliminar rutas seleccionadas") and ids_a_eliminar:
-        for idr in ids_a_eliminar:
-            supabase.table("Rutas").delete().eq("ID_Ruta", idr).execute()
-        st.success("✅ Rutas eliminadas correctamente.")
+        with LoteEscritura() as lote:
+            lote.eliminar("Rutas", ids_a_eliminar)
+        notificar_lote(lote.resultado, "✅ Rutas eliminadas correctamente.")
         st.rerun()
 
+    st.markdown("---")
+    st.subheader("♻️ Recalcular costos guardados")
+    if st.toggle("Recalcular rutas con los Datos Generales actuales"):
+        st.caption(
+            "Vuelve a calcular diésel, sueldo, bono, extras y totales de todas las rutas (o las filtradas) "
+            "con los Datos Generales guardados. Solo se escriben las rutas que cambian."
+        )
+        col_f1, col_f2 = st.columns(2)
+        tipos_filtro = col_f1.multiselect("Tipo", sorted(df["Tipo"].dropna().unique()), placeholder="Todos")
+        clientes_filtro = col_f2.multiselect("Cliente", sorted(df["Cliente"].dropna().unique()), placeholder="Todos")
+        alcance = df
+        if tipos_filtro:
+            alcance = alcance[alcance["Tipo"].isin(tipos_filtro)]
+        if clientes_filtro:
+            alcance = alcance[alcance["Cliente"].isin(clientes_filtro)]
+
+        repreciadas = rutas_a_repreciar(alcance, valores)
+        if repreciadas.empty:
+            st.success(f"✅ Las {len(alcance)} ruta(s) ya están al día con los Datos Generales.")
+        else:
+            st.info(f"{len(repreciadas)} de {len(alcance)} ruta(s) cambian.")
+            resumen = resumen_delta(alcance.loc[repreciadas.index], repreciadas)
+            st.dataframe(
+                resumen.style.format("{:,.2f}", subset=[c for c in resumen.columns if c != "Rutas"]),
+                use_container_width=True,
+            )
+            if not legadas.empty:
+                st.info("🩹 Normaliza primero la Puntualidad de las rutas Team legadas (aviso de arriba).")
+            if st.button(f"💾 Recalcular y guardar {len(repreciadas)} ruta(s)", disabled=not legadas.empty):
+                # recalcular_rutas devuelve la fila entera: se reescribe con un upsert por bloque
+                filas = filas_completas(repreciadas)
+                barra = st.progress(0.0, text="Guardando rutas...")
+                with LoteEscritura() as lote:
+                    # Un bloque de TAM_MAXIMO filas por petición; la barra avanza con cada uno
+                    for i in range(0, len(filas), TAM_MAXIMO):
+                        lote.upsert("Rutas", filas[i:i + TAM_MAXIMO])
+                        lote.enviar()
+                        barra.progress(min(1.0, (i + TAM_MAXIMO) / len(filas)), text="Guardando rutas...")
+                barra.empty()
+                notificar_lote(lote.resultado, f"✅ {lote.resultado.aplicadas or lote.resultado.encoladas} ruta(s) recalculadas.")
+                st.rerun()
+
     st.markdown("---")
     st.subheader("✏️ Editar Ruta Existente")
 
@@ -198,68 +355,31 @@ if respuesta.data:
     if st.session_state.get("revisar_edicion", False):
         d = st.session_state.datos_edicion
 
-        # Funciones auxiliares (idénticas a Captura)
-        def safe_number(x):
-            return 0 if (x is None or (isinstance(x, float) and pd.isna(x))) else float(x)
-
         def colored_bold(label, value, condition):
             color = "green" if condition else "red"
             return f"<strong>{label}:</strong> <span style='color:{color}; font-weight:bold'>{value}</span>"
 
-        # === Cálculos idénticos a Captura de Rutas ===
-        tc_usd = float(valores.get("Tipo de cambio USD", 17.5))
-        tc_mxp = float(valores.get("Tipo de cambio MXP", 1.0))
-        tipo_cambio_flete = tc_usd if d["moneda_ingreso"] == "USD" else tc_mxp
-        tipo_cambio_cruce = tc_usd if d["moneda_cruce"] == "USD" else tc_mxp
-        tipo_cambio_costo_cruce = tc_usd if d["moneda_costo_cruce"] == "USD" else tc_mxp
-
-        ingreso_flete_convertido = d["ingreso_flete"] * tipo_cambio_flete
-        ingreso_cruce_convertido = d["ingreso_cruce"] * tipo_cambio_cruce
-        ingreso_total = ingreso_flete_convertido + ingreso_cruce_convertido
-
-        rendimiento_camion = float(valores.get("Rendimiento Camion", 1))
-        costo_diesel = float(valores.get("Costo Diesel", 1))
-        rendimiento_termo = float(valores.get("Rendimiento Termo", 1))
-        costo_diesel_camion = (d["km"] / max(rendimiento_camion, 0.0001)) * costo_diesel
-        costo_diesel_termo = d["horas_termo"] * max(rendimiento_termo, 0) * costo_diesel
-
-        factor = 2 if d["Modo de Viaje"] == "Team" else 1
-
-        if d["tipo"] == "IMPORTACION":
-            pago_km = float(valores.get("Pago x km IMPORTACION", 2.1))
-            sueldo = d["km"] * pago_km * factor
-            bono = float(valores.get("Bono ISR IMSS", 0)) * factor
-            costo_ind = ingreso_total * 0.35
-        elif d["tipo"] == "EXPORTACION":
-            pago_km = float(valores.get("Pago x km EXPORTACION", 2.5))
-            sueldo = d["km"] * pago_km * factor
-            bono = float(valores.get("Bono ISR IMSS", 0)) * factor
-            costo_ind = ingreso_total * 0.35
-        else:
-            pago_km = 0.0
-            sueldo = float(valores.get("Pago fijo VACIO", 200.0)) * factor
-            bono = 0.0
-            costo_ind = 0
-
-        puntualidad_val = d["puntualidad"] * factor
-        extras = sum(map(safe_number, [
-            d["lavado_termo"], d["movimiento_local"], puntualidad_val, d["pension"], d["estancia"],
-            d["fianza_termo"], d["renta_termo"], d["pistas_extra"], d["stop"], d["falso"],
-            d["gatas"], d["accesorios"], d["guias"]
-        ]))
-
-        if d["extras_cobrados"]:
-            ingreso_total += extras  # primero calculamos extras y luego (opcional) los sumamos al ingreso
-
-        costo_cruce_convertido = d["costo_cruce"] * tipo_cambio_costo_cruce
-        costo_total = (
-            costo_diesel_camion + costo_diesel_termo + sueldo + bono + d["casetas"] + extras + costo_cruce_convertido
-        )
-        utilidad_bruta = ingreso_total - costo_total
-        costos_indirectos = costo_ind
-        utilidad_neta = utilidad_bruta - costos_indirectos
-        porcentaje_bruta = (utilidad_bruta / ingreso_total * 100) if ingreso_total > 0 else 0
-        porcentaje_neta = (utilidad_neta / ingreso_total * 100) if ingreso_total > 0 else 0
+        # === Mismo motor de costos que Captura y la tabla editable ===
+        tramo = {
+            "Tipo": d["tipo"], "Modo de Viaje": d["Modo de Viaje"], "KM": d["km"],
+            "Moneda": d["moneda_ingreso"], "Ingreso_Original": d["ingreso_flete"],
+            "Moneda_Cruce": d["moneda_cruce"], "Cruce_Original": d["ingreso_cruce"],
+            "Moneda Costo Cruce": d["moneda_costo_cruce"], "Costo Cruce": d["costo_cruce"],
+            "Casetas": d["casetas"], "Horas_Termo": d["horas_termo"], "Lavado_Termo": d["lavado_termo"],
+            "Movimiento_Local": d["movimiento_local"], "Puntualidad": d["puntualidad"], "Pension": d["pension"],
+            "Estancia": d["estancia"], "Fianza_Termo": d["fianza_termo"], "Renta_Termo": d["renta_termo"],
+            "Pistas_Extra": d["pistas_extra"], "Stop": d["stop"], "Falso": d["falso"],
+            "Gatas": d["gatas"], "Accesorios": d["accesorios"], "Guias": d["guias"],
+            "Extras_Cobrados": d["extras_cobrados"],
+        }
+        r = calcular_tramo(tramo, valores)
+        ingreso_total = r["Ingreso Total"]
+        costo_total = r["Costo_Total_Ruta"]
+        utilidad_bruta = r["Utilidad_Bruta"]
+        costos_indirectos = r["Costos_Indirectos"]
+        utilidad_neta = r["Utilidad_Neta"]
+        porcentaje_bruta = r["% Utilidad Bruta"]
+        porcentaje_neta = r["% Utilidad Neta"]
 
         st.markdown("---")
         st.subheader("📊 Ingresos y Utilidades (previo a guardar)")
@@ -275,55 +395,16 @@ if respuesta.data:
         if st.button("💾 Guardar cambios"):
             try:
                 ruta_actualizada = {
-                    "Modo de Viaje": d["Modo de Viaje"],
                     "Fecha": d["fecha"].isoformat(),
-                    "Tipo": d["tipo"],
                     "Cliente": d["cliente"],
                     "Origen": d["origen"],
                     "Destino": d["destino"],
-                    "KM": d["km"],
-                    "Moneda": d["moneda_ingreso"],
-                    "Ingreso_Original": d["ingreso_flete"],
-                    "Tipo de cambio": tipo_cambio_flete,
-                    "Ingreso Flete": ingreso_flete_convertido,
-                    "Moneda_Cruce": d["moneda_cruce"],
-                    "Cruce_Original": d["ingreso_cruce"],
-                    "Tipo cambio Cruce": tipo_cambio_cruce,
-                    "Ingreso Cruce": ingreso_cruce_convertido,
-                    "Ingreso Total": ingreso_total,
-                    "Moneda Costo Cruce": d["moneda_costo_cruce"],
-                    "Costo Cruce": d["costo_cruce"],
-                    "Costo Cruce Convertido": costo_cruce_convertido,
-                    "Pago por KM": pago_km,
-                    "Sueldo_Operador": sueldo,
-                    "Bono": bono,
-                    "Casetas": d["casetas"],
-                    "Horas_Termo": d["horas_termo"],
-                    "Lavado_Termo": d["lavado_termo"],
-                    "Movimiento_Local": d["movimiento_local"],
-                    "Puntualidad": d["puntualidad"],
-                    "Pension": d["pension"],
-                    "Estancia": d["estancia"],
-                    "Fianza_Termo": d["fianza_termo"],
-                    "Renta_Termo": d["renta_termo"],
-                    "Pistas_Extra": d["pistas_extra"],
-                    "Stop": d["stop"],
-                    "Falso": d["falso"],
-                    "Gatas": d["gatas"],
-                    "Accesorios": d["accesorios"],
-                    "Guias": d["guias"],
-                    "Costo_Diesel_Camion": costo_diesel_camion,
-                    "Costo_Diesel_Termo": costo_diesel_termo,
-                    "Costo_Extras": extras,
-                    "Costo_Total_Ruta": costo_total,
-                    "Costo Diesel": costo_diesel,
-                    "Rendimiento Camion": rendimiento_camion,
-                    "Rendimiento Termo": rendimiento_termo,
-                    "Extras_Cobrados": d["extras_cobrados"],
+                    **tramo,
+                    **{columna: r[columna] for columna in COLUMNAS_DERIVADAS},
                 }
 
-                supabase.table("Rutas").update(ruta_actualizada).eq("ID_Ruta", d["id_editar"]).execute()
-                st.success("✅ Ruta actualizada exitosamente.")
+                estado = escribir("Rutas", "actualizar", ruta_actualizada, [("eq", "ID_Ruta", d["id_editar"])])
+                notificar(estado, "✅ Ruta actualizada exitosamente.")
                 # Limpia flags/estado
                 st.session_state.revisar_edicion = False
                 st.session_state.pop("datos_edicion", None)
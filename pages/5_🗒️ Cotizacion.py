@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 from fpdf import FPDF
 from datetime import date
-from supabase import create_client
+from utils.datos import aviso_datos_desactualizados, cargar_filas, cargar_tabla
 import re, os
 from pathlib import Path
 
@@ -13,13 +13,6 @@ try:
 except Exception:
     HAS_PIL = False
 
-# ---------------------------
-# CONEXIÓN A SUPABASE
-# ---------------------------
-url = st.secrets["SUPABASE_URL"]
-key = st.secrets["SUPABASE_KEY"]
-supabase = create_client(url, key)
-
 # ---------------------------
 # VERIFICACIÓN DE SESIÓN Y ROL
 # ---------------------------
@@ -40,17 +33,15 @@ st.title("📝 Generador de Cotización para Clientes")
 # ---------------------------
 # CARGAR RUTAS DE SUPABASE
 # ---------------------------
-respuesta = supabase.table("Rutas").select("*").execute()
-if not respuesta.data:
+# El selector solo necesita estas columnas; el detalle se pide por ID al elegir
+COLUMNAS_SELECTOR = ["ID_Ruta", "Tipo", "Origen", "Destino"]
+
+df = cargar_tabla("Rutas", columnas=COLUMNAS_SELECTOR)
+aviso_datos_desactualizados()
+if df.empty:
     st.warning("⚠️ No hay rutas registradas en Supabase.")
     st.stop()
 
-df = pd.DataFrame(respuesta.data)
-df["Fecha"] = pd.to_datetime(df["Fecha"]).dt.date
-# Acceso rápido por ID
-if "ID_Ruta" in df.columns:
-    df.set_index("ID_Ruta", inplace=True, drop=False)
-
 fecha = st.date_input("Fecha de cotización", value=date.today(), format="DD/MM/YYYY")
 
 # ---------------------------
@@ -84,10 +75,15 @@ ids_seleccionados = st.multiselect(
 # ---------------------------
 # MONEDA Y TIPO DE CAMBIO
 # ---------------------------
+# Registros completos (acceso rápido por ID) solo de las rutas elegidas
+df_sel = cargar_filas("Rutas", [s.split(" | ")[0] for s in ids_seleccionados])
+if not df_sel.empty:
+    df_sel["Fecha"] = pd.to_datetime(df_sel["Fecha"]).dt.date
+
 moneda_default = None
 if ids_seleccionados:
     id_ruta_0 = ids_seleccionados[0].split(" | ")[0]
-    ruta_0 = df.loc[id_ruta_0]
+    ruta_0 = df_sel.loc[id_ruta_0]
     moneda_default = ruta_0.get("Moneda", "MXP")
 
 st.subheader("Moneda y Tipo de Cambio para la Cotización")
@@ -278,7 +274,7 @@ if st.button("Generar Cotización PDF"):
 
     for ruta_sel in ids_seleccionados:
         id_ruta = ruta_sel.split(" | ")[0]
-        ruta_data = df.loc[id_ruta]
+        ruta_data = df_sel.loc[id_ruta]
         tipo_ruta = ruta_data['Tipo']
         origen = ruta_data['Origen']
         destino = ruta_data['Destino']
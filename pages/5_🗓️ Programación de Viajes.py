@@ -2,7 +2,12 @@ import streamlit as st
 import pandas as pd
 import os
 from datetime import date, datetime
-from supabase import create_client
+from utils.cola_escritura import aviso_cola_escritura, escribir, notificar, obtener_cola
+from utils.lote_escritura import LoteEscritura, notificar_lote
+from utils.costos import COLUMNAS_DERIVADAS, calcular_tramo, normalizar_puntualidad, totales_viaje
+from utils.repositorio import COLUMNA_MODIFICACION
+from utils.consultas import ConsultasRerun
+from utils.datos import aviso_datos_desactualizados, cargar_tabla, columnas_tabla, leer_filtrado
 import numpy as np
 import json
 
@@ -16,30 +21,50 @@ if rol not in ["admin", "gerente", "ejecutivo"]:
     st.error("🚫 No tienes permiso para acceder a este módulo.")
     st.stop()
 
-# Conexión a Supabase
-url = st.secrets["SUPABASE_URL"]
-key = st.secrets["SUPABASE_KEY"]
-supabase = create_client(url, key)
+# Memo de consultas de este rerun (evita repetir la misma lectura de Traficos/Rutas)
+consultas = ConsultasRerun()
 
 RUTA_PROG = "viajes_programados.csv"
 
 st.title("🛣️ Programación de Viajes Detallada")
 
-def safe(x): return 0 if pd.isna(x) or x is None else x
-
 def cargar_rutas():
-    respuesta = supabase.table("Rutas").select("*").execute()
-    if not respuesta.data:
-        st.error("❌ No se encontraron rutas en Supabase.")
-        st.stop()
-    df = pd.DataFrame(respuesta.data)
-    df["Ingreso Total"] = pd.to_numeric(df["Ingreso Total"], errors="coerce").fillna(0)
-    df["Costo_Total_Ruta"] = pd.to_numeric(df["Costo_Total_Ruta"], errors="coerce").fillna(0)
+    df = cargar_tabla("Rutas")
+    if df.empty:
+        return df
+    # Rutas Team legadas: Puntualidad por operador, como la captura actual
+    df = normalizar_puntualidad(df)
     df["Utilidad"] = df["Ingreso Total"] - df["Costo_Total_Ruta"]
     df["% Utilidad"] = (df["Utilidad"] / df["Ingreso Total"] * 100).round(2)
     df["Ruta"] = df["Origen"] + " → " + df["Destino"]
     return df
 
+def cargar_programaciones_pendientes():
+    """
+    IDA cuyo tráfico no tiene VUELTA/VACIO cerrado. Los filtros se resuelven en
+    Supabase: solo viajan los IDA y los números de tráfico ya cerrados.
+    """
+    df = leer_filtrado("Traficos", filtros=[("like", "ID_Programacion", "%_IDA%")])
+    if df.empty:
+        return pd.DataFrame()
+
+    # Detectar tráficos que ya tienen VUELTA o VACIO cerrados
+    cerrados = leer_filtrado("Traficos", ["Número_Trafico", "ID_Programacion"], [
+        ("not_is", "Fecha_Cierre", "null"),
+        ("or", None, "ID_Programacion.like.*_VUELTA*,ID_Programacion.like.*_VACIO*"),
+    ])
+    traficos_cerrados = []
+    if not cerrados.empty:
+        # En LIKE "_" es comodín; aquí se confirma el sufijo exacto
+        cerrados = cerrados[cerrados["ID_Programacion"].str.contains("_VUELTA|_VACIO")]
+        traficos_cerrados = cerrados["Número_Trafico"].unique()
+
+    # Mostrar solo los IDA que no tienen tráfico cerrado asociado
+    pendientes = df[~df["Número_Trafico"].isin(traficos_cerrados)]
+    pendientes = pendientes[pendientes["ID_Programacion"].str.contains("_IDA")]
+
+    return pendientes
+
 def limpiar_tramo_para_insert(tramo: dict) -> dict:
     """
     Limpia campos no válidos para inserción en Supabase desde un tramo.
@@ -74,9 +99,14 @@ def limpiar_fila_json(fila: dict) -> dict:
                 limpio[k] = str(v)
     return limpio
 
-def guardar_programacion(nuevo_registro):
-    columnas_base_data = supabase.table("Traficos").select("*").limit(1).execute().data
-    columnas_base = columnas_base_data[0].keys() if columnas_base_data else nuevo_registro.columns
+def guardar_programacion(nuevo_registro, actualizar_existentes=False):
+    """
+    Un solo upsert por ID_Programacion. Los tráficos ya registrados se dejan igual
+    (o se reemplazan con actualizar_existentes). Devuelve el ResultadoLote con
+    guardadas / omitidas por ID.
+    """
+    # updated_at lo pone la base; no se manda en blanco
+    columnas_base = [c for c in columnas_tabla("Traficos") if c != COLUMNA_MODIFICACION]
 
     # Asegura que sea DataFrame
     if isinstance(nuevo_registro, dict):
@@ -84,17 +114,39 @@ def guardar_programacion(nuevo_registro):
     elif isinstance(nuevo_registro, pd.Series):
         nuevo_registro = pd.DataFrame([nuevo_registro.to_dict()])
 
-    nuevo_registro = nuevo_registro.reindex(columns=columnas_base, fill_value=None)
+    nuevo_registro = nuevo_registro.reindex(columns=columnas_base or nuevo_registro.columns, fill_value=None)
 
 
-    registros = nuevo_registro.to_dict(orient="records")
-    for fila in registros:
-        id_programacion = fila.get("ID_Programacion")
-        existe = supabase.table("Traficos").select("ID_Programacion").eq("ID_Programacion", id_programacion).execute()
-        if not existe.data:
-            supabase.table("Traficos").insert(limpiar_fila_json(fila)).execute()
-        else:
-            st.warning(f"⚠️ El tráfico con ID {id_programacion} ya fue registrado previamente.")
+    registros = [limpiar_fila_json(fila) for fila in nuevo_registro.to_dict(orient="records")]
+    with LoteEscritura() as lote:
+        lote.upsert("Traficos", registros, ignorar_duplicados=not actualizar_existentes)
+    for id_programacion in lote.resultado.omitidas:
+        st.warning(f"⚠️ El tráfico con ID {id_programacion} ya fue registrado previamente.")
+    return lote.resultado
+
+def cerrar_trafico(ida, nuevos_tramos):
+    """
+    Todos los tramos de regreso en una sola petición (un INSERT en Postgres): se guardan
+    todos o ninguno. Los que ya existían se respetan, así que repetir el cierre no duplica
+    y completa uno que hubiera quedado a medias. Devuelve el resumen del viaje cerrado.
+    """
+    # Los tramos vienen de Rutas: solo viajan las columnas que existen en Traficos (sin ID_Ruta ni updated_at)
+    columnas = set(columnas_tabla("Traficos")) - {COLUMNA_MODIFICACION}
+    filas = [limpiar_fila_json(limpiar_tramo_para_insert(fila)) for fila in nuevos_tramos]
+    if columnas:
+        filas = [{k: v for k, v in fila.items() if k in columnas} for fila in filas]
+    # El mismo cierre repetido se encola una vez; otro juego de tramos del mismo tráfico es otro envío
+    tramos_id = ",".join(sorted(str(f.get("ID_Programacion")) for f in filas))
+    estado, _ = obtener_cola().escribir_detalle(
+        "Traficos", "insertar_nuevas", filas, llave=f"Traficos:cerrar:{ida['Número_Trafico']}:{tramos_id}"
+    )
+    tramos = [ida.to_dict() if isinstance(ida, pd.Series) else ida] + filas
+    return {
+        "estado": estado,
+        "Número_Trafico": ida["Número_Trafico"],
+        "tramos": [f"{t.get('ID_Programacion')} ({t.get('Tipo')})" for t in tramos],
+        **totales_viaje(pd.DataFrame(tramos)),
+    }
 
 RUTA_DATOS = "datos_generales.csv"
 
@@ -142,6 +194,15 @@ with st.expander("⚙️ Configurar Datos Generales"):
 # Asignar los valores actualizados para usar en cálculos
 valores = nuevos_valores if nuevos_valores else valores
 
+# Rutas y Traficos no dependen entre sí: se piden a la vez y quedan en el memo del rerun
+consultas.en_paralelo(
+    ("Rutas", cargar_rutas),
+    ("Traficos", cargar_programaciones_pendientes),
+    ("Traficos", cargar_tabla, "Traficos", ["ID_Programacion"]),
+)
+aviso_datos_desactualizados()
+aviso_cola_escritura()
+
 # =====================================
 # 1. REGISTRO DE TRÁFICO DESDE EXCEL
 # =====================================
@@ -201,8 +262,8 @@ if mostrar_registro:
     df_despacho["Tipo"] = df_despacho["Tipo"].str.upper()
     df_despacho["Moneda"] = df_despacho["Moneda"].str.upper()
 
-    registros_existentes = supabase.table("Traficos").select("ID_Programacion").execute().data
-    traficos_registrados = {r["ID_Programacion"] for r in registros_existentes}
+    registros_existentes = consultas.obtener("Traficos", cargar_tabla, "Traficos", ["ID_Programacion"])
+    traficos_registrados = set(registros_existentes["ID_Programacion"]) if not registros_existentes.empty else set()
 
     viajes_disponibles = df_despacho["Número_Trafico"].dropna().unique()
     viaje_sel = st.selectbox("Selecciona un número de tráfico del despacho", viajes_disponibles)
@@ -214,10 +275,7 @@ if mostrar_registro:
 
     precio_diesel_datos_generales = float(datos_dict.get("Costo Diesel", 24.0))
     moneda_valor = str(datos["Moneda"]).strip().upper() if pd.notna(datos["Moneda"]) else "MXP"
-    tipo_cambio = float(datos_dict.get("Tipo de cambio MXP", 1.0)) if moneda_valor == "MXP" else float(datos_dict.get("Tipo de cambio USD", 17.5))
     rendimiento_dg_tracto = float(datos_dict.get("Rendimiento Camion", 2.5))
-    rendimiento_dg_termo = float(datos_dict.get("Rendimiento Termo", 3.0))
-    bono_isr_base = float(datos_dict.get("Bono ISR IMSS", 462.66))
 
     with st.form("registro_trafico"):
         st.subheader("📝 Validar y completar datos")
@@ -240,7 +298,7 @@ if mostrar_registro:
             tipo = st.selectbox("Tipo", ["IMPORTACION", "EXPORTACION", "VACIO"],
                                 index=["IMPORTACION", "EXPORTACION", "VACIO"].index(tipo_valor)
                                 if tipo_valor in ["IMPORTACION", "EXPORTACION", "VACIO"] else 0)
-            km = st.number_input("KM", value=float(safe(datos["KM"])), min_value=0.0)
+            km = st.number_input("KM", value=float(datos["KM"]), min_value=0.0)
             modo_viaje = st.selectbox("Modo de Viaje", ["Operador", "Team"], index=0)
             operador = st.text_input("Operador", value=operador_valor)
             unidad = st.text_input("Unidad", value=unidad_valor)
@@ -250,104 +308,65 @@ if mostrar_registro:
             moneda = st.selectbox("Moneda", ["MXP", "USD"],
                                   index=["MXP", "USD"].index(moneda_valor)
                                   if moneda_valor in ["MXP", "USD"] else 0)
-            ingreso_original = st.number_input("Ingreso Original", value=float(safe(datos["Ingreso_Original"])))
+            ingreso_original = st.number_input("Ingreso Original", value=float(datos["Ingreso_Original"]))
             moneda_cruce = st.selectbox("Moneda Cruce", ["MXP", "USD"], index=0)
             cruce_original = st.number_input("Cruce Original", value=0.0)
             moneda_costo_cruce = st.selectbox("Moneda Costo Cruce", ["MXP", "USD"], index=0)
             costo_cruce = st.number_input("Costo Cruce", value=0.0)
             casetas = st.number_input("Casetas", value=0.0)     
-            horas_termo = st.number_input("Horas Termo", value=float(safe(datos.get("Horas_Termo", 0))))
+            horas_termo = st.number_input("Horas Termo", value=float(datos["Horas_Termo"]))
             costo_diesel = st.number_input("Costo Diesel", value=float(precio_diesel_datos_generales), min_value=0.1)
-            mov_local = st.number_input("Movimiento Local", value=float(safe(datos.get("Movimiento_Local", 0))), min_value=0.0)
+            mov_local = st.number_input("Movimiento Local", value=float(datos["Movimiento_Local"]), min_value=0.0)
             
         with col3:
-            puntualidad = st.number_input("Puntualidad", value=float(safe(datos.get("Puntualidad", 0))), min_value=0.0)
-            pension = st.number_input("Pensión", value=float(safe(datos.get("Pension", 0))), min_value=0.0)
-            estancia = st.number_input("Estancia", value=float(safe(datos.get("Estancia", 0))), min_value=0.0)
-            pistas_extra = st.number_input("Pistas Extra", value=float(safe(datos.get("Pistas_Extra", 0))), min_value=0.0)
-            stop = st.number_input("Stop", value=float(safe(datos.get("Stop", 0))), min_value=0.0)
-            falso = st.number_input("Falso", value=float(safe(datos.get("Falso", 0))), min_value=0.0)
-            gatas = st.number_input("Gatas", value=float(safe(datos.get("Gatas", 0))), min_value=0.0)
-            accesorios = st.number_input("Accesorios", value=float(safe(datos.get("Accesorios", 0))), min_value=0.0)
-            guias = st.number_input("Guías", value=float(safe(datos.get("Guias", 0))), min_value=0.0)
+            puntualidad = st.number_input("Puntualidad", value=float(datos["Puntualidad"]), min_value=0.0)
+            pension = st.number_input("Pensión", value=float(datos["Pension"]), min_value=0.0)
+            estancia = st.number_input("Estancia", value=float(datos["Estancia"]), min_value=0.0)
+            pistas_extra = st.number_input("Pistas Extra", value=float(datos["Pistas_Extra"]), min_value=0.0)
+            stop = st.number_input("Stop", value=float(datos["Stop"]), min_value=0.0)
+            falso = st.number_input("Falso", value=float(datos["Falso"]), min_value=0.0)
+            gatas = st.number_input("Gatas", value=float(datos["Gatas"]), min_value=0.0)
+            accesorios = st.number_input("Accesorios", value=float(datos["Accesorios"]), min_value=0.0)
+            guias = st.number_input("Guías", value=float(datos["Guias"]), min_value=0.0)
             ingreso_cruce_incluido = st.checkbox("✅ ¿El ingreso de cruce ya está incluido en la tarifa?", value=False)
             extras_cobrados = st.checkbox("✅ ¿Costos extras se incluiran al ingreso?", value=bool(datos.get("Extras_Cobrados", False)))
 
-        # Extras
-        extras = sum([
-            safe(datos.get("Movimiento_Local", 0)),
-            safe(datos.get("Pension", 0)),
-            safe(datos.get("Estancia", 0)),
-            safe(datos.get("Pistas_Extra", 0)),
-            safe(datos.get("Stop", 0)),
-            safe(datos.get("Falso", 0)),
-            safe(datos.get("Gatas", 0)),
-            safe(datos.get("Accesorios", 0)),
-            safe(datos.get("Guias", 0))
-        ])
-
-        # Cálculos antes de guardar
-        diesel_camion = (km / rendimiento) * costo_diesel
-        diesel_termo = horas_termo * rendimiento_dg_termo * costo_diesel
-
-        # Como costo (aunque no se cobra al cliente)
-        puntualidad = safe(datos.get("Puntualidad", 0))
-        casetas = safe(datos.get("Casetas", 0))
-
-        # Tipo de cambio correcto
-        tipo_cambio = float(datos_dict.get("Tipo de cambio MXP", 1.0)) if moneda == "MXP" else float(datos_dict.get("Tipo de cambio USD", 17.5))
-
-        # Calcula ingreso cruce y costo cruce convertido
-        ingreso_cruce = cruce_original * (tipo_cambio if moneda_cruce == "USD" else 1)
-        costo_cruce_convertido = costo_cruce * (tipo_cambio if moneda_costo_cruce == "USD" else 1)
-
-        # Sueldo y tarifa por KM según tipo de ruta
-        if tipo == "VACIO":
-            tarifa_por_km = 0
-            sueldo = valores["Pago fijo VACIO"]
-        elif tipo == "IMPORTACION":
-            tarifa_por_km = valores["Pago x km IMPORTACION"]
-            sueldo = km * tarifa_por_km
-        elif tipo == "EXPORTACION":
-            tarifa_por_km = valores["Pago x km EXPORTACION"]
-            sueldo = km * tarifa_por_km
-        else:
-            tarifa_por_km = 0
-            sueldo = 0
-
-        # Si es modo Team, sueldo doble
-        if modo_viaje == "Team":
-            sueldo *= 2
-
-        # Bono ISR (solo IMPO o EXPO)
-        bono_isr = valores["Bono ISR IMSS"] if tipo in ["IMPORTACION", "EXPORTACION"] else 0
-        if modo_viaje == "Team":
-            bono_isr *= 2
-
-        # Ingreso total = flete + cruce (+ extras si aplica)
-        ingreso_flete = ingreso_original * tipo_cambio
-        ingreso_total = ingreso_flete + ingreso_cruce
-        if extras_cobrados:
-            ingreso_total += extras
-
-
-        # Costos
-        costo_total = sueldo + bono_isr + diesel_camion + diesel_termo + extras + puntualidad + casetas + costo_cruce_convertido
-        costos_indirectos = ingreso_total * 0.35
-        utilidad_bruta = ingreso_total - costo_total
-        utilidad_neta = utilidad_bruta - costos_indirectos
-        
+        # Mismo motor de costos que Rutas; rendimiento y diésel del formulario mandan sobre Datos Generales
+        tramo = {
+            "Tipo": tipo, "Modo de Viaje": modo_viaje, "KM": km,
+            "Moneda": moneda, "Ingreso_Original": ingreso_original,
+            "Moneda_Cruce": moneda_cruce, "Cruce_Original": cruce_original,
+            "Moneda Costo Cruce": moneda_costo_cruce, "Costo Cruce": costo_cruce,
+            "Casetas": casetas, "Horas_Termo": horas_termo, "Movimiento_Local": mov_local,
+            "Puntualidad": puntualidad, "Pension": pension, "Estancia": estancia,
+            "Pistas_Extra": pistas_extra, "Stop": stop, "Falso": falso,
+            "Gatas": gatas, "Accesorios": accesorios, "Guias": guias,
+            "Extras_Cobrados": extras_cobrados,
+        }
+        r = calcular_tramo(tramo, {**valores, "Rendimiento Camion": rendimiento, "Costo Diesel": costo_diesel})
+        ingreso_total = r["Ingreso Total"]
+        diesel_camion = r["Costo_Diesel_Camion"]
+        diesel_termo = r["Costo_Diesel_Termo"]
+        sueldo = r["Sueldo_Operador"]
+        costo_total = r["Costo_Total_Ruta"]
+        utilidad_bruta = r["Utilidad_Bruta"]
+
         if st.form_submit_button("🔍 Revisar cálculos del tráfico"):
                 st.markdown(f"💰 **Ingreso Total:** ${ingreso_total:,.2f}")
                 st.markdown(f"⛽ **Diésel Camión:** ${diesel_camion:,.2f}")
                 st.markdown(f"⛽ **Diésel Termo:** ${diesel_termo:,.2f}")
                 st.markdown(f"👷🏽‍♂️ **Sueldo:** ${sueldo:,.2f}")
                 st.markdown(f"🧮 **Costo Total Ruta:** ${costo_total:,.2f}")
-                st.markdown(f"📈 **Utilidad Bruta:** ${utilidad_bruta:,.2f} ({(utilidad_bruta / ingreso_total * 100):.2f}%)")
+                st.markdown(f"📈 **Utilidad Bruta:** ${utilidad_bruta:,.2f} ({r['% Utilidad Bruta']:.2f}%)")
 
+        reemplazar = st.checkbox(
+            "♻️ Reemplazar el tráfico si ya estaba registrado",
+            value=False,
+            help="Sin marcar, un tráfico ya registrado se deja como está.",
+        )
         if st.form_submit_button("📅 Registrar tráfico desde despacho"):
             id_programacion = f"{viaje_sel}_IDA"
-            if id_programacion in traficos_registrados:
+            if id_programacion in traficos_registrados and not reemplazar:
                 st.warning("⚠️ Este tráfico ya fue registrado previamente.")
             else:
                 fila = {
@@ -357,81 +376,43 @@ if mostrar_registro:
                     "Cliente": cliente,
                     "Origen": origen,
                     "Destino": destino,
-                    "Tipo": tipo,
                     "Unidad": unidad,
                     "Operador": operador,
-                    "Moneda": moneda,
-                    "Ingreso_Original": ingreso_original,
+                    **tramo,
                     "Ingreso Total": ingreso_total,
-                    "Ingreso Flete": ingreso_original * tipo_cambio,
-                    "Pago por KM": tarifa_por_km,
-                    "% Utilidad": float(utilidad_bruta / ingreso_total * 100) if ingreso_total else 0,
-                    "KM": km,
+                    "Ingreso Flete": r["Ingreso Flete"],
+                    "Pago por KM": r["Pago por KM"],
+                    "% Utilidad": r["% Utilidad Bruta"],
                     "Costo Diesel": costo_diesel,
                     "Costo_Diesel_Camion": diesel_camion,
-                    "Horas_Termo": horas_termo,
                     "Costo_Diesel_Termo": diesel_termo,
-                    "Movimiento_Local": safe(datos.get("Movimiento_Local", 0)),
-                    "Puntualidad": safe(datos.get("Puntualidad", 0)),
-                    "Pension": safe(datos.get("Pension", 0)),
-                    "Estancia": safe(datos.get("Estancia", 0)),
-                    "Pistas_Extra": safe(datos.get("Pistas_Extra", 0)),
-                    "Stop": safe(datos.get("Stop", 0)),
-                    "Falso": safe(datos.get("Falso", 0)),
-                    "Gatas": safe(datos.get("Gatas", 0)),
-                    "Accesorios": safe(datos.get("Accesorios", 0)),
-                    "Guias": safe(datos.get("Guias", 0)),
-                    "Costo_Extras": extras,
-                    "Casetas": casetas,
+                    "Costo_Extras": r["Costo_Extras"],
                     "Sueldo_Operador": sueldo,
-                    "Bono_ISR_IMSS": bono_isr,
+                    "Bono_ISR_IMSS": r["Bono"],
                     "Costo_Total_Ruta": costo_total,
-                    "Costos_Indirectos": costos_indirectos,
+                    "Costos_Indirectos": r["Costos_Indirectos"],
                     "Utilidad_Bruta": utilidad_bruta,
-                    "Utilidad_Neta": utilidad_neta,
+                    "Utilidad_Neta": r["Utilidad_Neta"],
                     "Rendimiento Camion": rendimiento,
-                    "Rendimiento Termo": rendimiento_dg_termo,
-                    "Tipo de cambio": tipo_cambio,
+                    "Rendimiento Termo": r["Rendimiento Termo"],
+                    "Tipo de cambio": r["Tipo de cambio"],
                     "Tramo": "IDA",
-                    "Modo de Viaje": "Operador",
-                    "Extras_Cobrados": extras_cobrados,
                     "Ingreso_Cruce_Incluido": ingreso_cruce_incluido,
-                    "Moneda_Cruce": moneda_cruce,
-                    "Cruce_Original": cruce_original,
-                    "Ingreso Cruce": ingreso_cruce,
-                    "Moneda Costo Cruce": moneda_costo_cruce,
-                    "Costo Cruce": costo_cruce,
-                    "Costo Cruce Convertido": costo_cruce_convertido,
-                    "Casetas": casetas,
+                    "Ingreso Cruce": r["Ingreso Cruce"],
+                    "Costo Cruce Convertido": r["Costo Cruce Convertido"],
                 }
-                
-                debug_fila = limpiar_fila_json(fila)
 
-                import traceback
-                try:
-                    supabase.table("Traficos").insert([debug_fila]).execute()
-                    st.success("✅ Tráfico registrado exitosamente.")
-                except Exception as e:
-                    st.error(f"❌ Error al guardar tráfico: {e}")
-                    st.code(traceback.format_exc())
-                    st.stop()
+                # Upsert por ID_Programacion: si otra sesión ya lo registró, el reporte lo marca como omitido
+                resultado = guardar_programacion(fila, actualizar_existentes=reemplazar)
+                notificar_lote(resultado, "✅ Tráfico registrado exitosamente.")
 
 # =====================================
 # 2. CONSULTA, EDICIÓN Y ELIMINACIÓN DE TRÁFICOS ABIERTOS
 # =====================================
 st.title("🔍 Consulta, Edición y Eliminación de Tráficos")
 
-traficos = supabase.table("Traficos").select("*").execute()
-df_traficos = pd.DataFrame(traficos.data)
-
-if not df_traficos.empty:
-    # Excluir tráficos que ya tienen VUELTA o VACIO cerrados
-    cerrados = df_traficos[df_traficos["Fecha_Cierre"].notna() & df_traficos["ID_Programacion"].str.contains("_VUELTA|_VACIO")]
-    traficos_cerrados = cerrados["Número_Trafico"].unique()
-
-    # Mantener solo los IDA que no tengan VUELTA o VACIO cerrados
-    df_traficos = df_traficos[~df_traficos["Número_Trafico"].isin(traficos_cerrados)]
-    df_traficos = df_traficos[df_traficos["ID_Programacion"].str.contains("_IDA")]
+# Solo IDA que no tengan VUELTA o VACIO cerrados
+df_traficos = consultas.obtener("Traficos", cargar_programaciones_pendientes)
 
 if df_traficos.empty:
     st.warning("No hay programaciones registradas.")
@@ -444,8 +425,8 @@ else:
     st.dataframe(pd.DataFrame([seleccionado]))
 
     if st.button("🗑️ Eliminar tráfico completo"):
-        supabase.table("Traficos").delete().eq("ID_Programacion", seleccion).execute()
-        st.success("✅ Tráfico eliminado exitosamente.")
+        estado = escribir("Traficos", "eliminar", filtros=[("eq", "ID_Programacion", seleccion)])
+        notificar(estado, "✅ Tráfico eliminado exitosamente.")
         st.rerun()
 
     if cerrado:
@@ -492,51 +473,31 @@ else:
                 ingreso_cruce_incluido = st.checkbox("✅ ¿El ingreso de cruce ya está incluido en la tarifa?", value=False)
                 extras_cobrados = st.checkbox("✅ ¿Costos extras se incluiran al ingreso?", value=bool(seleccionado.get("Extras_Cobrados", False)))
 
-            # Recalcular (usando datos_generales)
-            tarifa_impo = valores["Pago x km IMPORTACION"]
-            tarifa_expo = valores["Pago x km EXPORTACION"]
-            bono_isr_valor = valores["Bono ISR IMSS"]
-            pago_fijo_vacio = valores["Pago fijo VACIO"]
-            tipo_cambio = 1 if moneda == "MXP" else float(st.session_state.get("tipo_cambio_usd", 17.0))
-
-            if tipo == "VACIO":
-                tarifa_por_km = 0
-                sueldo = pago_fijo_vacio
-            elif tipo == "IMPORTACION":
-                tarifa_por_km = tarifa_impo
-                sueldo = km * tarifa_por_km
-            elif tipo == "EXPORTACION":
-                tarifa_por_km = tarifa_expo
-                sueldo = km * tarifa_por_km
-            else:
-                tarifa_por_km = 0
-                sueldo = 0
-
-            if modo == "Team":
-                sueldo *= 2
-
-            ingreso_flete = ingreso_original * tipo_cambio
-            ingreso_cruce = cruce_original * tipo_cambio
-            costo_cruce_convertido = costo_cruce * tipo_cambio
-            rendimiento = float(seleccionado.get("Rendimiento Camion", valores["Rendimiento Camion"]))
-            costo_diesel = float(seleccionado.get("Costo Diesel", valores["Costo Diesel"]))
-            diesel_camion = round((km / rendimiento) * costo_diesel, 2)
-            rendimiento_termo = float(seleccionado.get("Rendimiento Termo", valores["Rendimiento Termo"]))
-            diesel_termo = round(horas_termo * rendimiento_termo * costo_diesel, 2)
-
-            bono_isr = bono_isr_valor if tipo in ["IMPORTACION", "EXPORTACION"] else 0
-            if modo == "Team":
-                bono_isr *= 2
-
-            extras = sum([mov_local, pension, estancia, pistas_extra, stop, falso, gatas, accesorios, guias])
-
-            ingreso_total = ingreso_flete + ingreso_cruce
-            if extras_cobrados:
-                ingreso_total += extras
-            costo_total = sueldo + bono_isr + diesel_camion + diesel_termo + extras + puntualidad + casetas + costo_cruce_convertido
-            costos_indirectos = ingreso_total * 0.35
-            utilidad_bruta = ingreso_total - costo_total
-            utilidad_neta = utilidad_bruta - costos_indirectos
+            # Recalcular con el motor de costos (Datos Generales, conservando diésel y rendimientos del tráfico)
+            rendimiento = float(seleccionado.get("Rendimiento Camion") or valores["Rendimiento Camion"])
+            costo_diesel = float(seleccionado.get("Costo Diesel") or valores["Costo Diesel"])
+            rendimiento_termo = float(seleccionado.get("Rendimiento Termo") or valores["Rendimiento Termo"])
+            tramo = {
+                "Tipo": tipo, "Modo de Viaje": modo, "KM": km,
+                "Moneda": moneda, "Ingreso_Original": ingreso_original,
+                "Moneda_Cruce": moneda_cruce, "Cruce_Original": cruce_original,
+                "Moneda Costo Cruce": moneda_costo_cruce, "Costo Cruce": costo_cruce,
+                "Casetas": casetas, "Horas_Termo": horas_termo, "Movimiento_Local": mov_local,
+                "Puntualidad": puntualidad, "Pension": pension, "Estancia": estancia,
+                "Pistas_Extra": pistas_extra, "Stop": stop, "Falso": falso,
+                "Gatas": gatas, "Accesorios": accesorios, "Guias": guias,
+                "Extras_Cobrados": extras_cobrados,
+            }
+            r = calcular_tramo(tramo, {
+                **valores, "Rendimiento Camion": rendimiento, "Costo Diesel": costo_diesel,
+                "Rendimiento Termo": rendimiento_termo,
+            })
+            ingreso_total = r["Ingreso Total"]
+            diesel_camion = r["Costo_Diesel_Camion"]
+            diesel_termo = r["Costo_Diesel_Termo"]
+            sueldo = r["Sueldo_Operador"]
+            costo_total = r["Costo_Total_Ruta"]
+            utilidad_bruta = r["Utilidad_Bruta"]
 
             if st.button("🔍 Revisar cálculos del tráfico"):
                 st.markdown(f"💰 **Ingreso Total:** ${ingreso_total:,.2f}")
@@ -544,61 +505,40 @@ else:
                 st.markdown(f"⛽ **Diésel Termo:** ${diesel_termo:,.2f}")
                 st.markdown(f"👷🏽‍♂️ **Sueldo:** ${sueldo:,.2f}")
                 st.markdown(f"🧮 **Costo Total Ruta:** ${costo_total:,.2f}")
-                st.markdown(f"📈 **Utilidad Bruta:** ${utilidad_bruta:,.2f} ({(utilidad_bruta / ingreso_total * 100):.2f}%)")
+                st.markdown(f"📈 **Utilidad Bruta:** ${utilidad_bruta:,.2f} ({r['% Utilidad Bruta']:.2f}%)")
 
 
             if st.button("💾 Guardar cambios"):
                 try:
-                    supabase.table("Traficos").update({
+                    estado = escribir("Traficos", "actualizar", {
                         "Cliente": cliente,
                         "Origen": origen,
                         "Destino": destino,
-                        "Tipo": tipo,
-                        "Modo de Viaje": modo,
-                        "Moneda": moneda,
-                        "Ingreso_Original": ingreso_original,
+                        **tramo,
                         "Ingreso Total": ingreso_total,
-                        "Ingreso Flete": ingreso_flete,
-                        "Pago por KM": tarifa_impo if tipo == "IMPORTACION" else tarifa_expo if tipo == "EXPORTACION" else 0,
-                        "% Utilidad": round((utilidad_bruta / ingreso_total * 100), 2) if ingreso_total else 0,
-                        "KM": km,
-                        "Horas_Termo": horas_termo,
-                        "Movimiento_Local": mov_local,
-                        "Puntualidad": puntualidad,
-                        "Pension": pension,
-                        "Estancia": estancia,
-                        "Pistas_Extra": pistas_extra,
-                        "Stop": stop,
-                        "Falso": falso,
-                        "Gatas": gatas,
-                        "Accesorios": accesorios,
-                        "Guias": guias,
+                        "Ingreso Flete": r["Ingreso Flete"],
+                        "Pago por KM": r["Pago por KM"],
+                        "% Utilidad": round(r["% Utilidad Bruta"], 2),
                         "Sueldo_Operador": sueldo,
                         "Costo_Diesel_Camion": diesel_camion,
                         "Costo_Diesel_Termo": diesel_termo,
-                        "Costo_Extras": extras,
-                        "Casetas": casetas,
+                        "Costo_Extras": r["Costo_Extras"],
                         "Costo_Total_Ruta": costo_total,
-                        "Bono_ISR_IMSS": bono_isr,
-                        "Costos_Indirectos": costos_indirectos,
+                        "Bono_ISR_IMSS": r["Bono"],
+                        "Costos_Indirectos": r["Costos_Indirectos"],
                         "Utilidad_Bruta": utilidad_bruta,
-                        "Utilidad_Neta": utilidad_neta,
+                        "Utilidad_Neta": r["Utilidad_Neta"],
                         "Rendimiento Camion": rendimiento,
                         "Rendimiento Termo": rendimiento_termo,
                         "Costo Diesel": costo_diesel,
-                        "Tipo de cambio": tipo_cambio,
-                        "Extras_Cobrados": extras_cobrados,
+                        "Tipo de cambio": r["Tipo de cambio"],
                         "Ingreso_Cruce_Incluido": ingreso_cruce_incluido,
-                        "Moneda_Cruce": moneda_cruce,
-                        "Cruce_Original": cruce_original,
-                        "Tipo cambio Cruce": tipo_cambio,
-                        "Ingreso Cruce": ingreso_cruce,
-                        "Moneda Costo Cruce": moneda_costo_cruce,
-                        "Costo Cruce": costo_cruce,
-                        "Costo Cruce Convertido": costo_cruce_convertido,
-                    }).eq("ID_Programacion", seleccionado["ID_Programacion"]).execute()
-
-                    st.success("✅ Tráfico actualizado correctamente.")
+                        "Tipo cambio Cruce": r["Tipo cambio Cruce"],
+                        "Ingreso Cruce": r["Ingreso Cruce"],
+                        "Costo Cruce Convertido": r["Costo Cruce Convertido"],
+                    }, [("eq", "ID_Programacion", seleccionado["ID_Programacion"])])
+
+                    notificar(estado, "✅ Tráfico actualizado correctamente.")
                 except Exception as e:
                     import traceback
                     st.error(f"❌ Error al guardar cambios: {e}")
@@ -611,24 +551,20 @@ else:
 st.markdown("---")
 st.title("🔁 Completar y Simular Tráfico Detallado")
 
-def cargar_programaciones_pendientes():
-    data = supabase.table("Traficos").select("*").execute()
-    df = pd.DataFrame(data.data)
-    if df.empty:
-        return pd.DataFrame()
-
-    # Detectar tráficos que ya tienen VUELTA o VACIO cerrados
-    cerrados = df[df["Fecha_Cierre"].notna() & df["ID_Programacion"].str.contains("_VUELTA|_VACIO")]
-    traficos_cerrados = cerrados["Número_Trafico"].unique()
-
-    # Mostrar solo los IDA que no tienen tráfico cerrado asociado
-    pendientes = df[~df["Número_Trafico"].isin(traficos_cerrados)]
-    pendientes = pendientes[pendientes["ID_Programacion"].str.contains("_IDA")]
-
-    return pendientes
-
-df_prog = cargar_programaciones_pendientes()
-df_rutas = cargar_rutas()
+cerrado = st.session_state.pop("trafico_cerrado", None)
+if cerrado:
+    notificar(cerrado["estado"], f"✅ Tráfico {cerrado['Número_Trafico']} cerrado correctamente.")
+    st.write("Tramos: " + ", ".join(cerrado["tramos"]))
+    st.write(
+        f"**Ingreso:** ${cerrado['ingreso']:,.2f} | **Costo:** ${cerrado['costo']:,.2f} | "
+        f"**Utilidad Bruta:** ${cerrado['utilidad_bruta']:,.2f} | **Utilidad Neta:** ${cerrado['utilidad_neta']:,.2f}"
+    )
+
+df_prog = consultas.obtener("Traficos", cargar_programaciones_pendientes)
+df_rutas = consultas.obtener("Rutas", cargar_rutas)
+if df_rutas.empty:
+    st.error("❌ No se encontraron rutas en Supabase.")
+    st.stop()
 
 if df_prog.empty:
     st.info("ℹ️ No hay tráficos pendientes por completar.")
@@ -637,7 +573,6 @@ else:
     ida = df_prog[df_prog["ID_Programacion"] == id_sel].iloc[0]
     destino_ida = ida["Destino"]
     tipo_ida = ida["Tipo"]
-    tipo_cambio = ida["Tipo de cambio"]
     extras_cobrados = ida.get("Extras_Cobrados", False)
     ingreso_cruce_incluido = ida.get("Ingreso_Cruce_Incluido", False)
 
@@ -647,8 +582,8 @@ else:
 
     directas = df_rutas[(df_rutas["Tipo"] == tipo_regreso) & (df_rutas["Origen"] == destino_ida)].copy()
     for _, row in directas.iterrows():
-        ingreso_total = safe(ida["Ingreso Total"]) + safe(row["Ingreso Total"])
-        costo_total = safe(ida["Costo_Total_Ruta"]) + safe(row["Costo_Total_Ruta"])
+        ingreso_total = ida["Ingreso Total"] + row["Ingreso Total"]
+        costo_total = ida["Costo_Total_Ruta"] + row["Costo_Total_Ruta"]
         utilidad = ingreso_total - costo_total
         porcentaje = (utilidad / ingreso_total * 100) if ingreso_total else 0
         sugerencias.append({
@@ -663,8 +598,8 @@ else:
         origen_post = vacio["Destino"]
         candidatos = df_rutas[(df_rutas["Tipo"] == tipo_regreso) & (df_rutas["Origen"] == origen_post)].copy()
         for _, final in candidatos.iterrows():
-            ingreso_total = safe(ida["Ingreso Total"]) + safe(final["Ingreso Total"])
-            costo_total = safe(ida["Costo_Total_Ruta"]) + safe(vacio["Costo_Total_Ruta"]) + safe(final["Costo_Total_Ruta"])
+            ingreso_total = ida["Ingreso Total"] + final["Ingreso Total"]
+            costo_total = ida["Costo_Total_Ruta"] + vacio["Costo_Total_Ruta"] + final["Costo_Total_Ruta"]
             utilidad = ingreso_total - costo_total
             porcentaje = (utilidad / ingreso_total * 100) if ingreso_total else 0
             descripcion = f"{final['Cliente']} (Vacío→{vacio['Origen']}→{vacio['Destino']})→{final['Destino']} ({porcentaje:.2f}%)"
@@ -695,11 +630,9 @@ else:
     for tramo in rutas:
         st.markdown(f"**{tramo['Tipo']}** | {tramo['Origen']} → {tramo['Destino']} | Cliente: {tramo.get('Cliente', 'Sin cliente')}")
 
-    ingreso = sum(safe(r["Ingreso Total"]) for r in rutas)
-    costo = sum(safe(r["Costo_Total_Ruta"]) for r in rutas)
-    utilidad_bruta = ingreso - costo
-    indirectos = ingreso * 0.35
-    utilidad_neta = utilidad_bruta - indirectos
+    totales = totales_viaje(pd.DataFrame([dict(t) for t in rutas]))
+    ingreso, costo = totales["ingreso"], totales["costo"]
+    utilidad_bruta, indirectos, utilidad_neta = totales["utilidad_bruta"], totales["indirectos"], totales["utilidad_neta"]
 
     st.header("📊 Ingresos y Utilidades")
     st.metric("Ingreso Total", f"${ingreso:,.2f}")
@@ -723,102 +656,23 @@ else:
             datos["Tramo"] = "VUELTA"
             datos["Fecha_Cierre"] = datetime.today().strftime("%Y-%m-%d")
 
-            tipo = datos.get("Tipo", "").upper()
-            modo = datos.get("Modo de Viaje", "Operador")
-            km = safe(datos.get("KM", 0))
-            horas_termo = safe(datos.get("Horas_Termo", 0))
-            casetas = safe(datos.get("Casetas", 0))
-            mov_local = safe(datos.get("Movimiento_Local", 0))
-            puntualidad = safe(datos.get("Puntualidad", 0))
-            pension = safe(datos.get("Pension", 0))
-            estancia = safe(datos.get("Estancia", 0))
-            pistas_extra = safe(datos.get("Pistas_Extra", 0))
-            stop = safe(datos.get("Stop", 0))
-            falso = safe(datos.get("Falso", 0))
-            gatas = safe(datos.get("Gatas", 0))
-            accesorios = safe(datos.get("Accesorios", 0))
-            guias = safe(datos.get("Guias", 0))
-
-            tarifa_por_km = 0
-            sueldo = 0
-            if tipo == "VACIO":
-                tarifa_por_km = 0
-                sueldo = valores["Pago fijo VACIO"]
-            elif tipo == "IMPORTACION":
-                tarifa_por_km = valores["Pago x km IMPORTACION"]
-                sueldo = km * tarifa_por_km
-            elif tipo == "EXPORTACION":
-                tarifa_por_km = valores["Pago x km EXPORTACION"]
-                sueldo = km * tarifa_por_km
-
-            if modo == "Team":
-                sueldo *= 2
-
-            bono = valores["Bono ISR IMSS"] if tipo in ["IMPORTACION", "EXPORTACION"] else 0
-            if modo == "Team":
-                bono *= 2
-
-            rendimiento = valores["Rendimiento Camion"]
-            diesel_precio = valores["Costo Diesel"]
-            diesel_camion = round((km / rendimiento) * diesel_precio, 2)
-            diesel_termo = round(horas_termo * valores["Rendimiento Termo"] * diesel_precio, 2)
-
-            ingreso_original = safe(datos.get("Ingreso_Original", 0))
-            cruce_original = safe(datos.get("Cruce_Original", 0))
-            costo_cruce = safe(datos.get("Costo Cruce", 0))
-
-            ingreso_flete = ingreso_original * tipo_cambio
-            ingreso_cruce = cruce_original * tipo_cambio
-            costo_cruce_convertido = costo_cruce * tipo_cambio
-
-            extras = sum([mov_local, pension, estancia, pistas_extra, stop, falso, gatas, accesorios, guias])
-
-            ingreso_total = ingreso_flete + ingreso_cruce
-            if extras_cobrados:
-                ingreso_total += extras
-
-            costo_total = sueldo + bono + diesel_camion + diesel_termo + extras + puntualidad + casetas + costo_cruce_convertido
-            costos_indirectos = ingreso_total * 0.35
-            utilidad_bruta = ingreso_total - costo_total
-            utilidad_neta = utilidad_bruta - costos_indirectos
-
+            # El tramo se recalcula con los Datos Generales de hoy; cobrar extras lo decide la IDA
+            datos["Extras_Cobrados"] = extras_cobrados
+            datos["Ingreso_Cruce_Incluido"] = ingreso_cruce_incluido
+            r = calcular_tramo(datos, valores)
+            datos.update({columna: r[columna] for columna in COLUMNAS_DERIVADAS if columna != "Bono"})
             datos.update({
-                "Pago por KM": tarifa_por_km,
-                "Bono_ISR_IMSS": bono,
-                "Costo_Diesel_Camion": diesel_camion,
-                "Costo_Diesel_Termo": diesel_termo,
-                "Costo_Total_Ruta": costo_total,
-                "Costos_Indirectos": costos_indirectos,
-                "Utilidad_Bruta": utilidad_bruta,
-                "Utilidad_Neta": utilidad_neta,
-                "Rendimiento Camion": rendimiento,
-                "Rendimiento Termo": valores["Rendimiento Termo"],
-                "Costo Diesel": valores["Costo Diesel"],
-                "Tipo de cambio": tipo_cambio,
-                "Ingreso_Original": ingreso_original,
-                "Ingreso Flete": ingreso_flete,
-                "Ingreso Cruce": ingreso_cruce,
-                "Moneda_Cruce": "USD",
-                "Cruce_Original": cruce_original,
-                "Costo Cruce Convertido": costo_cruce_convertido,
-                "Ingreso Total": ingreso_total,
-                "Costo_Extras": extras,
-                "Casetas": casetas,
-                "Extras_Cobrados": extras_cobrados,
-                "Ingreso_Cruce_Incluido": ingreso_cruce_incluido
+                "Bono_ISR_IMSS": r["Bono"],
+                "Costos_Indirectos": r["Costos_Indirectos"],
+                "Utilidad_Bruta": r["Utilidad_Bruta"],
+                "Utilidad_Neta": r["Utilidad_Neta"],
             })
 
             nuevos_tramos.append(datos)
 
-        for fila in nuevos_tramos:
-            fila_limpio = limpiar_fila_json(limpiar_tramo_para_insert(fila))
-            try:
-                supabase.table("Traficos").insert([fila_limpio]).execute()
-            except Exception as e:
-                import traceback
-                st.error(f"❌ Error al guardar tráfico: {e}")
-                st.code(traceback.format_exc())
-                st.stop()
-
-        st.success("✅ Tráfico cerrado correctamente.")
+        try:
+            st.session_state.trafico_cerrado = cerrar_trafico(ida, nuevos_tramos)
+        except Exception as e:
+            st.error(f"❌ No se cerró el tráfico (no se guardó ningún tramo): {e}")
+            st.stop()
         st.rerun()
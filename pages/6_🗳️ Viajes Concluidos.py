@@ -5,7 +5,7 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from supabase import create_client
+from utils.datos import aviso_datos_desactualizados, consultar, leer_filtrado
 
 # ✅ Verificación de sesión y rol
 if "usuario" not in st.session_state:
@@ -17,34 +17,47 @@ if rol not in ["admin", "gerente", "ejecutivo"]:
     st.error("🚫 No tienes permiso para acceder a este módulo.")
     st.stop()
 
-# 🔧 Conexión a Supabase
-url = st.secrets["SUPABASE_URL"]
-key = st.secrets["SUPABASE_KEY"]
-supabase = create_client(url, key)
-
 st.title("✅ Tráficos Concluidos con Filtro de Fechas")
 
-def cargar_programaciones():
-    data = supabase.table("Traficos").select("*").execute()
-    df = pd.DataFrame(data.data)
+def rango_fechas_cierre():
+    """Primera y última Fecha_Cierre, resueltas en el servidor con limit(1)."""
+    no_nulo = [("not_is", "Fecha_Cierre", "null")]
+    primera = consultar("Traficos", ["Fecha_Cierre"], no_nulo, orden="Fecha_Cierre", limite=1)
+    ultima = consultar("Traficos", ["Fecha_Cierre"], no_nulo, orden="Fecha_Cierre", desc=True, limite=1)
+    if primera.empty:
+        return pd.NaT, pd.NaT
+    return pd.to_datetime(primera["Fecha_Cierre"].iloc[0]), pd.to_datetime(ultima["Fecha_Cierre"].iloc[0])
+
+def cargar_programaciones(fecha_inicio, fecha_fin):
+    """Solo los tráficos con algún cierre en el rango, con todos sus tramos."""
+    cierres = leer_filtrado("Traficos", ["Número_Trafico"], [
+        ("gte", "Fecha_Cierre", fecha_inicio.isoformat()),
+        ("lte", "Fecha_Cierre", fecha_fin.isoformat()),
+    ])
+    if cierres.empty:
+        return pd.DataFrame()
+    numeros = sorted(cierres["Número_Trafico"].dropna().unique().tolist())
+    df = leer_filtrado("Traficos", filtros=[("in_", "Número_Trafico", numeros)])
     if df.empty:
         return pd.DataFrame()
-    df["Fecha_Cierre"] = pd.to_datetime(df["Fecha_Cierre"], errors="coerce")
     return df
 
-df = cargar_programaciones()
+fecha_min, fecha_max = rango_fechas_cierre()
+aviso_datos_desactualizados()
 
-if df.empty:
+if pd.isna(fecha_min):
     st.info("ℹ️ Aún no hay programaciones registradas.")
 else:
     st.subheader("📅 Filtro por Fecha (Fecha de Cierre de la VUELTA)")
-    fecha_min = df["Fecha_Cierre"].min()
-    fecha_max = df["Fecha_Cierre"].max()
     hoy = datetime.today().date()
 
     fecha_inicio = st.date_input("Fecha inicio", value=fecha_min.date() if pd.notna(fecha_min) else hoy)
     fecha_fin = st.date_input("Fecha fin", value=fecha_max.date() if pd.notna(fecha_max) else hoy)
 
+    df = cargar_programaciones(fecha_inicio, fecha_fin)
+    if df.empty:
+        df = pd.DataFrame(columns=["Número_Trafico", "Fecha_Cierre", "ID_Programacion"])
+
     cerrados = df[df["Fecha_Cierre"].notna()]
     traficos_cerrados = cerrados["Número_Trafico"].unique()
     df_filtrado = df[df["Número_Trafico"].isin(traficos_cerrados)].copy()
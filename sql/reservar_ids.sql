@@ -0,0 +1,48 @@
+-- sql/reservar_ids.sql
+-- Reserva atómica de bloques de IDs (utils/ids.py). Ejecutar una vez en el SQL editor de Supabase.
+
+create table if not exists secuencias (
+    nombre text primary key,
+    ultimo bigint not null
+);
+
+-- Arranca la secuencia de rutas después del ID_Ruta más alto ya capturado (IG000123 -> 123)
+insert into secuencias (nombre, ultimo)
+select 'Rutas', coalesce(max(substring("ID_Ruta" from 3)::bigint), 0)
+from "Rutas"
+where "ID_Ruta" ~ '^IG[0-9]+$'
+on conflict (nombre) do nothing;
+
+-- Devuelve el último número del bloque reservado: el bloque es (ultimo - p_cantidad, ultimo].
+-- El UPDATE toma el candado de la fila, así que dos procesos nunca reciben el mismo bloque.
+-- security definer: corre con los permisos del dueño, así la llave anon/authenticated
+-- no necesita UPDATE sobre secuencias (con RLS activo no lo tiene). search_path fijo
+-- para que nadie pueda suplantar la tabla con otra en un esquema propio.
+create or replace function reservar_ids(p_nombre text, p_cantidad int)
+returns bigint
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_ultimo bigint;
+begin
+    if p_cantidad < 1 then
+        raise exception 'p_cantidad debe ser positiva';
+    end if;
+    update public.secuencias set ultimo = ultimo + p_cantidad
+    where nombre = p_nombre
+    returning ultimo into v_ultimo;
+    if v_ultimo is null then
+        raise exception 'Secuencia % no existe', p_nombre;
+    end if;
+    return v_ultimo;
+end;
+$$;
+
+-- Sin acceso directo a la tabla. La función solo la ejecuta el rol de la app: la llave
+-- SUPABASE_KEY de secrets es la anon; si la app usa otro rol, cambiar el grant.
+alter table secuencias enable row level security;
+revoke all on table secuencias from anon, authenticated;
+revoke execute on function reservar_ids(text, int) from public, anon, authenticated;
+grant execute on function reservar_ids(text, int) to anon;
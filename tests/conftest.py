@@ -0,0 +1,61 @@
+# tests/conftest.py
+import os
+import sys
+
+import httpx
+import pytest
+
+# Las páginas y utils se importan desde la raíz del repo (como lo hace `streamlit run`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import cola_escritura  # noqa: E402
+from utils.cola_escritura import ColaEscritura  # noqa: E402
+from utils.repositorio import RepositorioSQLite  # noqa: E402
+
+
+class RepoIntermitente(RepositorioSQLite):
+    """SQLite en memoria que, con `caido`, falla las escrituras como una red cortada."""
+
+    def __init__(self):
+        super().__init__(":memory:")
+        self.caido = False
+        self.escrituras = 0
+
+    def _red(self):
+        self.escrituras += 1
+        if self.caido:
+            raise httpx.ConnectError("sin red")
+
+    def insertar(self, tabla, filas):
+        self._red()
+        return super().insertar(tabla, filas)
+
+    def upsertar(self, tabla, filas, ignorar_duplicados=False):
+        self._red()
+        return super().upsertar(tabla, filas, ignorar_duplicados)
+
+    def actualizar(self, tabla, valores, filtros):
+        self._red()
+        return super().actualizar(tabla, valores, filtros)
+
+    def eliminar(self, tabla, filtros):
+        self._red()
+        return super().eliminar(tabla, filtros)
+
+
+@pytest.fixture(autouse=True)
+def invalidaciones(monkeypatch):
+    """Las invalidaciones de caché se anotan en vez de tocar el registro del proceso."""
+    anotadas = []
+    monkeypatch.setattr(cola_escritura, "invalidar_tabla", lambda tabla, **kw: anotadas.append((tabla, kw)))
+    return anotadas
+
+
+@pytest.fixture
+def repo():
+    return RepoIntermitente()
+
+
+@pytest.fixture
+def cola(repo):
+    return ColaEscritura(repo, ":memory:")
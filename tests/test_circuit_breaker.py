@@ -0,0 +1,69 @@
+# tests/test_circuit_breaker.py
+import time
+
+import httpx
+import pytest
+
+from utils.circuit_breaker import ABIERTO, CERRADO, CircuitBreaker, CircuitoAbierto
+from utils.limitador import LimiteSaturado
+
+
+def error_http(codigo):
+    peticion = httpx.Request("GET", "https://backend.test/rest/v1/Rutas")
+    return httpx.HTTPStatusError(str(codigo), request=peticion, response=httpx.Response(codigo, request=peticion))
+
+
+def fallar(exc):
+    def fn():
+        raise exc
+    return fn
+
+
+def test_circuito_se_abre_tras_umbral_de_fallas_del_backend():
+    circuito = CircuitBreaker(sonda=lambda: None, umbral=3, espera=60)
+    for _ in range(3):
+        with pytest.raises(httpx.ConnectError):
+            circuito.llamar(fallar(httpx.ConnectError("sin red")))
+    assert circuito.estado == ABIERTO
+    assert circuito.aperturas == 1
+
+    llamadas = []
+    with pytest.raises(CircuitoAbierto):
+        circuito.llamar(lambda: llamadas.append(1))
+    assert llamadas == []  # abierto: ni se intenta
+
+
+@pytest.mark.parametrize("exc", [
+    ValueError("dato inválido"),
+    error_http(409),
+    error_http(429),
+    TimeoutError("plazo propio"),
+    LimiteSaturado("sin turno"),
+])
+def test_errores_que_no_son_del_backend_no_cuentan(exc):
+    circuito = CircuitBreaker(sonda=lambda: None, umbral=2, espera=60)
+    for _ in range(5):
+        with pytest.raises(type(exc)):
+            circuito.llamar(fallar(exc))
+    assert circuito.estado == CERRADO
+    assert circuito.fallas_seguidas == 0
+
+
+def test_una_respuesta_buena_reinicia_la_cuenta():
+    circuito = CircuitBreaker(sonda=lambda: None, umbral=3, espera=60)
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            circuito.llamar(fallar(error_http(503)))
+    assert circuito.llamar(lambda: "ok") == "ok"
+    assert circuito.fallas_seguidas == 0
+
+
+def test_la_sonda_vuelve_a_cerrar_el_circuito():
+    circuito = CircuitBreaker(sonda=lambda: None, umbral=1, espera=0.01)
+    with pytest.raises(httpx.ConnectError):
+        circuito.llamar(fallar(httpx.ConnectError("sin red")))
+    limite = time.monotonic() + 2
+    while circuito.abierto and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert circuito.estado == CERRADO
+    assert circuito.abierto_desde is None
@@ -0,0 +1,82 @@
+# tests/test_cola_escritura.py
+from utils.cola_escritura import APLICADA, ENCOLADA
+from utils.repositorio import RepositorioSQLite
+
+
+def rutas(repo):
+    return {f["ID_Ruta"]: f for f in repo.seleccionar("Rutas").data}
+
+
+def test_con_backend_sano_se_aplica_al_momento(repo, cola, invalidaciones):
+    assert cola.escribir("Rutas", "insertar", {"ID_Ruta": "IG000001", "KM": 10}) == APLICADA
+    assert list(rutas(repo)) == ["IG000001"]
+    assert invalidaciones == [("Rutas", {"claves": ["IG000001"]})]
+
+
+def test_sin_conexion_se_encola_y_se_reenvia_en_orden(repo, cola):
+    repo.caido = True
+    assert cola.escribir("Rutas", "insertar", {"ID_Ruta": "IG000001", "KM": 10}) == ENCOLADA
+    assert cola.escribir("Rutas", "actualizar", {"KM": 20}, [("eq", "ID_Ruta", "IG000001")]) == ENCOLADA
+    assert cola.pendientes("Rutas") == 2
+
+    repo.caido = False
+    # Con escrituras en cola, una nueva va detrás aunque el backend ya responda
+    assert cola.escribir("Rutas", "actualizar", {"KM": 30}, [("eq", "ID_Ruta", "IG000001")]) == ENCOLADA
+    assert cola.vaciar() == 3
+    assert cola.pendientes() == 0
+    assert rutas(repo)["IG000001"]["KM"] == 30
+
+
+def test_mismo_envio_no_se_encola_dos_veces(repo, cola):
+    repo.caido = True
+    cola.escribir("Rutas", "insertar", {"ID_Ruta": "IG000002"}, llave="captura-42")
+    cola.escribir("Rutas", "insertar", {"ID_Ruta": "IG000002"}, llave="captura-42")  # doble clic / rerun
+    assert cola.pendientes() == 1
+
+
+def test_sin_llave_cada_envio_se_encola_aunque_se_repita(repo, cola):
+    RepositorioSQLite.insertar(repo, "Rutas", {"ID_Ruta": "IG000001", "KM": 0})
+    repo.caido = True
+    filtro = [("eq", "ID_Ruta", "IG000001")]
+    for km in (1, 2, 1):
+        cola.escribir("Rutas", "actualizar", {"KM": km}, filtro)
+    assert cola.pendientes() == 3
+
+    repo.caido = False
+    assert cola.vaciar() == 3
+    assert rutas(repo)["IG000001"]["KM"] == 1
+
+
+def test_reenvio_de_insert_que_si_llego_completa_las_filas_faltantes(repo, cola):
+    repo.caido = True
+    cola.escribir("Rutas", "insertar", [{"ID_Ruta": "IG000001"}, {"ID_Ruta": "IG000002"}])
+    # El primer intento sí alcanzó a escribir una fila (timeout después de enviar)
+    repo.caido = False
+    RepositorioSQLite.insertar(repo, "Rutas", {"ID_Ruta": "IG000001", "KM": 99})
+
+    assert cola.vaciar() == 1
+    assert cola.fallidas() == []
+    assert rutas(repo)["IG000001"]["KM"] == 99
+    assert set(rutas(repo)) == {"IG000001", "IG000002"}
+
+
+def test_error_de_datos_en_reenvio_queda_fallida_sin_bloquear_la_cola(repo, cola):
+    repo.caido = True
+    cola.escribir("Rutas", "actualizar", {"KM": 1}, [])  # update sin filtros: el backend lo rechaza
+    cola.escribir("Rutas", "insertar", {"ID_Ruta": "IG000001"})
+
+    repo.caido = False
+    assert cola.vaciar() == 1
+    assert [f["operacion"] for f in cola.fallidas()] == ["actualizar"]
+    assert list(rutas(repo)) == ["IG000001"]
+
+
+def test_reenvio_se_detiene_si_el_backend_sigue_caido(repo, cola):
+    repo.caido = True
+    cola.escribir("Rutas", "insertar", {"ID_Ruta": "IG000001"})
+    cola.escribir("Rutas", "insertar", {"ID_Ruta": "IG000002"})
+    escrituras = repo.escrituras
+
+    assert cola.vaciar() == 0
+    assert repo.escrituras == escrituras + 1  # solo la primera, sin saltarse el orden
+    assert cola.pendientes() == 2
@@ -0,0 +1,118 @@
+# tests/test_costos.py
+import pandas as pd
+import pytest
+
+from utils.costos import (
+    AL_DIA, INCONSISTENTE, PARAMETROS_POR_DEFECTO, auditar_costos, calcular, normalizar_puntualidad,
+    puntualidad_legada,
+)
+
+VALORES = dict(PARAMETROS_POR_DEFECTO)
+
+
+def ruta_legada_team(puntualidad=300.0, pension=100.0, km=1000.0, casetas=50.0):
+    """Ruta Team como la guardaba Captura antes del motor: Puntualidad ya x factor, sumada una vez."""
+    factor = 2
+    puntualidad_val = puntualidad * factor
+    extras = puntualidad_val + pension
+    sueldo = km * VALORES["Pago x km IMPORTACION"] * factor
+    bono = VALORES["Bono ISR IMSS"] * factor
+    diesel_camion = km / VALORES["Rendimiento Camion"] * VALORES["Costo Diesel"]
+    return {
+        "ID_Ruta": "IG000001", "Cliente": "ACME", "Origen": "LAREDO", "Destino": "MONTERREY",
+        "Tipo": "IMPORTACION", "Modo de Viaje": "Team", "KM": km,
+        "Moneda": "MXP", "Ingreso_Original": 20000.0, "Moneda_Cruce": "MXP", "Moneda Costo Cruce": "MXP",
+        "Casetas": casetas, "Puntualidad": puntualidad_val, "Pension": pension,
+        "Ingreso Total": 20000.0, "Sueldo_Operador": sueldo, "Bono": bono, "Pago por KM": VALORES["Pago x km IMPORTACION"],
+        "Costo_Diesel_Camion": diesel_camion, "Costo_Extras": extras,
+        "Costo_Total_Ruta": diesel_camion + sueldo + bono + casetas + extras,
+        "Costo Diesel": VALORES["Costo Diesel"], "Rendimiento Camion": VALORES["Rendimiento Camion"],
+        "Rendimiento Termo": VALORES["Rendimiento Termo"],
+    }
+
+
+def test_ruta_legada_cuadra_con_su_costo_extras_guardado():
+    ruta = ruta_legada_team()
+    df = pd.DataFrame([ruta])
+
+    assert puntualidad_legada(df).tolist() == [True]
+    recalculada = calcular(df, VALORES).iloc[0]
+    assert recalculada["Costo_Extras"] == pytest.approx(ruta["Costo_Extras"])
+    assert recalculada["Costo_Total_Ruta"] == pytest.approx(ruta["Costo_Total_Ruta"])
+    assert auditar_costos(df, VALORES)["Estado"].tolist() == [AL_DIA]
+
+
+def test_normalizar_puntualidad_deja_la_fila_en_formato_actual():
+    df = normalizar_puntualidad(pd.DataFrame([ruta_legada_team(puntualidad=300.0)]))
+
+    assert df["Puntualidad"].tolist() == [300.0]
+    assert not puntualidad_legada(df).any()
+    assert calcular(df, VALORES).iloc[0]["Costo_Extras"] == pytest.approx(700.0)
+
+
+def test_ruta_team_actual_no_se_toma_por_legada():
+    ruta = ruta_legada_team()
+    # Formato actual: Puntualidad por operador, el motor la multiplica
+    ruta["Puntualidad"] = 300.0
+    assert not puntualidad_legada(pd.DataFrame([ruta])).any()
+
+
+def test_costo_extras_que_no_cuadra_es_inconsistente():
+    # Total al día pero Costo_Extras distinto: ningún juego de parámetros lo explica
+    ruta = ruta_legada_team()
+    ruta["Puntualidad"] = 300.0
+    ruta["Costo_Extras"] = 300.0 * 2 + 100.0 - 100.0
+
+    auditoria = auditar_costos(pd.DataFrame([ruta]), VALORES)
+    assert auditoria["Estado"].tolist() == [INCONSISTENTE]
+
+
+def ruta_baseline(tipo, modo, km=800.0, moneda="MXP", ingreso_flete=18000.0, moneda_cruce="MXP",
+                  ingreso_cruce=0.0, moneda_costo_cruce="MXP", costo_cruce=0.0, horas_termo=0.0,
+                  casetas=0.0, puntualidad=0.0, estancia=0.0, cobrados=False):
+    """Fila como la guardaba Captura con sus fórmulas escalares originales (antes del motor compartido)."""
+    v = VALORES
+    ingreso_total = ingreso_flete * v["Tipo de cambio USD"] if moneda == "USD" else ingreso_flete
+    ingreso_total += ingreso_cruce * v["Tipo de cambio USD"] if moneda_cruce == "USD" else ingreso_cruce
+    factor = 2 if modo == "Team" else 1
+    if tipo in ("IMPORTACION", "EXPORTACION"):
+        sueldo = km * v[f"Pago x km {tipo}"] * factor
+        bono = v["Bono ISR IMSS"] * factor
+    else:
+        sueldo = v["Pago fijo VACIO"] * factor
+        bono = 0.0
+    puntualidad_val = puntualidad * factor
+    extras = puntualidad_val + estancia
+    if cobrados:
+        ingreso_total += extras
+    costo_cruce_convertido = costo_cruce * (v["Tipo de cambio USD"] if moneda_costo_cruce == "USD" else 1)
+    diesel_camion = km / v["Rendimiento Camion"] * v["Costo Diesel"]
+    diesel_termo = horas_termo * v["Rendimiento Termo"] * v["Costo Diesel"]
+    return {
+        "ID_Ruta": "IG000002", "Cliente": "ACME", "Origen": "LAREDO", "Destino": "MONTERREY",
+        "Tipo": tipo, "Modo de Viaje": modo, "KM": km, "Moneda": moneda, "Ingreso_Original": ingreso_flete,
+        "Moneda_Cruce": moneda_cruce, "Cruce_Original": ingreso_cruce, "Moneda Costo Cruce": moneda_costo_cruce,
+        "Costo Cruce": costo_cruce, "Horas_Termo": horas_termo, "Casetas": casetas,
+        "Puntualidad": puntualidad_val, "Estancia": estancia, "Extras_Cobrados": cobrados,
+        "Ingreso Total": ingreso_total, "Sueldo_Operador": sueldo, "Bono": bono,
+        "Costo_Diesel_Camion": diesel_camion, "Costo_Diesel_Termo": diesel_termo,
+        "Costo Cruce Convertido": costo_cruce_convertido, "Costo_Extras": extras,
+        "Costo_Total_Ruta": diesel_camion + diesel_termo + sueldo + bono + casetas + extras + costo_cruce_convertido,
+    }
+
+
+@pytest.mark.parametrize("captura", [
+    dict(tipo="IMPORTACION", modo="Team", moneda="USD", ingreso_flete=1200.0, puntualidad=250.0, casetas=900.0),
+    dict(tipo="EXPORTACION", modo="Operador", moneda_costo_cruce="USD", costo_cruce=100.0, horas_termo=6.0,
+         puntualidad=150.0),
+    dict(tipo="VACIO", modo="Team", ingreso_flete=0.0, puntualidad=100.0, estancia=300.0),
+    dict(tipo="IMPORTACION", modo="Team", moneda_cruce="USD", ingreso_cruce=150.0, puntualidad=200.0,
+         estancia=400.0, cobrados=True),
+])
+def test_filas_legadas_cuadran_con_las_formulas_originales(captura):
+    ruta = ruta_baseline(**captura)
+    recalculada = calcular(pd.DataFrame([ruta]), VALORES).iloc[0]
+
+    for columna in ["Ingreso Total", "Sueldo_Operador", "Bono", "Costo_Diesel_Camion", "Costo_Diesel_Termo",
+                    "Costo Cruce Convertido", "Costo_Extras", "Costo_Total_Ruta"]:
+        assert recalculada[columna] == pytest.approx(ruta[columna]), columna
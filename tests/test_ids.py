@@ -0,0 +1,128 @@
+# tests/test_ids.py
+import logging
+import threading
+import time
+
+import pytest
+
+from utils.ids import AsignadorIds
+from utils.repositorio import RepositorioSQLite
+
+
+class RepoContado(RepositorioSQLite):
+    def __init__(self):
+        super().__init__(":memory:")
+        self.reservas = []
+        self.falla = None  # excepción que lanza reservar_ids mientras no sea None
+        self.intentos = 0
+
+    def reservar_ids(self, nombre, cantidad):
+        self.intentos += 1
+        if self.falla is not None:
+            raise self.falla
+        self.reservas.append(cantidad)
+        return super().reservar_ids(nombre, cantidad)
+
+
+@pytest.fixture
+def repo():
+    return RepoContado()
+
+
+def esperar_bloque_anticipado(asignador, plazo=2.0):
+    """El bloque anticipado se pide en otro hilo: espera a que termine."""
+    limite = time.monotonic() + plazo
+    while asignador._rellenando and time.monotonic() < limite:
+        time.sleep(0.005)
+    assert not asignador._rellenando
+
+
+def test_arranca_despues_del_id_mas_alto(repo):
+    RepositorioSQLite.insertar(repo, "Rutas", [{"ID_Ruta": "IG000007"}, {"ID_Ruta": "IG000123"}])
+    assert AsignadorIds(repo, "Rutas", bloque=5).siguiente() == "IG000124"
+
+
+def test_dos_procesos_nunca_reciben_el_mismo_bloque(repo):
+    a, b = AsignadorIds(repo, "Rutas", bloque=4), AsignadorIds(repo, "Rutas", bloque=4)
+    ids = [a.siguiente(), b.siguiente(), a.siguiente(), b.siguiente()]
+    assert ids == ["IG000001", "IG000005", "IG000002", "IG000006"]
+
+
+def test_pide_el_siguiente_bloque_antes_de_agotar_el_actual(repo):
+    asignador = AsignadorIds(repo, "Rutas", bloque=8)
+    ids = [asignador.siguiente() for _ in range(8)]
+
+    # Al bajar de una cuarta parte (menos de 2 libres) se pidió el siguiente bloque
+    esperar_bloque_anticipado(asignador)
+    assert repo.reservas == [8, 8]
+    assert ids == [f"IG{n:06d}" for n in range(1, 9)]
+    repo.falla = ConnectionError("sin red")
+    assert asignador.siguiente() == "IG000009"  # sale de memoria, sin ir a la base
+
+
+def test_bloque_anticipado_no_demora_la_captura(repo):
+    asignador = AsignadorIds(repo, "Rutas", bloque=8)
+    asignador.reservar(6)
+    liberar = threading.Event()
+    reservar = repo.reservar_ids
+    repo.reservar_ids = lambda nombre, cantidad: (liberar.wait(2.0), reservar(nombre, cantidad))[1]
+
+    # Queda 1 tras esta: el bloque anticipado se pide sin esperarlo
+    inicio = time.monotonic()
+    assert asignador.siguiente() == "IG000007"
+    assert time.monotonic() - inicio < 0.5
+    liberar.set()
+    esperar_bloque_anticipado(asignador)
+    assert repo.reservas == [8, 8]
+    assert [asignador.siguiente() for _ in range(2)] == ["IG000008", "IG000009"]
+
+
+def test_bloque_anticipado_con_backend_caido_no_interrumpe_ni_avisa(repo, caplog):
+    asignador = AsignadorIds(repo, "Rutas", bloque=4)
+    asignador.reservar(3)
+    repo.falla = ConnectionError("sin red")
+    with caplog.at_level(logging.WARNING, logger="utils.ids"):
+        assert asignador.siguiente() == "IG000004"  # el anticipado falla en segundo plano
+        esperar_bloque_anticipado(asignador)
+    assert repo.intentos == 2
+    assert caplog.records == []
+    with pytest.raises(ConnectionError):
+        asignador.siguiente()
+
+
+def test_bloque_anticipado_con_error_inesperado_se_registra(repo, caplog):
+    asignador = AsignadorIds(repo, "Rutas", bloque=8)
+    asignador.reservar(6)
+    repo.falla = PermissionError("permission denied for function reservar_ids")
+    with caplog.at_level(logging.WARNING, logger="utils.ids"):
+        assert asignador.siguiente() == "IG000007"
+        esperar_bloque_anticipado(asignador)
+    assert repo.intentos == 2
+    assert [r.exc_info[0] for r in caplog.records] == [PermissionError]
+    assert asignador.siguiente() == "IG000008"  # lo que había en memoria sigue sirviendo
+
+
+def test_reserva_masiva_en_una_sola_peticion_y_continua_entre_rangos(repo):
+    asignador = AsignadorIds(repo, "Rutas", bloque=4)
+    asignador.siguiente()  # quedan IG000002..IG000004
+    ids = asignador.reservar(10)
+    assert repo.reservas[:2] == [4, 7]  # después, el bloque anticipado en segundo plano
+    assert ids == [f"IG{n:06d}" for n in range(2, 12)]
+
+
+def test_hilos_concurrentes_no_repiten_ids(repo):
+    asignador = AsignadorIds(repo, "Rutas", bloque=5)
+    ids, lock = [], threading.Lock()
+
+    def tomar():
+        for _ in range(25):
+            nuevo = asignador.siguiente()
+            with lock:
+                ids.append(nuevo)
+
+    hilos = [threading.Thread(target=tomar) for _ in range(4)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert len(ids) == len(set(ids)) == 100
@@ -0,0 +1,95 @@
+# tests/test_limitador.py
+import threading
+import time
+
+import httpx
+import pytest
+
+from utils.circuit_breaker import CERRADO, CircuitBreaker
+from utils.datos import backend_caido
+from utils.limitador import LimitadorAdaptativo, LimiteSaturado
+from utils.repositorio import RepositorioConReintentos, RepositorioSQLite
+
+
+def error_http(codigo):
+    peticion = httpx.Request("GET", "https://backend.test/rest/v1/Rutas")
+    return httpx.HTTPStatusError(str(codigo), request=peticion, response=httpx.Response(codigo, request=peticion))
+
+
+def fallar(exc):
+    def fn():
+        raise exc
+    return fn
+
+
+def test_limitador_baja_a_la_mitad_con_sobrecarga_una_vez_por_enfriamiento():
+    limitador = LimitadorAdaptativo(inicial=8, enfriamiento=60)
+    for _ in range(3):
+        with pytest.raises(httpx.HTTPStatusError):
+            limitador.ejecutar(fallar(error_http(429)))
+    assert limitador.limite == 4
+    assert limitador.reducciones == 1
+
+
+def test_limitador_sube_uno_por_ventana_completa():
+    limitador = LimitadorAdaptativo(inicial=4, maximo=20)
+    for _ in range(4):
+        limitador.ejecutar(lambda: None)
+    assert limitador.limite == 4  # 4 + 4 x (~1/4.5) todavía no llega a 5
+    for _ in range(2):
+        limitador.ejecutar(lambda: None)
+    assert limitador.limite == 5
+
+
+def test_otros_errores_no_mueven_el_limite():
+    limitador = LimitadorAdaptativo(inicial=4)
+    with pytest.raises(ValueError):
+        limitador.ejecutar(fallar(ValueError("dato inválido")))
+    assert limitador.limite == 4
+    assert limitador.estado()["en_curso"] == 0
+
+
+def test_sin_turno_en_el_plazo_lanza_limite_saturado():
+    limitador = LimitadorAdaptativo(inicial=1, maximo=1)
+    limitador.adquirir()
+    with pytest.raises(LimiteSaturado):
+        limitador.adquirir(timeout=0.05)
+    assert limitador.rechazos == 1
+    assert limitador.estado()["en_espera"] == 0
+    limitador.liberar()
+
+
+# ---------- todo junto ----------
+
+@pytest.fixture
+def repo():
+    backend = RepositorioSQLite(":memory:")
+    backend.insertar("Rutas", {"ID_Ruta": "IG000001"})
+    return RepositorioConReintentos(
+        backend, plazo_lectura=0.2, plazo_escritura=0.2,
+        circuito=CircuitBreaker(sonda=lambda: None, umbral=1, espera=60),
+        limitador=LimitadorAdaptativo(inicial=1, maximo=1),
+    )
+
+
+def test_saturacion_local_no_se_reintenta_ni_abre_el_circuito(repo):
+    llamadas = []
+    repo.backend.seleccionar = lambda *a, **kw: llamadas.append(1)
+    repo.limitador.adquirir()  # otra petición ocupa el único turno
+
+    inicio = time.monotonic()
+    with pytest.raises(LimiteSaturado) as error:
+        repo.seleccionar("Rutas")
+    assert time.monotonic() - inicio < 1.0  # el plazo total acota la espera de turno
+    assert llamadas == []
+    assert repo.circuito.estado == CERRADO
+    assert repo.limitador.rechazos == 1
+    # Las páginas lo tratan como backend no disponible: copia local / cola de escritura
+    assert backend_caido(error.value)
+    repo.limitador.liberar()
+
+
+def test_turno_liberado_a_tiempo_deja_pasar_la_peticion(repo):
+    repo.limitador.adquirir()
+    threading.Timer(0.05, repo.limitador.liberar).start()
+    assert [f["ID_Ruta"] for f in repo.seleccionar("Rutas").data] == ["IG000001"]
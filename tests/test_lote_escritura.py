@@ -0,0 +1,77 @@
+# tests/test_lote_escritura.py
+import time
+
+import pytest
+
+from utils.cola_escritura import ENCOLADA
+from utils.lote_escritura import LoteEscritura
+from utils.repositorio import RepositorioSQLite
+
+
+def rutas(repo):
+    return {f["ID_Ruta"]: f for f in repo.seleccionar("Rutas").data}
+
+
+def test_lote_aisla_por_biseccion_la_fila_rechazada(repo, cola):
+    RepositorioSQLite.insertar(repo, "Rutas", {"ID_Ruta": "IG000005"})
+    filas = [{"ID_Ruta": f"IG{n:06d}"} for n in range(1, 9)]  # IG000005 ya existe
+
+    with LoteEscritura(cola, ventana=None) as lote:
+        lote.insertar("Rutas", filas)
+
+    r = lote.resultado
+    assert [llave for llave, _ in r.errores] == ["IG000005"]
+    assert r.aplicadas == 7
+    assert sorted(r.guardadas) == sorted(f["ID_Ruta"] for f in filas if f["ID_Ruta"] != "IG000005")
+    # 8 -> 4 + 4 -> 2 + 2 -> 1 + 1
+    assert r.peticiones == 7
+    assert len(rutas(repo)) == 8
+
+
+def test_lote_parte_en_bloques_de_tam_maximo(repo, cola):
+    with LoteEscritura(cola, tam_maximo=4, ventana=None) as lote:
+        for n in range(1, 11):
+            lote.insertar("Rutas", {"ID_Ruta": f"IG{n:06d}"})
+
+    assert lote.resultado.peticiones == 3
+    assert lote.resultado.aplicadas == 10
+
+
+def test_lote_sin_conexion_queda_en_cola_entero(repo, cola):
+    repo.caido = True
+    with LoteEscritura(cola, ventana=None) as lote:
+        lote.insertar("Rutas", [{"ID_Ruta": "IG000001"}, {"ID_Ruta": "IG000002"}])
+
+    assert lote.resultado.estado == ENCOLADA
+    assert lote.resultado.encoladas == 2
+    assert cola.pendientes() == 1
+
+
+def test_lote_no_se_envia_si_la_accion_falla(repo, cola):
+    with pytest.raises(RuntimeError):
+        with LoteEscritura(cola, ventana=None) as lote:
+            lote.insertar("Rutas", {"ID_Ruta": "IG000001"})
+            raise RuntimeError("falló a medias")
+    assert rutas(repo) == {}
+
+
+def test_la_ventana_se_manda_sola_sin_esperar_otra_escritura(repo, cola):
+    with LoteEscritura(cola, ventana=0.05) as lote:
+        lote.insertar("Rutas", {"ID_Ruta": "IG000001"})
+        limite = time.monotonic() + 2.0
+        while not rutas(repo) and time.monotonic() < limite:
+            time.sleep(0.01)
+        assert list(rutas(repo)) == ["IG000001"]
+        assert lote.resultado.peticiones == 1
+
+    assert lote.resultado.peticiones == 1  # al salir no queda nada que mandar
+    assert lote.resultado.aplicadas == 1
+
+
+def test_la_ventana_no_manda_nada_si_la_accion_falla(repo, cola):
+    with pytest.raises(RuntimeError):
+        with LoteEscritura(cola, ventana=0.05) as lote:
+            lote.insertar("Rutas", {"ID_Ruta": "IG000001"})
+            raise RuntimeError("falló a medias")
+    time.sleep(0.1)
+    assert rutas(repo) == {}
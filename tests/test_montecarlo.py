@@ -0,0 +1,59 @@
+# tests/test_montecarlo.py
+import numpy as np
+import pandas as pd
+
+from utils.costos import PARAMETROS_POR_DEFECTO, calcular
+from utils.montecarlo import MIN_MUESTRAS, ajustar_distribuciones, simular
+
+VALORES = dict(PARAMETROS_POR_DEFECTO)
+
+
+def historial(costos_extras):
+    n = len(costos_extras)
+    return pd.DataFrame({
+        "ID_Programacion": [f"P{i}" for i in range(n)], "Tipo": "IMPORTACION",
+        "Origen": "LAREDO", "Destino": "MONTERREY", "Moneda": "MXP", "Tipo de cambio": 1.0,
+        "Costo Diesel": 24.0, "Horas_Termo": 0.0, "Costo_Extras": costos_extras,
+    })
+
+
+RUTAS = pd.DataFrame({"Tipo": ["IMPORTACION"], "Origen": ["LAREDO"], "Destino": ["MONTERREY"], "Costo_Extras": [500.0]})
+
+TRAMO = pd.DataFrame([{
+    "Tipo": "IMPORTACION", "Modo de Viaje": "Operador", "KM": 1000.0, "Moneda": "MXP",
+    "Ingreso_Original": 20000.0, "Moneda_Cruce": "MXP", "Moneda Costo Cruce": "MXP",
+    "Estancia": 500.0, "Extras_Cobrados": True,
+}])
+
+
+def test_extras_planeados_no_se_remuestrean():
+    # Todos los tráficos gastaron justo lo planeado en la ruta: no hay extras no planeados
+    distribuciones = ajustar_distribuciones(historial([500.0] * MIN_MUESTRAS), RUTAS)
+    probabilidad, montos = distribuciones["extras"]["IMPORTACION"]
+    assert probabilidad == 0.0
+    assert len(montos) == 0
+
+
+def test_solo_se_remuestrea_el_exceso_sobre_lo_planeado():
+    distribuciones = ajustar_distribuciones(historial([500.0, 800.0] * MIN_MUESTRAS), RUTAS)
+    probabilidad, montos = distribuciones["extras"]["IMPORTACION"]
+    assert probabilidad == 0.5
+    assert set(montos) == {300.0}
+
+
+def test_sin_rutas_del_carril_no_hay_extras():
+    distribuciones = ajustar_distribuciones(historial([800.0] * MIN_MUESTRAS), RUTAS.assign(Destino="SALTILLO"))
+    assert distribuciones["extras"] == {}
+
+
+def test_extras_no_planeados_son_costo_y_no_ingreso():
+    distribuciones = {
+        "sigma_diesel": 0.0, "sigma_tipo_cambio": 0.0, "sigma_horas_termo": 0.0,
+        "extras": {"IMPORTACION": (1.0, np.array([300.0]))},
+    }
+    base = calcular(TRAMO, VALORES).iloc[0]
+    sim = simular(TRAMO, VALORES, distribuciones, n=100, semilla=1)
+
+    # Extras_Cobrados factura lo planeado, no lo que surge en el camino
+    np.testing.assert_allclose(sim["ingreso"], base["Ingreso Total"])
+    np.testing.assert_allclose(sim["utilidad_neta"], base["Utilidad_Neta"] - 300.0)
@@ -0,0 +1,117 @@
+# tests/test_retry.py
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from utils.circuit_breaker import ABIERTO, CircuitBreaker
+from utils.limitador import LimitadorAdaptativo
+from utils.repositorio import RepositorioConReintentos, RepositorioSQLite
+from utils.retry import is_transient, retry_with_backoff, retry_with_backoff_async
+
+
+def falla_transitoria(veces, valor="ok"):
+    """Corutina que falla `veces` con error de red y luego responde `valor`."""
+    llamadas = []
+
+    async def fn():
+        llamadas.append(1)
+        if len(llamadas) <= veces:
+            raise httpx.ConnectError("sin red")
+        return valor
+
+    return fn, llamadas
+
+
+def test_reintenta_el_error_transitorio_y_no_el_de_datos():
+    llamadas = []
+
+    def fn():
+        llamadas.append(1)
+        raise ValueError("dato inválido")
+
+    with pytest.raises(ValueError):
+        retry_with_backoff(fn, base_delay=0.01)
+    assert llamadas == [1]
+
+
+def test_el_plazo_total_acota_los_reintentos():
+    backend = RepositorioSQLite(":memory:")
+    backend.insertar("Rutas", {"ID_Ruta": "IG000001"})
+    repo = RepositorioConReintentos(
+        backend, plazo_lectura=0.2, plazo_escritura=0.2,
+        circuito=CircuitBreaker(sonda=lambda: None, umbral=1, espera=60),
+        limitador=LimitadorAdaptativo(inicial=1, maximo=1),
+    )
+    intentos = []
+
+    def caido(*args, **kwargs):
+        intentos.append(time.monotonic())
+        raise httpx.ConnectError("sin red")
+
+    repo.backend.actualizar = caido
+    inicio = time.monotonic()
+    with pytest.raises(httpx.ConnectError):
+        repo.actualizar("Rutas", {"KM": 1}, [("eq", "ID_Ruta", "IG000001")])
+    assert time.monotonic() - inicio < 1.0
+    assert repo.circuito.estado == ABIERTO  # umbral=1: una falla de red lo abre
+    assert repo.limitador.estado()["en_curso"] == 0
+
+
+# ---------- asyncio ----------
+
+def test_async_reintenta_la_falla_transitoria():
+    fn, llamadas = falla_transitoria(2)
+    assert asyncio.run(retry_with_backoff_async(fn, base_delay=0.01, deadline=2.0)) == "ok"
+    assert len(llamadas) == 3
+
+
+def test_async_el_plazo_corta_los_reintentos():
+    fn, llamadas = falla_transitoria(100)
+    inicio = time.monotonic()
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(retry_with_backoff_async(fn, tries=100, base_delay=0.05, max_delay=0.05, deadline=0.3))
+    assert time.monotonic() - inicio < 1.0
+    assert 1 < len(llamadas) < 100
+
+
+def test_async_el_plazo_corta_tambien_el_intento_en_curso():
+    async def lenta():
+        await asyncio.sleep(5)
+
+    inicio = time.monotonic()
+    with pytest.raises(TimeoutError):
+        asyncio.run(retry_with_backoff_async(lenta, deadline=0.1))
+    assert time.monotonic() - inicio < 1.0
+
+
+def test_async_usa_la_misma_clasificacion():
+    fn, llamadas = falla_transitoria(1)
+    # Insert: un timeout pudo haberse aplicado, pero un ConnectError nunca salió
+    solo_seguros = lambda exc: is_transient(exc, idempotent=False)  # noqa: E731
+    assert asyncio.run(retry_with_backoff_async(fn, base_delay=0.01, retry_if=solo_seguros)) == "ok"
+
+    llamadas = []
+
+    async def invalida():
+        llamadas.append(1)
+        raise ValueError("dato inválido")
+
+    with pytest.raises(ValueError):
+        asyncio.run(retry_with_backoff_async(invalida, base_delay=0.01))
+    assert llamadas == [1]
+
+
+def test_async_hedge_se_queda_con_la_primera_respuesta():
+    llamadas = []
+
+    async def lectura():
+        llamadas.append(1)
+        await asyncio.sleep(5 if len(llamadas) == 1 else 0.01)
+        return len(llamadas)
+
+    inicio = time.monotonic()
+    assert asyncio.run(retry_with_backoff_async(lectura, hedge_after=0.05, deadline=2.0)) == 2
+    assert time.monotonic() - inicio < 1.0
+    assert len(llamadas) == 2
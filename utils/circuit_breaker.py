@@ -0,0 +1,91 @@
+# utils/circuit_breaker.py
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Optional, TypeVar
+
+from utils.retry import is_backend_failure
+
+T = TypeVar("T")
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+
+
+class CircuitoAbierto(RuntimeError):
+    """El backend se dio por caído: se falla al instante, sin ir a la red."""
+
+    def __init__(self, desde: float):
+        self.desde = desde
+        hora = datetime.fromtimestamp(desde).strftime("%H:%M")
+        super().__init__(
+            f"La base de datos no responde desde las {hora}; "
+            "se reintenta sola en segundo plano (mientras tanto, solo lectura)."
+        )
+
+
+class CircuitBreaker:
+    """
+    Después de `umbral` fallas seguidas del backend se abre: las llamadas fallan
+    al instante con CircuitoAbierto y un hilo prueba el backend cada `espera`
+    segundos con `sonda()`. Cuando la sonda responde, se vuelve a cerrar.
+    `cuenta_como_fallo` decide qué errores son del backend; es otra pregunta que la
+    de reintentar (un timeout propio se reintenta, pero el backend puede estar sano).
+    """
+
+    def __init__(
+        self,
+        sonda: Callable[[], object],
+        umbral: int = 3,
+        espera: float = 15.0,
+        cuenta_como_fallo: Callable[[BaseException], bool] = is_backend_failure,
+    ):
+        self.sonda = sonda
+        self.cuenta_como_fallo = cuenta_como_fallo
+        self.umbral = umbral
+        self.espera = espera
+        self.estado = CERRADO
+        self.abierto_desde: Optional[float] = None  # time.time(), para mostrarlo en la página
+        self.fallas_seguidas = 0
+        self.aperturas = 0
+        self._lock = threading.Lock()
+
+    @property
+    def abierto(self) -> bool:
+        return self.estado == ABIERTO
+
+    def llamar(self, fn: Callable[[], T]) -> T:
+        if self.estado == ABIERTO:
+            raise CircuitoAbierto(self.abierto_desde)
+        try:
+            resultado = fn()
+        except Exception as exc:
+            if self.cuenta_como_fallo(exc):
+                self._registrar_falla()
+            raise
+        with self._lock:
+            self.fallas_seguidas = 0
+        return resultado
+
+    def _registrar_falla(self) -> None:
+        with self._lock:
+            self.fallas_seguidas += 1
+            if self.estado == ABIERTO or self.fallas_seguidas < self.umbral:
+                return
+            self.estado = ABIERTO
+            self.abierto_desde = time.time()
+            self.aperturas += 1
+        threading.Thread(target=self._sondear, name="sonda-backend", daemon=True).start()
+
+    def _sondear(self) -> None:
+        while True:
+            time.sleep(self.espera)
+            try:
+                self.sonda()
+            except Exception:
+                continue
+            with self._lock:
+                self.estado = CERRADO
+                self.abierto_desde = None
+                self.fallas_seguidas = 0
+            return
@@ -0,0 +1,278 @@
+# utils/cola_escritura.py
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from utils.conexion import leer_config
+from utils.datos import backend_caido, invalidar_tabla
+from utils.repositorio import LLAVES, Filtro, Repositorio, obtener_repositorio
+
+APLICADA = "aplicada"
+ENCOLADA = "encolada"
+
+OPERACIONES = ("insertar", "upsert", "insertar_nuevas", "actualizar", "eliminar")
+# Operaciones que llevan filas en `datos` (la llave primaria va en cada fila)
+_CON_FILAS = ("insertar", "upsert", "insertar_nuevas")
+
+# Cada cuánto revisa el worker si ya puede vaciar la cola (también despierta al encolar)
+INTERVALO_REINTENTO = 5.0
+
+
+def _a_json(valor: Any) -> Any:
+    if hasattr(valor, "item"):
+        return valor.item()  # escalares de numpy
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _serializar(valor: Any) -> str:
+    return json.dumps(valor, default=_a_json, ensure_ascii=False, sort_keys=True)
+
+
+def _es_duplicado(exc: BaseException) -> bool:
+    """La llave primaria ya existe (Postgres 23505 / HTTP 409 / SQLite IntegrityError)."""
+    if isinstance(exc, sqlite3.IntegrityError):
+        return True
+    codigo = str(getattr(exc, "code", "") or "")
+    return codigo in ("23505", "409") or "duplicate key" in str(exc).lower()
+
+
+def _claves_afectadas(tabla: str, operacion: str, datos: Any, filtros: Sequence[Filtro]) -> Optional[list]:
+    """Llaves para invalidar_tabla; None si no se pueden deducir (recarga completa)."""
+    llave = LLAVES.get(tabla)
+    if operacion in _CON_FILAS:
+        filas = [datos] if isinstance(datos, dict) else list(datos)
+        claves = [f.get(llave) for f in filas]
+        return claves if llave and all(c is not None for c in claves) else None
+    for op, columna, valor in filtros or ():
+        if columna == llave and op == "eq":
+            return [valor]
+        if columna == llave and op == "in_":
+            return list(valor)
+    return None
+
+
+class ColaEscritura:
+    """
+    Escrituras que sobreviven a una caída del backend.
+    escribir() intenta aplicar en el momento; si el backend no responde, la guarda
+    en un SQLite local y un hilo la reenvía en orden cuando vuelve. Cada envío se
+    encola aparte; solo el que pasa una `llave` explícita se junta con otro de la misma
+    llave (doble clic / rerun de la misma captura). Al reenviar un insert, las filas
+    cuya llave primaria ya existe se dan por aplicadas.
+    """
+
+    def __init__(self, repo: Repositorio, ruta: str):
+        self.repo = repo
+        self._con = sqlite3.connect(ruta, check_same_thread=False)
+        self._con.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        self._despertar = threading.Event()
+        with self._lock, self._con:
+            self._con.execute(
+                """CREATE TABLE IF NOT EXISTS pendientes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    llave TEXT UNIQUE NOT NULL,
+                    tabla TEXT NOT NULL,
+                    operacion TEXT NOT NULL,
+                    datos TEXT,
+                    filtros TEXT,
+                    creado_en REAL NOT NULL,
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    ultimo_error TEXT,
+                    estado TEXT NOT NULL DEFAULT 'pendiente'
+                )"""
+            )
+        self._worker: Optional[threading.Thread] = None
+
+    # ---------- escritura ----------
+    def escribir(
+        self,
+        tabla: str,
+        operacion: str,
+        datos: Any = None,
+        filtros: Sequence[Filtro] = (),
+        llave: Optional[str] = None,
+    ) -> str:
+        """Devuelve APLICADA o ENCOLADA. Errores que no son de conexión (datos inválidos) se lanzan."""
+        return self.escribir_detalle(tabla, operacion, datos, filtros, llave)[0]
+
+    def escribir_detalle(
+        self,
+        tabla: str,
+        operacion: str,
+        datos: Any = None,
+        filtros: Sequence[Filtro] = (),
+        llave: Optional[str] = None,
+    ) -> Tuple[str, Optional[List[dict]]]:
+        """
+        Como escribir(), más las filas que devolvió el backend (None si quedó en cola).
+        `llave`: solo para reintentos del mismo envío que deben quedar en uno; sin ella
+        cada llamada es un envío distinto (X=1, X=2, X=1 se encolan las tres).
+        """
+        if operacion not in OPERACIONES:
+            raise ValueError(f"Operación no soportada: {operacion}")
+        filtros = [list(f) for f in filtros or ()]
+        llave = llave or uuid.uuid4().hex
+
+        # Con escrituras de esta tabla todavía en cola, las nuevas van detrás para respetar el orden
+        if not self.pendientes(tabla):
+            try:
+                return APLICADA, self._aplicar(tabla, operacion, datos, filtros)
+            except Exception as exc:
+                if not backend_caido(exc):
+                    raise
+
+        with self._lock, self._con:
+            self._con.execute(
+                "INSERT OR IGNORE INTO pendientes (llave, tabla, operacion, datos, filtros, creado_en) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (llave, tabla, operacion, _serializar(datos), _serializar(filtros), time.time()),
+            )
+        self._despertar.set()
+        return ENCOLADA, None
+
+    def _aplicar(self, tabla: str, operacion: str, datos: Any, filtros: list) -> List[dict]:
+        filtros = [tuple(f) for f in filtros]
+        if operacion == "insertar":
+            filas = self.repo.insertar(tabla, datos)
+        elif operacion in ("upsert", "insertar_nuevas"):
+            filas = self.repo.upsertar(tabla, datos, ignorar_duplicados=operacion == "insertar_nuevas")
+        elif operacion == "actualizar":
+            filas = self.repo.actualizar(tabla, datos, filtros)
+        elif operacion == "eliminar":
+            filas = self.repo.eliminar(tabla, filtros)
+        else:
+            # Pendiente guardado por una versión anterior con otra operación: queda como fallida
+            raise ValueError(f"Operación no soportada: {operacion}")
+        claves = _claves_afectadas(tabla, operacion, datos, filtros)
+        if operacion == "eliminar" and claves is not None:
+            invalidar_tabla(tabla, eliminadas=claves)
+        else:
+            invalidar_tabla(tabla, claves=claves)
+        return filas
+
+    # ---------- reenvío ----------
+    def iniciar(self) -> None:
+        if self._worker is not None:
+            return
+        self._worker = threading.Thread(target=self._vaciar_siempre, name="cola-escritura", daemon=True)
+        add_script_run_ctx(self._worker, get_script_run_ctx())
+        self._worker.start()
+
+    def _vaciar_siempre(self) -> None:
+        while True:
+            self._despertar.wait(INTERVALO_REINTENTO)
+            self._despertar.clear()
+            circuito = getattr(self.repo, "circuito", None)
+            if circuito is not None and circuito.abierto:
+                continue
+            try:
+                self.vaciar()
+            except Exception:
+                pass  # se reintenta en la siguiente vuelta
+
+    def vaciar(self) -> int:
+        """Reenvía en orden de llegada; se detiene en la primera falla de conexión."""
+        aplicadas = 0
+        while True:
+            with self._lock:
+                fila = self._con.execute(
+                    "SELECT * FROM pendientes WHERE estado = 'pendiente' ORDER BY id LIMIT 1"
+                ).fetchone()
+            if fila is None:
+                return aplicadas
+            datos, filtros = json.loads(fila["datos"]), json.loads(fila["filtros"])
+            try:
+                self._aplicar(fila["tabla"], fila["operacion"], datos, filtros)
+            except Exception as exc:
+                if fila["operacion"] == "insertar" and _es_duplicado(exc):
+                    # Un intento anterior sí llegó (p. ej. timeout después de enviar), o solo
+                    # algunas filas del lote ya existen: se insertan las que faltan
+                    try:
+                        self._aplicar(fila["tabla"], "insertar_nuevas", datos, [])
+                    except Exception as exc2:
+                        if backend_caido(exc2):
+                            self._anotar(fila["id"], exc2, "pendiente")
+                            return aplicadas
+                        self._anotar(fila["id"], exc2, "fallida")
+                        continue
+                elif backend_caido(exc):
+                    self._anotar(fila["id"], exc, "pendiente")
+                    return aplicadas
+                else:
+                    # Error de datos: no bloquea al resto; queda visible como fallida
+                    self._anotar(fila["id"], exc, "fallida")
+                    continue
+            with self._lock, self._con:
+                self._con.execute("DELETE FROM pendientes WHERE id = ?", (fila["id"],))
+            aplicadas += 1
+
+    def _anotar(self, id_: int, exc: BaseException, estado: str) -> None:
+        with self._lock, self._con:
+            self._con.execute(
+                "UPDATE pendientes SET intentos = intentos + 1, ultimo_error = ?, estado = ? WHERE id = ?",
+                (str(exc)[:500], estado, id_),
+            )
+
+    # ---------- consulta ----------
+    def pendientes(self, tabla: Optional[str] = None) -> int:
+        sql = "SELECT COUNT(*) FROM pendientes WHERE estado = 'pendiente'"
+        params: list = []
+        if tabla:
+            sql += " AND tabla = ?"
+            params.append(tabla)
+        with self._lock:
+            return self._con.execute(sql, params).fetchone()[0]
+
+    def fallidas(self) -> List[dict]:
+        with self._lock:
+            filas = self._con.execute(
+                "SELECT id, tabla, operacion, datos, creado_en, intentos, ultimo_error "
+                "FROM pendientes WHERE estado = 'fallida' ORDER BY id"
+            ).fetchall()
+        return [dict(f) for f in filas]
+
+
+@st.cache_resource(show_spinner=False)
+def obtener_cola() -> ColaEscritura:
+    """Cola única por proceso; COLA_ESCRITURA_RUTA en secrets cambia el archivo."""
+    cola = ColaEscritura(obtener_repositorio(), leer_config("COLA_ESCRITURA_RUTA", "cola_escrituras.sqlite3"))
+    cola.iniciar()
+    return cola
+
+
+def escribir(tabla: str, operacion: str, datos: Any = None, filtros: Sequence[Filtro] = (), llave: Optional[str] = None) -> str:
+    """Atajo para las páginas: obtener_cola().escribir(...)."""
+    return obtener_cola().escribir(tabla, operacion, datos, filtros, llave)
+
+
+def notificar(estado: str, mensaje: str) -> None:
+    """Mensaje de éxito normal, o aviso de que el cambio quedó en cola."""
+    if estado == APLICADA:
+        st.success(mensaje)
+    else:
+        st.warning(
+            "📴 Sin conexión con la base de datos: el cambio quedó guardado en este servidor "
+            "y se enviará solo al restablecerse."
+        )
+
+
+def aviso_cola_escritura() -> None:
+    """Contador de cambios pendientes de enviar (y de los que el backend rechazó)."""
+    cola = obtener_cola()
+    pendientes, fallidas = cola.pendientes(), cola.fallidas()
+    if pendientes:
+        st.info(f"🕓 {pendientes} cambio(s) pendiente(s) de enviar a la base de datos.")
+    if fallidas:
+        with st.expander(f"⚠️ {len(fallidas)} cambio(s) en cola rechazados por la base de datos"):
+            for f in fallidas:
+                st.write(f"{f['tabla']} · {f['operacion']} · {f['ultimo_error']}")
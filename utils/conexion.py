@@ -0,0 +1,54 @@
+# utils/conexion.py
+import httpx
+import streamlit as st
+from supabase import Client, create_client
+from supabase.client import ClientOptions
+
+# Valores por defecto; se pueden sobreescribir en .streamlit/secrets.toml
+DEFAULT_POOL_SIZE = 20
+DEFAULT_TIMEOUT = 15.0
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_KEEPALIVE = 60.0
+
+
+def leer_config(nombre: str, default: float) -> float:
+    """Lee un parámetro opcional de st.secrets con el tipo del default."""
+    try:
+        return type(default)(st.secrets.get(nombre, default))
+    except Exception:
+        return default
+
+
+@st.cache_resource(show_spinner=False)
+def obtener_supabase() -> Client:
+    """
+    Cliente Supabase único por proceso.
+    Se crea una sola vez (no en cada rerun) y reutiliza la misma sesión HTTP
+    keep-alive, así que las páginas ya no pagan handshake TLS en cada interacción.
+    """
+    url = st.secrets["SUPABASE_URL"]
+    key = st.secrets["SUPABASE_KEY"]
+
+    pool = int(leer_config("SUPABASE_POOL_SIZE", DEFAULT_POOL_SIZE))
+    timeout = leer_config("SUPABASE_TIMEOUT", DEFAULT_TIMEOUT)
+    connect_timeout = leer_config("SUPABASE_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)
+    keepalive = leer_config("SUPABASE_KEEPALIVE", DEFAULT_KEEPALIVE)
+
+    http = httpx.Client(
+        timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        limits=httpx.Limits(
+            max_connections=pool,
+            max_keepalive_connections=pool,
+            keepalive_expiry=keepalive,
+        ),
+    )
+
+    try:
+        opciones = ClientOptions(postgrest_client_timeout=timeout, httpx_client=http)
+    except TypeError:
+        # supabase-py anterior a httpx_client: el cliente cacheado igual
+        # conserva su propia sesión keep-alive, solo sin el pool configurable
+        http.close()
+        opciones = ClientOptions(postgrest_client_timeout=timeout)
+
+    return create_client(url, key, options=opciones)
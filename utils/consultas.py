@@ -0,0 +1,77 @@
+# utils/consultas.py
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Sequence, Union
+
+import pandas as pd
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from utils.datos import version_tabla
+
+Tablas = Union[str, Sequence[str]]
+
+
+def _congelar(valor: Any) -> Any:
+    """Convierte listas/dicts/sets en algo hasheable para usarlo como llave."""
+    if isinstance(valor, dict):
+        return tuple(sorted((k, _congelar(v)) for k, v in valor.items()))
+    if isinstance(valor, (list, tuple)):
+        return tuple(_congelar(v) for v in valor)
+    if isinstance(valor, set):
+        return tuple(sorted(_congelar(v) for v in valor))
+    return valor
+
+
+class ConsultasRerun:
+    """
+    Memo de consultas que vive solo durante un rerun de la página.
+    Se crea al inicio del script (cada rerun vuelve a ejecutar el módulo), así que
+    no hace falta limpiarlo. La llave incluye la versión de las tablas tocadas:
+    si la página escribe a mitad del rerun, la siguiente lectura ya no reutiliza
+    el resultado anterior.
+    """
+
+    def __init__(self, hilos: int = 4):
+        self.hilos = hilos
+        self._memo: dict = {}
+        self._lock = threading.Lock()
+
+    def _llave(self, tablas: Tablas, fn: Callable, args: tuple, kwargs: dict):
+        tablas = (tablas,) if isinstance(tablas, str) else tuple(tablas)
+        versiones = tuple(version_tabla(t) for t in tablas)
+        return (fn.__module__, fn.__qualname__, tablas, versiones, _congelar(args), _congelar(kwargs))
+
+    @staticmethod
+    def _entregar(resultado: Any) -> Any:
+        # Cada llamador recibe su copia: las páginas agregan columnas sobre lo que leen
+        return resultado.copy() if isinstance(resultado, pd.DataFrame) else resultado
+
+    def obtener(self, tablas: Tablas, fn: Callable, *args, **kwargs) -> Any:
+        """fn(*args, **kwargs) una sola vez por rerun (mientras no cambien las tablas)."""
+        llave = self._llave(tablas, fn, args, kwargs)
+        with self._lock:
+            if llave in self._memo:
+                return self._entregar(self._memo[llave])
+        resultado = fn(*args, **kwargs)
+        with self._lock:
+            self._memo[llave] = resultado
+        return self._entregar(resultado)
+
+    def en_paralelo(self, *pedidos: tuple) -> list:
+        """
+        Ejecuta a la vez consultas independientes, p. ej.
+            en_paralelo(("Rutas", cargar_rutas), ("Traficos", cargar_pendientes))
+        Cada pedido es (tablas, fn, *args). Devuelve los resultados en el mismo orden.
+        """
+        ctx = get_script_run_ctx()
+
+        def correr(pedido):
+            # Los hilos del pool necesitan el contexto del script para usar st.cache_* / st.*
+            add_script_run_ctx(threading.current_thread(), ctx)
+            tablas, fn, *args = pedido
+            return self.obtener(tablas, fn, *args)
+
+        if len(pedidos) <= 1:
+            return [self.obtener(p[0], p[1], *p[2:]) for p in pedidos]
+        with ThreadPoolExecutor(max_workers=min(self.hilos, len(pedidos))) as pool:
+            return list(pool.map(correr, pedidos))
@@ -0,0 +1,435 @@
+# utils/costos.py
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# Datos Generales que usa el cálculo (mismas llaves que datos_generales.csv)
+PARAMETROS_POR_DEFECTO = {
+    "Rendimiento Camion": 2.5,
+    "Costo Diesel": 24.0,
+    "Rendimiento Termo": 3.0,
+    "Bono ISR IMSS": 462.66,
+    "Pago x km IMPORTACION": 2.10,
+    "Pago x km EXPORTACION": 2.50,
+    "Pago fijo VACIO": 200.00,
+    "Tipo de cambio USD": 19.5,
+    "Tipo de cambio MXP": 1.0,
+}
+
+PORCENTAJE_INDIRECTOS = 0.35
+
+# Sueldo, bono y Puntualidad de un viaje Team (dos operadores)
+FACTOR_TEAM = 2.0
+
+# Diferencia mínima (pesos) para considerar que una columna guardada cambió
+TOLERANCIA = 0.005
+
+# Costos extra que se suman a Costo_Extras (Puntualidad se multiplica por el factor Team)
+COLUMNAS_EXTRAS = [
+    "Lavado_Termo", "Movimiento_Local", "Puntualidad", "Pension", "Estancia", "Fianza_Termo",
+    "Renta_Termo", "Pistas_Extra", "Stop", "Falso", "Gatas", "Accesorios", "Guias",
+]
+
+# Lo que captura el usuario en cada tramo
+ENTRADAS_NUMERICAS = ["KM", "Ingreso_Original", "Cruce_Original", "Costo Cruce", "Horas_Termo", "Casetas", *COLUMNAS_EXTRAS]
+ENTRADAS_TEXTO = ["Tipo", "Modo de Viaje", "Moneda", "Moneda_Cruce", "Moneda Costo Cruce"]
+ENTRADAS_BOOLEANAS = ["Extras_Cobrados"]
+
+# Columnas de Rutas que salen de la captura + Datos Generales (no se editan a mano)
+COLUMNAS_DERIVADAS = [
+    "Tipo de cambio", "Ingreso Flete", "Tipo cambio Cruce", "Ingreso Cruce", "Ingreso Total",
+    "Costo Cruce Convertido", "Pago por KM", "Sueldo_Operador", "Bono",
+    "Costo_Diesel_Camion", "Costo_Diesel_Termo", "Costo_Extras", "Costo_Total_Ruta",
+    "Costo Diesel", "Rendimiento Camion", "Rendimiento Termo",
+]
+
+# Rentabilidad: Traficos las guarda, Rutas no (se calculan al mostrar)
+COLUMNAS_RENTABILIDAD = [
+    "Costos_Indirectos", "Utilidad_Bruta", "Utilidad_Neta",
+    "% Costo Directo", "% Utilidad Bruta", "% Utilidad Neta",
+]
+
+
+# ---------- entradas ----------
+
+def _numero(df: pd.DataFrame, columna: str) -> np.ndarray:
+    if columna not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[columna], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+
+
+def _texto(df: pd.DataFrame, columna: str) -> np.ndarray:
+    if columna not in df.columns:
+        return np.full(len(df), "", dtype=object)
+    return df[columna].fillna("").astype(str).str.strip().str.upper().to_numpy(dtype=object)
+
+
+def _booleano(df: pd.DataFrame, columna: str) -> np.ndarray:
+    if columna not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    valores = df[columna]
+    if pd.api.types.is_bool_dtype(valores):
+        return valores.to_numpy(dtype=bool)
+    return valores.astype(str).str.lower().isin(["true", "1", "1.0", "sí", "si"]).to_numpy()
+
+
+def puntualidad_legada(df: pd.DataFrame) -> np.ndarray:
+    """
+    Filas Team guardadas antes del motor compartido: Captura y Gestión guardaban
+    Puntualidad ya multiplicada por el factor Team y la sumaban una vez a Costo_Extras.
+    Se reconocen porque Costo_Extras = resto de extras + Puntualidad (con Puntualidad
+    por operador, el motor da resto + Puntualidad x factor).
+    """
+    if "Costo_Extras" not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    puntualidad = _numero(df, "Puntualidad")
+    resto = sum(_numero(df, c) for c in COLUMNAS_EXTRAS if c != "Puntualidad")
+    return (
+        (_texto(df, "Modo de Viaje") == "TEAM")
+        & (puntualidad > 0)
+        & (np.abs(_numero(df, "Costo_Extras") - resto - puntualidad) <= TOLERANCIA)
+    )
+
+
+def normalizar_puntualidad(df: pd.DataFrame) -> pd.DataFrame:
+    """Copia de `df` con la Puntualidad de las filas legadas por operador (sin el factor Team)."""
+    legada = puntualidad_legada(df)
+    if not legada.any():
+        return df
+    df = df.copy()
+    puntualidad = _numero(df, "Puntualidad")
+    df["Puntualidad"] = np.where(legada, puntualidad / FACTOR_TEAM, puntualidad)
+    return df
+
+
+def entradas(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    Columnas de captura como arreglos (faltantes = 0 / "" / False). La Puntualidad de
+    filas legadas (puntualidad_legada) se toma por operador, como la captura actual.
+    """
+    e = {c: _numero(df, c) for c in ENTRADAS_NUMERICAS}
+    e.update({c: _texto(df, c) for c in ENTRADAS_TEXTO})
+    e.update({c: _booleano(df, c) for c in ENTRADAS_BOOLEANAS})
+    e["Puntualidad"] = np.where(puntualidad_legada(df), e["Puntualidad"] / FACTOR_TEAM, e["Puntualidad"])
+    return e
+
+
+# ---------- motor ----------
+
+def costos_indirectos(tipo: np.ndarray, ingreso_total) -> np.ndarray:
+    """Porcentaje fijo sobre el ingreso; los vacíos no cargan indirectos (no generan venta)."""
+    cargado = (tipo == "IMPORTACION") | (tipo == "EXPORTACION")
+    return np.where(cargado, ingreso_total * PORCENTAJE_INDIRECTOS, 0.0)
+
+
+def calcular_arreglos(e: Dict[str, np.ndarray], parametros: dict) -> Dict[str, np.ndarray]:
+    """
+    Todas las columnas derivadas en una pasada de NumPy. Entradas y parámetros pueden
+    ser escalares o arreglos: se combinan por broadcasting (p. ej. entradas (n, 1) con
+    parámetros (1, k) dan n rutas x k escenarios).
+    """
+    p = {**PARAMETROS_POR_DEFECTO, **(parametros or {})}
+
+    def param(nombre):
+        return np.asarray(p[nombre], dtype=float)
+
+    tipo = e["Tipo"]
+    importacion = tipo == "IMPORTACION"
+    exportacion = tipo == "EXPORTACION"
+    cargado = importacion | exportacion
+    factor = np.where(e["Modo de Viaje"] == "TEAM", FACTOR_TEAM, 1.0)
+
+    tc_usd, tc_mxp = param("Tipo de cambio USD"), param("Tipo de cambio MXP")
+    tc_flete = np.where(e["Moneda"] == "USD", tc_usd, tc_mxp)
+    tc_cruce = np.where(e["Moneda_Cruce"] == "USD", tc_usd, tc_mxp)
+    tc_costo_cruce = np.where(e["Moneda Costo Cruce"] == "USD", tc_usd, tc_mxp)
+
+    ingreso_flete = e["Ingreso_Original"] * tc_flete
+    ingreso_cruce = e["Cruce_Original"] * tc_cruce
+    costo_cruce = e["Costo Cruce"] * tc_costo_cruce
+
+    costo_diesel = param("Costo Diesel")
+    rendimiento_camion = param("Rendimiento Camion")
+    rendimiento_termo = param("Rendimiento Termo")
+    diesel_camion = e["KM"] / np.maximum(rendimiento_camion, 0.0001) * costo_diesel
+    diesel_termo = e["Horas_Termo"] * np.maximum(rendimiento_termo, 0.0) * costo_diesel
+
+    pago_km = np.where(importacion, param("Pago x km IMPORTACION"),
+                       np.where(exportacion, param("Pago x km EXPORTACION"), 0.0))
+    sueldo = np.where(cargado, e["KM"] * pago_km, param("Pago fijo VACIO")) * factor
+    bono = np.where(cargado, param("Bono ISR IMSS"), 0.0) * factor
+
+    extras = e["Puntualidad"] * factor
+    for columna in COLUMNAS_EXTRAS:
+        if columna != "Puntualidad":
+            extras = extras + e[columna]
+
+    ingreso_total = ingreso_flete + ingreso_cruce + np.where(e["Extras_Cobrados"], extras, 0.0)
+    costo_total = diesel_camion + diesel_termo + sueldo + bono + e["Casetas"] + extras + costo_cruce
+    indirectos = costos_indirectos(tipo, ingreso_total)
+    utilidad_bruta = ingreso_total - costo_total
+    utilidad_neta = utilidad_bruta - indirectos
+
+    con_ingreso = ingreso_total > 0
+    divisor = np.where(con_ingreso, ingreso_total, 1.0)
+
+    def porcentaje(valor):
+        return np.where(con_ingreso, valor / divisor * 100, 0.0)
+
+    forma = np.broadcast(ingreso_total, costo_diesel).shape
+    return {
+        "Tipo de cambio": tc_flete,
+        "Ingreso Flete": ingreso_flete,
+        "Tipo cambio Cruce": tc_cruce,
+        "Ingreso Cruce": ingreso_cruce,
+        "Ingreso Total": ingreso_total,
+        "Costo Cruce Convertido": costo_cruce,
+        "Pago por KM": pago_km,
+        "Sueldo_Operador": sueldo,
+        "Bono": bono,
+        "Costo_Diesel_Camion": diesel_camion,
+        "Costo_Diesel_Termo": diesel_termo,
+        "Costo_Extras": extras,
+        "Costo_Total_Ruta": costo_total,
+        "Costo Diesel": np.broadcast_to(costo_diesel, forma),
+        "Rendimiento Camion": np.broadcast_to(rendimiento_camion, forma),
+        "Rendimiento Termo": np.broadcast_to(rendimiento_termo, forma),
+        "Costos_Indirectos": indirectos,
+        "Utilidad_Bruta": utilidad_bruta,
+        "Utilidad_Neta": utilidad_neta,
+        "% Costo Directo": porcentaje(costo_total),
+        "% Utilidad Bruta": porcentaje(utilidad_bruta),
+        "% Utilidad Neta": porcentaje(utilidad_neta),
+    }
+
+
+def calcular(df: pd.DataFrame, parametros: dict) -> pd.DataFrame:
+    """
+    Copia de `df` (tramos de Rutas o Traficos) con COLUMNAS_DERIVADAS y
+    COLUMNAS_RENTABILIDAD recalculadas. `parametros`: Datos Generales; un valor
+    puede ser un arreglo de largo len(df) (parámetros distintos por fila).
+    """
+    salida = df.copy()
+    if salida.empty:
+        return salida
+    resultado = calcular_arreglos(entradas(salida), parametros)
+    for columna, valores in resultado.items():
+        salida[columna] = np.broadcast_to(valores, (len(salida),)).copy()
+    return salida
+
+
+def calcular_tramo(tramo: dict, parametros: dict) -> Dict[str, float]:
+    """Un solo tramo (formularios): mismas fórmulas, resultado como floats."""
+    resultado = calcular_arreglos(entradas(pd.DataFrame([tramo])), parametros)
+    return {columna: float(np.ravel(valores)[0]) for columna, valores in resultado.items()}
+
+
+def totales_viaje(tramos: pd.DataFrame) -> Dict[str, float]:
+    """
+    Totales de un viaje (IDA + regreso) con el ingreso y costo que guardó cada tramo;
+    indirectos con la misma regla del motor.
+    """
+    ingreso = _numero(tramos, "Ingreso Total")
+    costo = _numero(tramos, "Costo_Total_Ruta")
+    indirectos = costos_indirectos(_texto(tramos, "Tipo"), ingreso)
+    totales = {
+        "ingreso": float(ingreso.sum()),
+        "costo": float(costo.sum()),
+        "indirectos": float(indirectos.sum()),
+    }
+    totales["utilidad_bruta"] = totales["ingreso"] - totales["costo"]
+    totales["utilidad_neta"] = totales["utilidad_bruta"] - totales["indirectos"]
+    return totales
+
+
+def recalcular_rutas(df: pd.DataFrame, valores: dict) -> pd.DataFrame:
+    """Rutas con sus COLUMNAS_DERIVADAS al día con los Datos Generales `valores`."""
+    return calcular(df, valores).drop(columns=COLUMNAS_RENTABILIDAD)
+
+
+def parametros_de_filas(df: pd.DataFrame, respaldo: Optional[dict] = None) -> Dict[str, np.ndarray]:
+    """
+    Los Datos Generales con que se calculó cada fila, deducidos de lo que guardó
+    (Costo Diesel, Rendimientos, Tipo de cambio, Pago por KM, Bono, Sueldo). Lo que
+    la fila no permite deducir se toma de `respaldo`.
+    """
+    p = {**PARAMETROS_POR_DEFECTO, **(respaldo or {})}
+    e = entradas(df)
+    factor = np.where(e["Modo de Viaje"] == "TEAM", FACTOR_TEAM, 1.0)
+    cargado = (e["Tipo"] == "IMPORTACION") | (e["Tipo"] == "EXPORTACION")
+
+    def guardado(columna, defecto):
+        valor = _numero(df, columna)
+        return np.where(valor > 0, valor, float(defecto))
+
+    # El tipo de cambio USD sale del primer concepto en dólares que lo haya guardado
+    tc_respaldo = float(p["Tipo de cambio USD"])
+    costo_cruce = e["Costo Cruce"]
+    tc_costo_cruce = np.where(
+        (e["Moneda Costo Cruce"] == "USD") & (costo_cruce > 0),
+        _numero(df, "Costo Cruce Convertido") / np.where(costo_cruce > 0, costo_cruce, 1.0),
+        0.0,
+    )
+    tc_usd = np.where(
+        e["Moneda"] == "USD", guardado("Tipo de cambio", tc_respaldo),
+        np.where(e["Moneda_Cruce"] == "USD", guardado("Tipo cambio Cruce", tc_respaldo),
+                 np.where(tc_costo_cruce > 0, tc_costo_cruce, tc_respaldo)),
+    )
+    return {
+        "Costo Diesel": guardado("Costo Diesel", p["Costo Diesel"]),
+        "Rendimiento Camion": guardado("Rendimiento Camion", p["Rendimiento Camion"]),
+        "Rendimiento Termo": guardado("Rendimiento Termo", p["Rendimiento Termo"]),
+        "Pago x km IMPORTACION": guardado("Pago por KM", p["Pago x km IMPORTACION"]),
+        "Pago x km EXPORTACION": guardado("Pago por KM", p["Pago x km EXPORTACION"]),
+        "Bono ISR IMSS": np.where(cargado, guardado("Bono", p["Bono ISR IMSS"]) / factor, float(p["Bono ISR IMSS"])),
+        "Pago fijo VACIO": np.where(
+            ~cargado, guardado("Sueldo_Operador", p["Pago fijo VACIO"]) / factor, float(p["Pago fijo VACIO"])
+        ),
+        "Tipo de cambio USD": tc_usd,
+        "Tipo de cambio MXP": np.full(len(df), float(p["Tipo de cambio MXP"])),
+    }
+
+
+def rutas_a_repreciar(df: pd.DataFrame, valores: dict) -> pd.DataFrame:
+    """
+    Rutas de `df` cuyas COLUMNAS_DERIVADAS cambian con los Datos Generales `valores`,
+    ya recalculadas (una sola pasada sobre todas). Las que no cambian no se devuelven.
+    """
+    if df.empty:
+        return df
+    nuevas = recalcular_rutas(df, valores)
+    antes = df.reindex(columns=COLUMNAS_DERIVADAS).apply(pd.to_numeric, errors="coerce").fillna(0.0).to_numpy()
+    despues = nuevas[COLUMNAS_DERIVADAS].to_numpy(dtype=float)
+    return nuevas[(np.abs(despues - antes) > TOLERANCIA).any(axis=1)]
+
+
+def resumen_delta(antes: pd.DataFrame, despues: pd.DataFrame) -> pd.DataFrame:
+    """
+    Ingreso, costo y utilidad bruta antes/después por Tipo, con renglón TOTAL.
+    `antes` y `despues` son las mismas rutas (mismo índice).
+    """
+    def totales(df):
+        ingreso = pd.to_numeric(df["Ingreso Total"], errors="coerce").fillna(0.0)
+        costo = pd.to_numeric(df["Costo_Total_Ruta"], errors="coerce").fillna(0.0)
+        return pd.DataFrame({"Tipo": df["Tipo"], "Ingreso": ingreso, "Costo": costo, "Utilidad": ingreso - costo})
+
+    a = totales(antes).groupby("Tipo")[["Ingreso", "Costo", "Utilidad"]].sum()
+    d = totales(despues).groupby("Tipo")[["Ingreso", "Costo", "Utilidad"]].sum()
+    resumen = pd.DataFrame({
+        "Rutas": antes.groupby("Tipo").size(),
+        "Costo antes": a["Costo"],
+        "Costo después": d["Costo"],
+        "Δ Costo": d["Costo"] - a["Costo"],
+        "Δ Ingreso": d["Ingreso"] - a["Ingreso"],
+        "Δ Utilidad Bruta": d["Utilidad"] - a["Utilidad"],
+    })
+    resumen.loc["TOTAL"] = resumen.sum()
+    resumen["Rutas"] = resumen["Rutas"].astype(int)
+    return resumen
+
+
+# ---------- auditoría de deriva ----------
+
+AL_DIA = "Al día"
+DESACTUALIZADA = "Desactualizada"  # cuadra con sus propios parámetros, no con los actuales
+INCONSISTENTE = "Inconsistente"  # no cuadra ni con los suyos ni con los actuales
+
+
+def auditar_costos(df: pd.DataFrame, valores: dict) -> pd.DataFrame:
+    """
+    Por ruta: totales guardados contra el motor con los Datos Generales actuales y
+    con los parámetros guardados en la propia fila (parametros_de_filas). Dos pasadas
+    vectorizadas; `Δ Costo` es lo que cambiaría el costo guardado al recalcular hoy.
+    Costo_Extras también debe cuadrar: no depende de los Datos Generales, así que si
+    difiere la fila no se explica con ningún juego de parámetros (p. ej. una Puntualidad
+    Team contada dos veces).
+    """
+    if df.empty:
+        return pd.DataFrame(columns=[
+            "ID_Ruta", "Cliente", "Ruta", "Tipo", "Costo guardado", "Costo actual",
+            "Δ Costo", "Δ Ingreso", "Estado",
+        ])
+    e = entradas(df)
+    actual = calcular_arreglos(e, valores)
+    propio = calcular_arreglos(e, parametros_de_filas(df, valores))
+    costo = _numero(df, "Costo_Total_Ruta")
+    ingreso = _numero(df, "Ingreso Total")
+    extras = _numero(df, "Costo_Extras")
+
+    def cuadra(r):
+        return (
+            (np.abs(r["Costo_Total_Ruta"] - costo) <= TOLERANCIA)
+            & (np.abs(r["Ingreso Total"] - ingreso) <= TOLERANCIA)
+            & (np.abs(r["Costo_Extras"] - extras) <= TOLERANCIA)
+        )
+
+    estado = np.where(cuadra(actual), AL_DIA, np.where(cuadra(propio), DESACTUALIZADA, INCONSISTENTE))
+    return pd.DataFrame({
+        "ID_Ruta": df["ID_Ruta"].to_numpy(),
+        "Cliente": df["Cliente"].to_numpy(),
+        "Ruta": (df["Origen"].astype(str) + " → " + df["Destino"].astype(str)).to_numpy(),
+        "Tipo": e["Tipo"],
+        "Costo guardado": costo,
+        "Costo actual": actual["Costo_Total_Ruta"],
+        "Δ Costo": actual["Costo_Total_Ruta"] - costo,
+        "Δ Ingreso": actual["Ingreso Total"] - ingreso,
+        "Estado": estado,
+    }, index=df.index)
+
+
+def reporte_deriva(auditoria: pd.DataFrame, por: str = "Ruta") -> pd.DataFrame:
+    """Deriva agrupada por `por` ("Ruta" o "Cliente"), de mayor a menor |Δ Costo|."""
+    con_deriva = auditoria[auditoria["Estado"] != AL_DIA]
+    if con_deriva.empty:
+        return pd.DataFrame(columns=["Rutas", DESACTUALIZADA, INCONSISTENTE, "Δ Costo", "|Δ Costo|"])
+    reporte = con_deriva.assign(
+        **{"|Δ Costo|": con_deriva["Δ Costo"].abs(),
+           DESACTUALIZADA: con_deriva["Estado"] == DESACTUALIZADA,
+           INCONSISTENTE: con_deriva["Estado"] == INCONSISTENTE}
+    ).groupby(por).agg(
+        Rutas=("ID_Ruta", "size"),
+        **{DESACTUALIZADA: (DESACTUALIZADA, "sum"), INCONSISTENTE: (INCONSISTENTE, "sum")},
+        **{"Δ Costo": ("Δ Costo", "sum"), "|Δ Costo|": ("|Δ Costo|", "sum")},
+    )
+    return reporte.sort_values("|Δ Costo|", ascending=False)
+
+
+# ---------- sensibilidad ----------
+
+def barrido_sensibilidad(df: pd.DataFrame, base: dict, diesel, rendimientos, tipos_cambio,
+                         grupos: pd.Series, bloque: int = 2000):
+    """
+    Evalúa todas las rutas de `df` en la malla diésel x rendimiento camión x tipo de
+    cambio USD (el resto de parámetros sale de `base`). Rutas x escenarios se calcula
+    por broadcasting, en bloques de `bloque` rutas para acotar memoria, y se suma por
+    `grupos` (etiqueta por ruta, p. ej. el carril).
+
+    Devuelve (etiquetas, ingreso, utilidad_neta); los arreglos tienen forma
+    (grupos, len(diesel), len(rendimientos), len(tipos_cambio)).
+    """
+    diesel, rendimientos, tipos_cambio = (np.asarray(v, dtype=float) for v in (diesel, rendimientos, tipos_cambio))
+    forma = (len(diesel), len(rendimientos), len(tipos_cambio))
+    malla_diesel, malla_rend, malla_tc = np.meshgrid(diesel, rendimientos, tipos_cambio, indexing="ij")
+    parametros = {
+        **base,
+        "Costo Diesel": malla_diesel.ravel()[None, :],
+        "Rendimiento Camion": malla_rend.ravel()[None, :],
+        "Tipo de cambio USD": malla_tc.ravel()[None, :],
+    }
+    codigos, etiquetas = pd.factorize(grupos.to_numpy())
+    # Ordenadas por grupo, cada bloque se suma con reduceat (sin np.add.at fila por fila)
+    orden = np.argsort(codigos, kind="stable")
+    codigos = codigos[orden]
+    e = {k: v[orden] for k, v in entradas(df).items()}
+
+    ingreso = np.zeros((len(etiquetas), malla_diesel.size))
+    utilidad = np.zeros_like(ingreso)
+    for i in range(0, len(codigos), bloque):
+        tramo = slice(i, i + bloque)
+        r = calcular_arreglos({k: v[tramo, None] for k, v in e.items()}, parametros)
+        c = codigos[tramo]
+        inicios = np.flatnonzero(np.r_[True, c[1:] != c[:-1]])
+        ingreso[c[inicios]] += np.add.reduceat(np.broadcast_to(r["Ingreso Total"], (len(c), ingreso.shape[1])), inicios, axis=0)
+        utilidad[c[inicios]] += np.add.reduceat(r["Utilidad_Neta"], inicios, axis=0)
+    return etiquetas, ingreso.reshape(-1, *forma), utilidad.reshape(-1, *forma)
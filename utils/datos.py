@@ -0,0 +1,637 @@
+# utils/datos.py
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence, Union
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from utils.conexion import leer_config
+from utils.esquema import aplicar_esquema
+from utils.repositorio import COLUMNA_MODIFICACION, Filtro, columnas_select, obtener_repositorio
+from utils.retry import is_transient
+from utils import snapshot_disco
+from utils.circuit_breaker import CircuitoAbierto
+from utils.limitador import LimiteSaturado
+from utils.single_flight import SingleFlight
+
+# Llave primaria de cada tabla sincronizada
+CLAVES = {
+    "Rutas": "ID_Ruta",
+    "Traficos": "ID_Programacion",
+}
+
+# Cada cuánto se piden deltas y se concilian llaves aunque nadie escriba aquí
+INTERVALO_SYNC = 60.0
+# Sin updated_at no vemos ediciones externas por delta: recarga completa cada hora
+MAX_EDAD_COMPLETA = 3600.0
+# Lecturas filtradas o consultas que se guardan para servirlas si el backend se cae
+MAX_LECTURAS_RESPALDO = 32
+# Máximo de llaves por request con in_() (límite práctico de largo de URL)
+LOTE_LLAVES = 200
+
+# PostgREST corta en max-rows (1000 por defecto) si no se pide un rango
+TAM_PAGINA = int(leer_config("SUPABASE_PAGE_SIZE", 1000))
+HILOS_PAGINACION = int(leer_config("SUPABASE_PAGE_THREADS", 4))
+
+
+def backend_caido(exc: BaseException) -> bool:
+    """
+    Errores con los que conviene servir la última copia buena (o encolar la escritura)
+    en vez de fallar; incluye quedarse sin turno en el limitador con el backend sano.
+    """
+    return isinstance(exc, (CircuitoAbierto, LimiteSaturado)) or is_transient(exc)
+
+
+def _trozos(valores: list, n: int):
+    for i in range(0, len(valores), n):
+        yield valores[i:i + n]
+
+
+def _congelar_filtros(filtros: Optional[Sequence[Filtro]]) -> tuple:
+    """Filtros como tupla hasheable (las listas de in_() pasan a tupla)."""
+    return tuple(
+        (op, col, tuple(val) if isinstance(val, (list, set)) else val) for op, col, val in filtros or ()
+    )
+
+
+def _en_vuelo(llave: tuple, fn, tabla: str) -> pd.DataFrame:
+    """
+    Lecturas idénticas simultáneas (p. ej. todas las sesiones del turno abriendo
+    Rutas a la vez) comparten una sola llamada al backend.
+    """
+    df, compartido = _registro().vuelos.hacer(llave, fn, etiqueta=tabla)
+    # Quien espera recibe su copia; el que ejecutó se queda con el original
+    return df.copy() if compartido else df
+
+
+def leer_paginado(
+    tabla: str,
+    columnas: Union[str, Sequence[str]] = "*",
+    filtros: Optional[Sequence[Filtro]] = None,
+    orden: Optional[str] = None,
+    tam_pagina: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Lee todas las filas que cumplen los filtros en ventanas range(a, b).
+    La primera página trae el conteo exacto y el resto se pide en paralelo.
+    Si el servidor corta antes de tam_pagina (max-rows menor), se ajusta solo.
+    Las columnas salen ya tipadas según utils/esquema.py.
+    """
+    llave = ("paginado", tabla, columnas_select(columnas), _congelar_filtros(filtros), orden, tam_pagina)
+    return _en_vuelo(
+        llave, lambda: aplicar_esquema(tabla, _leer_paginado(tabla, columnas, filtros, orden, tam_pagina)), tabla
+    )
+
+
+def _leer_paginado(
+    tabla: str,
+    columnas: Union[str, Sequence[str]],
+    filtros: Optional[Sequence[Filtro]],
+    orden: Optional[str],
+    tam_pagina: Optional[int],
+) -> pd.DataFrame:
+    repo = obtener_repositorio()  # en el hilo del script; los workers lo reciben hecho
+    orden = orden or CLAVES.get(tabla)
+    n = tam_pagina or TAM_PAGINA
+    seleccion = columnas_select(columnas)
+
+    def consulta(inicio: int, contar: bool = False):
+        return repo.seleccionar(
+            tabla, seleccion, filtros=filtros, orden=orden, rango=(inicio, inicio + n - 1), contar=contar
+        )
+
+    primera = consulta(0, contar=True)
+    paginas = [pd.DataFrame(primera.data)]
+    total = primera.count or 0
+    if len(primera.data) < n and total > len(primera.data):
+        n = len(primera.data)  # el servidor tiene un max-rows menor
+    if not primera.data or total <= n:
+        return paginas[0]
+
+    def pagina(inicio: int) -> pd.DataFrame:
+        return pd.DataFrame(consulta(inicio).data)
+
+    with ThreadPoolExecutor(max_workers=HILOS_PAGINACION) as pool:
+        paginas.extend(pool.map(pagina, range(n, total, n)))
+
+    df = pd.concat(paginas, ignore_index=True)
+    clave = CLAVES.get(tabla)
+    if clave and clave in df.columns:
+        # Inserciones durante la lectura pueden desplazar una fila entre páginas
+        df = df.drop_duplicates(subset=[clave], keep="last", ignore_index=True)
+    return df
+
+
+def consultar(
+    tabla: str,
+    columnas: Union[str, Sequence[str]] = "*",
+    filtros: Optional[Sequence[Filtro]] = None,
+    orden: Optional[str] = None,
+    desc: bool = False,
+    limite: Optional[int] = None,
+) -> pd.DataFrame:
+    """Una sola consulta filtrada en el servidor (para lecturas chicas, p. ej. min/max)."""
+    seleccion = columnas_select(columnas)
+
+    def ejecutar() -> pd.DataFrame:
+        res = obtener_repositorio().seleccionar(tabla, seleccion, filtros=filtros, orden=orden, desc=desc, limite=limite)
+        return aplicar_esquema(tabla, pd.DataFrame(res.data))
+
+    llave = ("consulta", tabla, seleccion, _congelar_filtros(filtros), orden, desc, limite)
+    return _con_respaldo(llave, lambda: _en_vuelo(llave, ejecutar, tabla))
+
+
+class SnapshotTabla:
+    """
+    Copia local de una tabla (o de una proyección de columnas) compartida por
+    todas las sesiones del proceso. Después de la primera carga solo pide lo que cambió:
+    - filas con updated_at desde la última marca de agua vista (si la tabla lo tiene),
+    - llaves reportadas por las escrituras de la app (write-through),
+    - conciliación periódica de llaves para detectar altas/bajas externas.
+    Además se guarda en disco (utils/snapshot_disco.py): un proceso nuevo arranca
+    con esa copia y la concilia con el backend en segundo plano.
+    Si el backend está caído se sigue sirviendo la última copia buena
+    (desactualizado_desde indica desde cuándo).
+    """
+
+    def __init__(self, tabla: str, columnas: Optional[tuple] = None):
+        self.tabla = tabla
+        self.clave = CLAVES[tabla]
+        self.columnas = columnas
+        self.version = 0
+        self._version_cargada = -1
+        self._df = pd.DataFrame()
+        self._marca = None
+        self._columna_marca = None
+        self._cargado_en = 0.0
+        self._completa_en = 0.0  # time.time() de la última carga completa (se guarda en disco)
+        self._sync_en = 0.0
+        self._recarga_completa = True
+        self._probar_disco = True
+        self._reconciliando = threading.Event()
+        self._secuencia_disco = 0
+        self._al_dia_en = 0.0  # time.time() de la última lectura exitosa del backend
+        self.desactualizado_desde: Optional[float] = None
+        self._modificadas: set = set()
+        self._eliminadas: set = set()
+        self._lock_carga = threading.Lock()
+        self._lock_version = threading.Lock()
+
+    # ---------- escrituras ----------
+    def invalidar(self, claves: Optional[Iterable] = None, eliminadas: Optional[Iterable] = None) -> None:
+        with self._lock_version:
+            if claves is None and eliminadas is None:
+                self._recarga_completa = True
+            self._modificadas.update(claves or [])
+            self._eliminadas.update(eliminadas or [])
+            self.version += 1
+
+    # ---------- lectura ----------
+    def obtener(self) -> pd.DataFrame:
+        # Mientras se concilia en segundo plano la copia de disco, se sirve esa sin esperar,
+        # salvo que la app ya haya escrito en la tabla (ahí se espera la versión al día)
+        if self._reconciliando.is_set() and self._version_cargada == self.version:
+            return self._df.copy()
+        with self._lock_carga:
+            if self._probar_disco:
+                self._probar_disco = False
+                if self._cargar_de_disco():
+                    self._reconciliar_en_segundo_plano()
+                    return self._df.copy()
+            ahora = time.monotonic()
+            try:
+                if self._recarga_completa or (
+                    self._columna_marca != COLUMNA_MODIFICACION
+                    and ahora - self._cargado_en >= MAX_EDAD_COMPLETA
+                ):
+                    self._cargar_completa()
+                elif self._version_cargada != self.version or ahora - self._sync_en >= INTERVALO_SYNC:
+                    self._sincronizar(conciliar=ahora - self._sync_en >= INTERVALO_SYNC)
+            except Exception as exc:
+                if self._version_cargada < 0 or not backend_caido(exc):
+                    raise
+                # Backend caído: se sirve la última copia buena (la página muestra el aviso)
+                self.desactualizado_desde = self._al_dia_en
+            # Copia: las páginas modifican columnas sobre el DataFrame que reciben
+            return self._df.copy()
+
+    def _seleccion(self):
+        if self.columnas is None:
+            return "*"
+        cols = [self.clave] + [c for c in self.columnas if c != self.clave]
+        if tiene_columna_modificacion(self.tabla) and COLUMNA_MODIFICACION not in cols:
+            cols.append(COLUMNA_MODIFICACION)
+        return cols
+
+    def _tomar_pendientes(self):
+        with self._lock_version:
+            version = self.version
+            modificadas, self._modificadas = self._modificadas, set()
+            eliminadas, self._eliminadas = self._eliminadas, set()
+            self._recarga_completa = False
+        return version, modificadas, eliminadas
+
+    def _devolver_pendientes(self, modificadas: set, eliminadas: set, completa: bool) -> None:
+        # La lectura falló: lo pendiente queda para el siguiente intento
+        with self._lock_version:
+            self._modificadas |= modificadas
+            self._eliminadas |= eliminadas
+            self._recarga_completa = self._recarga_completa or completa
+
+    def _marcar_al_dia(self) -> None:
+        self._al_dia_en = time.time()
+        self.desactualizado_desde = None
+
+    def _cargar_completa(self) -> None:
+        version, modificadas, eliminadas = self._tomar_pendientes()
+        try:
+            df = leer_paginado(self.tabla, columnas=self._seleccion())
+        except Exception:
+            self._devolver_pendientes(modificadas, eliminadas, completa=True)
+            raise
+        # La llave no sirve de marca de agua: con IDs reservados por bloques (utils/ids.py)
+        # un proceso inserta IDs menores que los de otro. Sin updated_at, las altas
+        # externas llegan por la conciliación de llaves
+        self._columna_marca = COLUMNA_MODIFICACION if COLUMNA_MODIFICACION in df.columns else None
+        self._df = df
+        self._actualizar_marca()
+        self._version_cargada = version
+        self._cargado_en = self._sync_en = time.monotonic()
+        self._completa_en = time.time()
+        self._marcar_al_dia()
+        self._guardar_en_disco()
+
+    def _sincronizar(self, conciliar: bool) -> None:
+        version, modificadas, eliminadas = self._tomar_pendientes()
+        try:
+            self._aplicar_cambios(version, set(modificadas), eliminadas, conciliar)
+        except Exception:
+            self._devolver_pendientes(modificadas, eliminadas, completa=False)
+            raise
+
+    def _aplicar_cambios(self, version: int, modificadas: set, eliminadas: set, conciliar: bool) -> None:
+        df = self._df
+
+        # 1) Tombstones de borrados hechos por la app
+        if eliminadas and not df.empty:
+            df = df[~df[self.clave].isin(eliminadas)]
+
+        nuevas = []
+        # 2) Delta por marca de agua
+        if self._columna_marca and self._marca is not None:
+            delta = leer_paginado(self.tabla, columnas=self._seleccion(), filtros=[("gte", self._columna_marca, self._marca)])
+            nuevas.extend(delta.to_dict(orient="records"))
+
+        # 3) Conciliación de llaves: altas y bajas hechas fuera de este proceso
+        if conciliar:
+            llaves = leer_paginado(self.tabla, columnas=self.clave)
+            remotas = set(llaves[self.clave]) if not llaves.empty else set()
+            locales = set(df[self.clave]) if not df.empty else set()
+            df = df[df[self.clave].isin(remotas)] if not df.empty else df
+            modificadas |= remotas - locales
+
+        # 4) Filas tocadas por escrituras de la app (write-through)
+        modificadas -= eliminadas
+        if modificadas:
+            vistas = set()
+            for lote in _trozos(sorted(modificadas), LOTE_LLAVES):
+                filas = leer_paginado(
+                    self.tabla, columnas=self._seleccion(), filtros=[("in_", self.clave, lote)]
+                ).to_dict(orient="records")
+                vistas.update(f[self.clave] for f in filas)
+                nuevas.extend(filas)
+            # Si una llave reportada ya no existe, se borró por otra vía
+            faltantes = modificadas - vistas
+            if faltantes and not df.empty:
+                df = df[~df[self.clave].isin(faltantes)]
+
+        if nuevas:
+            # Las filas pasaron por dicts: se vuelven a tipar para no mezclar dtypes en el concat
+            delta = aplicar_esquema(self.tabla, pd.DataFrame(nuevas)).drop_duplicates(subset=[self.clave], keep="last")
+            if not df.empty:
+                df = df[~df[self.clave].isin(delta[self.clave])]
+            df = pd.concat([df, delta], ignore_index=True)
+
+        cambio = bool(nuevas) or len(df) != len(self._df)
+        self._df = df.sort_values(self.clave, ignore_index=True) if not df.empty else df
+        self._actualizar_marca()
+        self._version_cargada = version
+        self._sync_en = time.monotonic()
+        self._marcar_al_dia()
+        if cambio:
+            self._guardar_en_disco()
+
+    # ---------- copia en disco ----------
+    def _cargar_de_disco(self) -> bool:
+        guardado = snapshot_disco.cargar(self.tabla, self.columnas)
+        if guardado is None:
+            return False
+        df, meta = guardado
+        with self._lock_version:
+            if self._modificadas or self._eliminadas:
+                return False  # ya hubo escrituras: mejor una carga completa normal
+            self._recarga_completa = False
+            self._version_cargada = self.version
+        self._df = df
+        # Copias de versiones anteriores pueden traer la llave como marca: se descarta
+        self._columna_marca = meta.get("columna_marca") if meta.get("columna_marca") == COLUMNA_MODIFICACION else None
+        self._marca = meta.get("marca")
+        self._completa_en = float(meta.get("completa_en") or 0.0)
+        self._al_dia_en = float(meta.get("al_dia_en") or meta.get("guardado_en") or 0.0)
+        # La edad de la última carga completa sobrevive al reinicio (MAX_EDAD_COMPLETA)
+        self._cargado_en = time.monotonic() - max(0.0, time.time() - self._completa_en)
+        self._sync_en = 0.0
+        return True
+
+    def _reconciliar_en_segundo_plano(self) -> None:
+        self._reconciliando.set()
+        ctx = get_script_run_ctx()
+
+        def reconciliar():
+            try:
+                with self._lock_carga:
+                    if self._columna_marca is None:
+                        # Sin marca de agua no hay delta posible: se recarga entera
+                        self._cargar_completa()
+                    else:
+                        self._sincronizar(conciliar=True)
+            except Exception:
+                # La siguiente lectura normal vuelve a intentar (_sync_en sigue en 0)
+                self.desactualizado_desde = self._al_dia_en
+            finally:
+                self._reconciliando.clear()
+
+        hilo = threading.Thread(target=reconciliar, name=f"reconciliar-{self.tabla}", daemon=True)
+        add_script_run_ctx(hilo, ctx)
+        hilo.start()
+
+    def _guardar_en_disco(self) -> None:
+        self._secuencia_disco += 1
+        meta = {
+            "secuencia": self._secuencia_disco,
+            "marca": self._marca,
+            "columna_marca": self._columna_marca,
+            "completa_en": self._completa_en,
+            "al_dia_en": self._al_dia_en,
+        }
+        # Se escribe fuera del camino de la página; _df se reemplaza, nunca se modifica en sitio
+        threading.Thread(
+            target=snapshot_disco.guardar,
+            args=(self.tabla, self.columnas, self._df, meta),
+            daemon=True,
+        ).start()
+
+    def _actualizar_marca(self) -> None:
+        if self._columna_marca and not self._df.empty and self._columna_marca in self._df.columns:
+            self._marca = self._df[self._columna_marca].dropna().max()
+        else:
+            self._marca = None
+
+
+class FilasCompletas:
+    """
+    Filas completas (todas las columnas) pedidas bajo demanda por llave.
+    Se usa para el par de registros que el usuario abre después de elegir
+    en una lista proyectada.
+    """
+
+    def __init__(self, tabla: str):
+        self.tabla = tabla
+        self.clave = CLAVES[tabla]
+        self._filas: dict = {}
+        self._lock = threading.Lock()
+
+    def invalidar(self, claves: Optional[Iterable] = None, eliminadas: Optional[Iterable] = None) -> None:
+        with self._lock:
+            if claves is None and eliminadas is None:
+                self._filas.clear()
+            for k in list(claves or []) + list(eliminadas or []):
+                self._filas.pop(k, None)
+
+    def obtener(self, claves: Sequence) -> pd.DataFrame:
+        ahora = time.monotonic()
+        with self._lock:
+            faltantes = [
+                k for k in dict.fromkeys(claves)
+                if k not in self._filas or ahora - self._filas[k][0] >= INTERVALO_SYNC
+            ]
+        try:
+            for lote in _trozos(faltantes, LOTE_LLAVES):
+                df = leer_paginado(self.tabla, filtros=[("in_", self.clave, lote)])
+                with self._lock:
+                    for fila in df.to_dict(orient="records"):
+                        self._filas[fila[self.clave]] = (ahora, fila, time.time())
+        except Exception as exc:
+            # Con el backend caído sirven las filas ya vistas, aunque estén vencidas
+            with self._lock:
+                completas = all(k in self._filas for k in claves)
+            if not (completas and backend_caido(exc)):
+                raise
+            _marcar_desactualizado(f"filas:{self.tabla}", min(self._filas[k][2] for k in claves))
+        else:
+            _marcar_desactualizado(f"filas:{self.tabla}", None)
+        with self._lock:
+            filas = [self._filas[k][1] for k in dict.fromkeys(claves) if k in self._filas]
+        df = pd.DataFrame(filas)
+        return df.set_index(self.clave, drop=False) if not df.empty else df
+
+
+class _Registro:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshots: dict = {}
+        self.filas: dict = {}
+        self.modificacion: dict = {}
+        self.columnas: dict = {}
+        self.versiones: dict = {}
+        self.vuelos = SingleFlight()
+        # Últimas lecturas filtradas/consultas buenas, para servirlas con el backend caído
+        self.ultimas_lecturas: OrderedDict = OrderedDict()
+        # origen -> time.time() de los datos viejos que se están mostrando
+        self.desactualizados: dict = {}
+
+
+@st.cache_resource(show_spinner=False)
+def _registro() -> _Registro:
+    return _Registro()
+
+
+def _snapshot(tabla: str, columnas: Optional[tuple] = None) -> SnapshotTabla:
+    reg = _registro()
+    with reg.lock:
+        if (tabla, columnas) not in reg.snapshots:
+            reg.snapshots[(tabla, columnas)] = SnapshotTabla(tabla, columnas)
+        return reg.snapshots[(tabla, columnas)]
+
+
+def _filas(tabla: str) -> FilasCompletas:
+    reg = _registro()
+    with reg.lock:
+        if tabla not in reg.filas:
+            reg.filas[tabla] = FilasCompletas(tabla)
+        return reg.filas[tabla]
+
+
+def tiene_columna_modificacion(tabla: str) -> bool:
+    """Prueba una sola vez por proceso si la tabla tiene updated_at."""
+    reg = _registro()
+    if tabla not in reg.modificacion:
+        try:
+            obtener_repositorio().seleccionar(tabla, [COLUMNA_MODIFICACION], limite=1)
+            reg.modificacion[tabla] = True
+        except Exception as exc:
+            if backend_caido(exc):
+                return False  # no se sabe todavía; se vuelve a probar cuando responda
+            reg.modificacion[tabla] = False
+    return reg.modificacion[tabla]
+
+
+def columnas_tabla(tabla: str) -> List[str]:
+    """Nombres de columna de la tabla, leídos una sola vez por proceso (con una fila de muestra)."""
+    reg = _registro()
+    if tabla not in reg.columnas:
+        muestra = obtener_repositorio().seleccionar(tabla, limite=1).data
+        if not muestra:
+            return []  # tabla vacía: no hay de dónde sacarlas, se vuelve a probar la próxima vez
+        reg.columnas[tabla] = list(muestra[0].keys())
+    return reg.columnas[tabla]
+
+
+def version_tabla(tabla: str) -> int:
+    """Contador de escrituras hechas por la app sobre la tabla en este proceso."""
+    return _registro().versiones.get(tabla, 0)
+
+
+def estadisticas_lecturas() -> dict:
+    """Contadores de lecturas ejecutadas vs. coalescidas (single-flight) por tabla."""
+    return _registro().vuelos.estadisticas()
+
+
+def _marcar_desactualizado(origen: str, desde: Optional[float]) -> None:
+    reg = _registro()
+    with reg.lock:
+        if desde is None:
+            reg.desactualizados.pop(origen, None)
+        else:
+            reg.desactualizados[origen] = desde
+
+
+def datos_desactualizados_desde() -> Optional[float]:
+    """time.time() de los datos más viejos que se están sirviendo por una caída, o None."""
+    reg = _registro()
+    circuito = getattr(obtener_repositorio(), "circuito", None)
+    with reg.lock:
+        if circuito is not None and not circuito.abierto:
+            # El backend ya respondió: las lecturas sueltas se refrescan en su siguiente uso
+            reg.desactualizados.clear()
+        fechas = list(reg.desactualizados.values())
+        snapshots = list(reg.snapshots.values())
+    fechas += [s.desactualizado_desde for s in snapshots if s.desactualizado_desde is not None]
+    return min(fechas) if fechas else None
+
+
+def aviso_datos_desactualizados() -> None:
+    """Banner para las páginas: backend caído y datos servidos desde la última copia buena."""
+    desde = datos_desactualizados_desde()
+    circuito = getattr(obtener_repositorio(), "circuito", None)
+    if desde is not None:
+        fecha = datetime.fromtimestamp(desde).strftime("%d/%m/%Y %H:%M") if desde else "la última carga"
+        st.warning(
+            f"⚠️ Sin conexión con la base de datos: se muestran los datos guardados al {fecha}. "
+            "Cotizar y simular funciona; guardar cambios no, hasta que se restablezca."
+        )
+    elif circuito is not None and circuito.abierto:
+        hora = datetime.fromtimestamp(circuito.abierto_desde).strftime("%H:%M")
+        st.warning(f"⚠️ La base de datos no responde desde las {hora}. Modo solo lectura; se reintenta sola.")
+
+
+def cargar_tabla(tabla: str, columnas: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    Devuelve la tabla desde el snapshot compartido del proceso.
+    columnas: proyección declarada por la página (la llave siempre se incluye).
+    """
+    return _snapshot(tabla, tuple(columnas) if columnas else None).obtener()
+
+
+@st.cache_data(ttl=INTERVALO_SYNC, show_spinner=False)
+def _leer_filtrado(tabla: str, columnas, filtros: tuple, version: int) -> pd.DataFrame:
+    columnas = list(columnas) if columnas else "*"
+    # Un in_() con muchas llaves se parte en varias consultas para no exceder el largo de URL
+    for i, (op, col, val) in enumerate(filtros):
+        if op == "in_" and len(val) > LOTE_LLAVES:
+            resto = filtros[:i] + filtros[i + 1:]
+            partes = [
+                leer_paginado(tabla, columnas=columnas, filtros=resto + (("in_", col, lote),))
+                for lote in _trozos(list(val), LOTE_LLAVES)
+            ]
+            return pd.concat(partes, ignore_index=True)
+    return leer_paginado(tabla, columnas=columnas, filtros=filtros)
+
+
+def _con_respaldo(llave: tuple, leer) -> pd.DataFrame:
+    """
+    Ejecuta la lectura y guarda el resultado; si el backend está caído,
+    devuelve la última copia buena de esa misma lectura (y lo marca para el aviso).
+    """
+    reg = _registro()
+    origen = f"{llave[0]}:{llave[1]}"
+    try:
+        df = leer()
+    except Exception as exc:
+        with reg.lock:
+            ultima = reg.ultimas_lecturas.get(llave)
+        if ultima is None or not backend_caido(exc):
+            raise
+        _marcar_desactualizado(origen, ultima[0])
+        return ultima[1].copy()
+    with reg.lock:
+        reg.ultimas_lecturas[llave] = (time.time(), df.copy())
+        reg.ultimas_lecturas.move_to_end(llave)
+        while len(reg.ultimas_lecturas) > MAX_LECTURAS_RESPALDO:
+            reg.ultimas_lecturas.popitem(last=False)
+    _marcar_desactualizado(origen, None)
+    return df
+
+
+def leer_filtrado(
+    tabla: str,
+    columnas: Optional[Sequence[str]] = None,
+    filtros: Sequence[Filtro] = (),
+) -> pd.DataFrame:
+    """
+    Lectura con los filtros resueltos en el servidor (solo viajan las filas que cumplen),
+    cacheada entre sesiones hasta la siguiente escritura sobre la tabla.
+    """
+    filtros = _congelar_filtros(filtros)
+    columnas = tuple(columnas) if columnas else None
+    return _con_respaldo(
+        ("filtrado", tabla, columnas, filtros),
+        lambda: _leer_filtrado(tabla, columnas, filtros, version_tabla(tabla)),
+    )
+
+
+def cargar_filas(tabla: str, claves: Sequence) -> pd.DataFrame:
+    """Filas completas solo para las llaves pedidas, indexadas por la llave."""
+    return _filas(tabla).obtener(list(claves))
+
+
+def invalidar_tabla(tabla: str, claves: Optional[Iterable] = None, eliminadas: Optional[Iterable] = None) -> None:
+    """
+    Llamar después de cualquier insert/update/delete sobre la tabla.
+    claves: llaves insertadas o actualizadas; eliminadas: llaves borradas.
+    Sin ninguna de las dos se fuerza una recarga completa.
+    """
+    claves = list(claves) if claves is not None else None
+    eliminadas = list(eliminadas) if eliminadas is not None else None
+    reg = _registro()
+    with reg.lock:
+        reg.versiones[tabla] = reg.versiones.get(tabla, 0) + 1
+        snapshots = [s for (t, _), s in reg.snapshots.items() if t == tabla]
+    for snapshot in snapshots:
+        snapshot.invalidar(claves, eliminadas)
+    _filas(tabla).invalidar(claves, eliminadas)
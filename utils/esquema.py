@@ -0,0 +1,69 @@
+# utils/esquema.py
+from typing import Dict, List
+
+import pandas as pd
+
+# Las fechas se guardan como 'YYYY-MM-DD' (a veces con hora detrás: se toman los 10 primeros)
+FORMATO_FECHA = "%Y-%m-%d"
+
+# Montos, km, horas y parámetros: float64, vacío = 0
+_NUMERICAS_COMUNES = [
+    "KM", "Ingreso_Original", "Tipo de cambio", "Ingreso Flete", "Cruce_Original", "Tipo cambio Cruce",
+    "Ingreso Cruce", "Ingreso Total", "Costo Cruce", "Costo Cruce Convertido", "Pago por KM",
+    "Sueldo_Operador", "Bono", "Casetas", "Horas_Termo", "Lavado_Termo", "Movimiento_Local",
+    "Puntualidad", "Pension", "Estancia", "Fianza_Termo", "Renta_Termo", "Pistas_Extra", "Stop",
+    "Falso", "Gatas", "Accesorios", "Guias", "Costo_Diesel_Camion", "Costo_Diesel_Termo",
+    "Costo_Extras", "Costo_Total_Ruta", "Costo Diesel", "Rendimiento Camion", "Rendimiento Termo",
+]
+
+ESQUEMAS: Dict[str, dict] = {
+    "Rutas": {
+        "fechas": ["Fecha"],
+        "numericas": _NUMERICAS_COMUNES,
+        "booleanas": ["Extras_Cobrados"],
+    },
+    "Traficos": {
+        "fechas": ["Fecha", "Fecha_Cierre"],
+        "numericas": _NUMERICAS_COMUNES + [
+            "Bono_ISR_IMSS", "Costos_Indirectos", "Utilidad_Bruta", "Utilidad_Neta",
+        ],
+        "booleanas": ["Extras_Cobrados", "Ingreso_Cruce_Incluido"],
+    },
+}
+
+_VERDADEROS = {"true", "1", "1.0", "t", "si", "sí", "yes"}
+
+
+def _fechas(serie: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    texto = serie.where(serie.notna(), None).astype("string").str.slice(0, 10)
+    return pd.to_datetime(texto, format=FORMATO_FECHA, errors="coerce")
+
+
+def _booleanas(serie: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(serie):
+        return serie
+    return serie.astype("string").str.strip().str.lower().isin(_VERDADEROS).astype(bool)
+
+
+def aplicar_esquema(tabla: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Tipos de una sola vez, por columna (no por celda): fechas a datetime64 (vacío = NaT),
+    montos a float64 (vacío = 0) y banderas a bool (vacío = False). Solo toca las
+    columnas presentes (las proyecciones traen menos) y aplicarlo dos veces no cambia nada.
+    """
+    esquema = ESQUEMAS.get(tabla)
+    if esquema is None or df.empty:
+        return df
+    df = df.copy()
+    for columna in esquema["fechas"]:
+        if columna in df.columns:
+            df[columna] = _fechas(df[columna])
+    numericas: List[str] = [c for c in esquema["numericas"] if c in df.columns]
+    if numericas:
+        df[numericas] = df[numericas].apply(pd.to_numeric, errors="coerce").fillna(0.0).astype("float64")
+    for columna in esquema["booleanas"]:
+        if columna in df.columns:
+            df[columna] = _booleanas(df[columna])
+    return df
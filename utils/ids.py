@@ -0,0 +1,88 @@
+# utils/ids.py
+import logging
+import threading
+from typing import List
+
+import streamlit as st
+
+from utils.conexion import leer_config
+from utils.datos import backend_caido
+from utils.repositorio import Repositorio, obtener_repositorio
+
+logger = logging.getLogger(__name__)
+
+# Formato de cada secuencia: prefijo y dígitos (IG000001)
+FORMATOS = {
+    "Rutas": ("IG", 6),
+}
+
+
+class AsignadorIds:
+    """
+    Reparte IDs sin ir a la base en cada captura. Reserva bloques de `bloque`
+    números de forma atómica (reservar_ids) y los sirve desde memoria; dos procesos
+    nunca reciben el mismo bloque. Cuando al bloque le queda menos de una cuarta
+    parte se reserva el siguiente en segundo plano (sin demorar el guardado), así
+    una caída breve no deja sin IDs.
+    Los números que no se usan (reinicio del proceso) quedan como huecos.
+    """
+
+    def __init__(self, repo: Repositorio, nombre: str, bloque: int = 20):
+        self.repo = repo
+        self.nombre = nombre
+        self.prefijo, self.digitos = FORMATOS[nombre]
+        self.bloque = max(1, bloque)
+        self._rangos: List[List[int]] = []  # [siguiente, ultimo] en orden
+        self._rellenando = False  # hay un bloque anticipado en camino
+        self._lock = threading.Lock()
+
+    def _disponibles(self) -> int:
+        return sum(ultimo - siguiente + 1 for siguiente, ultimo in self._rangos)
+
+    def _reservar(self, cantidad: int) -> None:
+        ultimo = self.repo.reservar_ids(self.nombre, cantidad)
+        self._rangos.append([ultimo - cantidad + 1, ultimo])
+
+    def reservar(self, cantidad: int) -> List[str]:
+        """Toma `cantidad` IDs de una vez (importaciones masivas: a lo más una petición)."""
+        with self._lock:
+            faltan = cantidad - self._disponibles()
+            if faltan > 0:
+                self._reservar(max(faltan, self.bloque))
+            numeros = []
+            while len(numeros) < cantidad:
+                rango = self._rangos[0]
+                tomar = min(cantidad - len(numeros), rango[1] - rango[0] + 1)
+                numeros.extend(range(rango[0], rango[0] + tomar))
+                rango[0] += tomar
+                if rango[0] > rango[1]:
+                    self._rangos.pop(0)
+            anticipar = not self._rellenando and self._disponibles() < self.bloque / 4
+            self._rellenando = self._rellenando or anticipar
+        if anticipar:
+            threading.Thread(target=self._rellenar, name=f"ids-{self.nombre}", daemon=True).start()
+        return [f"{self.prefijo}{n:0{self.digitos}d}" for n in numeros]
+
+    def _rellenar(self) -> None:
+        # La petición va fuera del lock: las capturas siguen tomando lo que hay en memoria
+        try:
+            ultimo = self.repo.reservar_ids(self.nombre, self.bloque)
+        except Exception as exc:
+            # Con el backend caído todavía alcanza con lo que hay; la siguiente captura reintenta
+            if not backend_caido(exc):
+                logger.warning("No se pudo reservar el siguiente bloque de %s", self.nombre, exc_info=exc)
+            with self._lock:
+                self._rellenando = False
+            return
+        with self._lock:
+            self._rangos.append([ultimo - self.bloque + 1, ultimo])
+            self._rellenando = False
+
+    def siguiente(self) -> str:
+        return self.reservar(1)[0]
+
+
+@st.cache_resource(show_spinner=False)
+def obtener_asignador(nombre: str = "Rutas") -> AsignadorIds:
+    """Un asignador por tabla y proceso; IDS_BLOQUE en secrets cambia el tamaño del bloque."""
+    return AsignadorIds(obtener_repositorio(), nombre, int(leer_config("IDS_BLOQUE", 20)))
@@ -0,0 +1,95 @@
+# utils/limitador.py
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+from utils.retry import RechazoLocal, is_overload
+
+T = TypeVar("T")
+
+
+class LimiteSaturado(RechazoLocal):
+    """
+    Se acabó el plazo esperando turno: la saturación es de este proceso, el backend
+    no recibió nada. Ni se reintenta ni cuenta como falla para el circuit breaker.
+    """
+
+
+class LimitadorAdaptativo:
+    """
+    Límite de peticiones simultáneas al backend para todo el proceso (AIMD):
+    - cada respuesta buena sube el límite ~1 por ventana completa (+1/límite),
+    - un 429/503 (o pool agotado en PostgREST) lo baja a la mitad, como mucho
+      una vez por `enfriamiento` segundos para que una ráfaga no lo desplome.
+    Las peticiones que no caben esperan en cola en vez de golpear la API.
+    """
+
+    def __init__(self, inicial: int = 8, minimo: int = 1, maximo: int = 20, enfriamiento: float = 1.0):
+        self.minimo = max(1, minimo)
+        self.maximo = max(self.minimo, maximo)
+        self.enfriamiento = enfriamiento
+        self._limite = float(min(max(inicial, self.minimo), self.maximo))
+        self._en_curso = 0
+        self._en_espera = 0
+        self._reducido_en = 0.0
+        self.reducciones = 0
+        self.rechazos = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limite(self) -> int:
+        return int(self._limite)
+
+    def adquirir(self, timeout: Optional[float] = None) -> None:
+        limite_espera = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            self._en_espera += 1
+            try:
+                while self._en_curso >= self.limite:
+                    restante = None if limite_espera is None else limite_espera - time.monotonic()
+                    if restante is not None and restante <= 0:
+                        self.rechazos += 1
+                        raise LimiteSaturado(
+                            f"Sin turno para consultar la base de datos ({self._en_curso} en curso, límite {self.limite})"
+                        )
+                    self._cond.wait(restante)
+                self._en_curso += 1
+            finally:
+                self._en_espera -= 1
+
+    def liberar(self, exito: bool = True, sobrecarga: bool = False) -> None:
+        """Otros errores (404, conexión caída...) no mueven el límite."""
+        with self._cond:
+            self._en_curso -= 1
+            ahora = time.monotonic()
+            if sobrecarga:
+                if ahora - self._reducido_en >= self.enfriamiento:
+                    self._limite = max(float(self.minimo), self._limite / 2)
+                    self._reducido_en = ahora
+                    self.reducciones += 1
+            elif exito:
+                self._limite = min(float(self.maximo), self._limite + 1 / self._limite)
+            self._cond.notify_all()
+
+    def ejecutar(self, fn: Callable[[], T], timeout: Optional[float] = None) -> T:
+        self.adquirir(timeout)
+        exito = sobrecarga = False
+        try:
+            resultado = fn()
+            exito = True
+            return resultado
+        except Exception as exc:
+            sobrecarga = is_overload(exc)
+            raise
+        finally:
+            self.liberar(exito, sobrecarga)
+
+    def estado(self) -> dict:
+        with self._cond:
+            return {
+                "limite": self.limite,
+                "en_curso": self._en_curso,
+                "en_espera": self._en_espera,
+                "reducciones": self.reducciones,
+                "rechazos": self.rechazos,
+            }
@@ -0,0 +1,198 @@
+# utils/lote_escritura.py
+import threading
+import time
+from typing import Any, Iterable, List, Optional, Tuple, Union
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from utils.cola_escritura import APLICADA, ENCOLADA, ColaEscritura, notificar, obtener_cola
+from utils.repositorio import LLAVES
+
+# Filas por petición; PostgREST acepta más, pero un lote enorme tarda y falla entero
+TAM_MAXIMO = 500
+# Segundos que se juntan escrituras antes de mandarlas solas (además del fin del bloque with)
+VENTANA = 2.0
+
+
+class ResultadoLote:
+    """Qué pasó con cada fila: aplicadas, en cola (sin conexión) o rechazadas con su error."""
+
+    def __init__(self):
+        self.aplicadas = 0
+        self.encoladas = 0
+        self.peticiones = 0  # llamadas de escritura (una por bloque o mitad), sin contar reintentos
+        self.errores: List[Tuple[Any, str]] = []  # (llave o fila, mensaje)
+        # Inserts/upserts por llave: guardadas = escritas, omitidas = ya existían (ignorar_duplicados)
+        self.guardadas: List[Any] = []
+        self.omitidas: List[Any] = []
+
+    @property
+    def estado(self) -> str:
+        return ENCOLADA if self.encoladas else APLICADA
+
+
+class LoteEscritura:
+    """
+    Junta las escrituras de una acción del usuario y las manda en bloque:
+    una petición por tabla y operación en vez de una por fila.
+
+        with LoteEscritura() as lote:
+            for fila in filas:
+                lote.insertar("Traficos", fila)
+        notificar_lote(lote.resultado, "✅ Guardado.")
+
+    Se envía al salir del bloque, al llegar a `tam_maximo` filas o cuando pasan `ventana`
+    segundos desde la primera (un timer lo manda aunque no llegue otra escritura). Cada bloque pasa por la cola de escritura (sin conexión
+    queda en cola entero). Si el backend rechaza un bloque por sus datos, se parte en
+    mitades hasta aislar las filas con error; las demás sí se guardan.
+    """
+
+    def __init__(self, cola: Optional[ColaEscritura] = None, tam_maximo: int = TAM_MAXIMO, ventana: float = VENTANA):
+        self.cola = cola or obtener_cola()
+        self.tam_maximo = max(1, tam_maximo)
+        self.ventana = ventana
+        self.resultado = ResultadoLote()
+        # Grupos consecutivos [tabla, operacion, valores, items]; el orden entre grupos se respeta
+        self._grupos: List[list] = []
+        self._total = 0
+        self._primera: Optional[float] = None
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        # Un envío a la vez (el del timer y el del bloque with no se cruzan en `resultado`)
+        self._lock_envio = threading.Lock()
+
+    # ---------- operaciones ----------
+    def insertar(self, tabla: str, filas: Union[dict, Iterable[dict]]) -> None:
+        self._agregar(tabla, "insertar", None, _como_lista(filas))
+
+    def upsert(self, tabla: str, filas: Union[dict, Iterable[dict]], ignorar_duplicados: bool = False) -> None:
+        """ignorar_duplicados: las filas cuya llave ya existe se dejan como están."""
+        self._agregar(tabla, "insertar_nuevas" if ignorar_duplicados else "upsert", None, _como_lista(filas))
+
+    def actualizar(self, tabla: str, claves: Union[Any, Iterable[Any]], valores: dict) -> None:
+        """Mismos valores para varias llaves: un solo update con in_."""
+        self._agregar(tabla, "actualizar", valores, _como_claves(claves))
+
+    def eliminar(self, tabla: str, claves: Union[Any, Iterable[Any]]) -> None:
+        self._agregar(tabla, "eliminar", None, _como_claves(claves))
+
+    def _agregar(self, tabla: str, operacion: str, valores: Optional[dict], items: list) -> None:
+        if operacion in ("actualizar", "eliminar") and tabla not in LLAVES:
+            raise ValueError(f"{tabla} no tiene llave primaria registrada en LLAVES")
+        if not items:
+            return
+        with self._lock:
+            ultimo = self._grupos[-1] if self._grupos else None
+            if ultimo and ultimo[:3] == [tabla, operacion, valores]:
+                ultimo[3].extend(items)
+            else:
+                self._grupos.append([tabla, operacion, valores, list(items)])
+            self._total += len(items)
+            if self._primera is None:
+                self._primera = time.monotonic()
+                self._programar_envio()
+            vencido = self.ventana is not None and time.monotonic() - self._primera >= self.ventana
+            lleno = self._total >= self.tam_maximo
+        if lleno or vencido:
+            self.enviar()
+
+    def _programar_envio(self) -> None:
+        # Sin este timer una escritura suelta esperaría al fin del bloque with
+        if self.ventana is None:
+            return
+        self._timer = threading.Timer(self.ventana, self.enviar)
+        self._timer.daemon = True
+        add_script_run_ctx(self._timer, get_script_run_ctx())
+        self._timer.start()
+
+    def _cancelar_envio(self) -> None:
+        # Se llama con self._lock tomado
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    # ---------- envío ----------
+    def enviar(self) -> ResultadoLote:
+        with self._lock_envio:
+            with self._lock:
+                grupos, self._grupos = self._grupos, []
+                self._total, self._primera = 0, None
+                self._cancelar_envio()
+            for tabla, operacion, valores, items in grupos:
+                for i in range(0, len(items), self.tam_maximo):
+                    self._enviar_bloque(tabla, operacion, valores, items[i:i + self.tam_maximo])
+        return self.resultado
+
+    def _enviar_bloque(self, tabla: str, operacion: str, valores: Optional[dict], items: list) -> None:
+        self.resultado.peticiones += 1
+        try:
+            if operacion in ("actualizar", "eliminar"):
+                filtros = [("in_", LLAVES[tabla], items)]
+                estado, filas = self.cola.escribir_detalle(tabla, operacion, valores, filtros)
+            else:
+                estado, filas = self.cola.escribir_detalle(tabla, operacion, items)
+        except Exception as exc:
+            # escribir() solo lanza errores de datos: se busca la fila culpable por bisección
+            if len(items) == 1:
+                self.resultado.errores.append((_identificar(tabla, items[0]), str(exc)))
+                return
+            mitad = len(items) // 2
+            self._enviar_bloque(tabla, operacion, valores, items[:mitad])
+            self._enviar_bloque(tabla, operacion, valores, items[mitad:])
+            return
+        if estado == ENCOLADA:
+            self.resultado.encoladas += len(items)
+            return
+        if operacion in ("actualizar", "eliminar"):
+            self.resultado.aplicadas += len(items)
+            return
+        claves = [_identificar(tabla, fila) for fila in items]
+        if operacion == "insertar_nuevas":
+            # El backend solo devuelve las filas que sí insertó
+            escritas = {_identificar(tabla, fila) for fila in filas or ()}
+            self.resultado.omitidas.extend(c for c in claves if c not in escritas)
+            claves = [c for c in claves if c in escritas]
+        self.resultado.guardadas.extend(claves)
+        self.resultado.aplicadas += len(claves)
+
+    def __enter__(self) -> "LoteEscritura":
+        return self
+
+    def __exit__(self, tipo, valor, traza) -> None:
+        # Si la acción falló a medias no se manda lo acumulado (lo que ya venció la ventana sí se mandó)
+        if tipo is None:
+            self.enviar()
+        else:
+            with self._lock:
+                self._grupos, self._total, self._primera = [], 0, None
+                self._cancelar_envio()
+        # Espera un envío del timer que ya estuviera en curso: al salir, resultado está completo
+        with self._lock_envio:
+            pass
+
+
+def _como_lista(filas: Union[dict, Iterable[dict]]) -> list:
+    return [filas] if isinstance(filas, dict) else list(filas)
+
+
+def _como_claves(claves: Union[Any, Iterable[Any]]) -> list:
+    if isinstance(claves, (str, bytes)) or not isinstance(claves, Iterable):
+        return [claves]
+    return list(claves)
+
+
+def _identificar(tabla: str, item: Any) -> Any:
+    if isinstance(item, dict):
+        return item.get(LLAVES.get(tabla), item)
+    return item
+
+
+def notificar_lote(resultado: ResultadoLote, mensaje: str) -> None:
+    """Éxito/cola como notificar() y, aparte, cada fila que el backend rechazó."""
+    if resultado.errores:
+        st.error(f"❌ {len(resultado.errores)} registro(s) no se guardaron:")
+        for llave, error in resultado.errores:
+            st.write(f"- {llave}: {error}")
+    if resultado.aplicadas or resultado.encoladas:
+        notificar(resultado.estado, mensaje)
@@ -0,0 +1,148 @@
+# utils/montecarlo.py
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.costos import TOLERANCIA, calcular_arreglos, entradas, parametros_de_filas
+
+# Columnas de Traficos que usa el ajuste (proyección para cargar_tabla)
+COLUMNAS_HISTORIAL = [
+    "ID_Programacion", "Tipo", "Origen", "Destino", "Moneda", "Tipo de cambio",
+    "Costo Diesel", "Horas_Termo", "Costo_Extras",
+]
+# Columnas de Rutas con lo planeado por carril (Traficos no guarda de qué ruta salió)
+COLUMNAS_PLAN = ["Tipo", "Origen", "Destino", "Costo_Extras"]
+
+# Con menos observaciones que esto se usan las dispersiones de respaldo
+MIN_MUESTRAS = 20
+SIGMA_DIESEL = 0.08
+SIGMA_TIPO_CAMBIO = 0.05
+SIGMA_HORAS_TERMO = 0.25
+
+SIMULACIONES = 10000
+
+
+def _sigma_log(valores: np.ndarray, respaldo: float) -> float:
+    valores = valores[np.isfinite(valores) & (valores > 0)]
+    if len(valores) < MIN_MUESTRAS:
+        return respaldo
+    return float(np.std(np.log(valores)))
+
+
+def _carril(df: pd.DataFrame) -> pd.Series:
+    return (df["Tipo"].astype(str).str.strip().str.upper() + "|"
+            + df["Origen"].astype(str).str.strip().str.upper() + "→"
+            + df["Destino"].astype(str).str.strip().str.upper())
+
+
+def _extras_planeados(historial: pd.DataFrame, rutas: pd.DataFrame) -> np.ndarray:
+    """Costo_Extras planeado para el carril de cada tráfico (mediana de sus Rutas); NaN si no hay rutas del carril."""
+    if rutas is None or rutas.empty:
+        return np.full(len(historial), np.nan)
+    plan = pd.to_numeric(rutas["Costo_Extras"], errors="coerce").fillna(0.0).groupby(_carril(rutas).to_numpy()).median()
+    return _carril(historial).map(plan).to_numpy(dtype=float)
+
+
+def ajustar_distribuciones(historial: pd.DataFrame, rutas: Optional[pd.DataFrame] = None) -> dict:
+    """
+    Dispersión observada en Traficos, para centrarla después en los Datos Generales de hoy:
+    - diésel y tipo de cambio USD: desviación del log del valor guardado en cada tráfico;
+    - horas de termo: desviación del log respecto a la mediana de su carril;
+    - extras no planeados, por Tipo: lo que el Costo_Extras de cada tráfico excede a lo
+      planeado en las `rutas` de su carril (COLUMNAS_PLAN). Probabilidad de exceso y
+      montos observados (se remuestrean tal cual); sin rutas del carril no se cuenta.
+    """
+    def numero(columna):
+        if historial.empty or columna not in historial.columns:
+            return np.zeros(0)
+        return pd.to_numeric(historial[columna], errors="coerce").to_numpy(dtype=float)
+
+    # Tipo de cambio de los fletes en dólares (un 1.0 es un MXP mal etiquetado)
+    tipo_cambio = numero("Tipo de cambio")
+    if len(tipo_cambio):
+        tipo_cambio = tipo_cambio[historial["Moneda"].astype(str).str.upper().eq("USD").to_numpy() & (tipo_cambio > 1)]
+    distribuciones = {
+        "sigma_diesel": _sigma_log(numero("Costo Diesel"), SIGMA_DIESEL),
+        "sigma_tipo_cambio": _sigma_log(tipo_cambio, SIGMA_TIPO_CAMBIO),
+        "sigma_horas_termo": SIGMA_HORAS_TERMO,
+        "extras": {},
+        "muestras": len(historial),
+    }
+    if historial.empty:
+        return distribuciones
+
+    horas = numero("Horas_Termo")
+    carril = historial["Origen"].astype(str) + "→" + historial["Destino"].astype(str)
+    con_horas = horas > 0
+    if con_horas.sum() >= MIN_MUESTRAS:
+        mediana = pd.Series(horas[con_horas]).groupby(carril[con_horas].to_numpy()).transform("median").to_numpy()
+        relativas = horas[con_horas] / mediana
+        # Solo carriles con más de un viaje aportan dispersión
+        repetidos = carril[con_horas].duplicated(keep=False).to_numpy()
+        distribuciones["sigma_horas_termo"] = _sigma_log(relativas[repetidos], SIGMA_HORAS_TERMO)
+
+    # Lo planeado ya está en los extras de cada tramo: solo el exceso es incertidumbre
+    exceso = np.nan_to_num(numero("Costo_Extras")) - _extras_planeados(historial, rutas)
+    con_plan = np.isfinite(exceso)
+    exceso = np.where(exceso[con_plan] > TOLERANCIA, exceso[con_plan], 0.0)
+    tipos = historial["Tipo"].astype(str).str.upper().to_numpy()[con_plan]
+    for tipo in np.unique(tipos):
+        del_tipo = exceso[tipos == tipo]
+        if len(del_tipo) >= MIN_MUESTRAS:
+            distribuciones["extras"][tipo] = (float((del_tipo > 0).mean()), del_tipo[del_tipo > 0])
+    return distribuciones
+
+
+def simular(tramos: pd.DataFrame, valores: dict, distribuciones: dict,
+            n: int = SIMULACIONES, semilla: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    `n` escenarios de la combinación de `tramos` (una ruta o una vuelta redonda), todos
+    en una pasada del motor de costos con forma (tramos, n). Diésel y tipo de cambio son
+    comunes a los tramos de un mismo escenario (lognormal centrada en `valores`); horas
+    de termo y extras no planeados varían por tramo. El resto de parámetros son los
+    guardados en cada tramo. Los extras no planeados son costo puro: no se cobran al
+    cliente aunque el tramo tenga Extras_Cobrados.
+
+    Devuelve arreglos de largo n: "ingreso", "utilidad_neta" y "margen" (% utilidad neta).
+    """
+    rng = np.random.default_rng(semilla)
+    n_tramos = len(tramos)
+    e = {k: v[:, None] for k, v in entradas(tramos).items()}
+
+    parametros = {k: np.asarray(v)[:, None] for k, v in parametros_de_filas(tramos, valores).items()}
+    diesel = float(valores.get("Costo Diesel", parametros["Costo Diesel"].mean()))
+    tipo_cambio = float(valores.get("Tipo de cambio USD", parametros["Tipo de cambio USD"].mean()))
+    parametros["Costo Diesel"] = diesel * rng.lognormal(0.0, distribuciones["sigma_diesel"], (1, n))
+    parametros["Tipo de cambio USD"] = tipo_cambio * rng.lognormal(0.0, distribuciones["sigma_tipo_cambio"], (1, n))
+
+    # Factor con media 1: las horas planeadas siguen siendo el valor esperado
+    sigma = distribuciones["sigma_horas_termo"]
+    e["Horas_Termo"] = e["Horas_Termo"] * rng.lognormal(-sigma ** 2 / 2, sigma, (n_tramos, n))
+
+    # Extras no planeados (estancias, maniobras...) por encima de lo planeado en el tramo
+    no_planeados = np.zeros((n_tramos, n))
+    for t, tipo in enumerate(e["Tipo"][:, 0]):
+        if tipo in distribuciones["extras"]:
+            probabilidad, montos = distribuciones["extras"][tipo]
+            if len(montos):
+                no_planeados[t] = (rng.random(n) < probabilidad) * rng.choice(montos, n)
+
+    r = calcular_arreglos(e, parametros)
+    ingreso = np.broadcast_to(r["Ingreso Total"], (n_tramos, n)).sum(axis=0)
+    # Solo costo: no mueven el ingreso ni, por tanto, los indirectos
+    utilidad = (r["Utilidad_Neta"] - no_planeados).sum(axis=0)
+    margen = np.where(ingreso > 0, utilidad / np.where(ingreso > 0, ingreso, 1.0) * 100, np.nan)
+    return {"ingreso": ingreso, "utilidad_neta": utilidad, "margen": margen}
+
+
+def resumen(simulacion: Dict[str, np.ndarray]) -> Dict[str, float]:
+    """P5/P50/P95 del % de utilidad neta, utilidad neta media y probabilidad de pérdida."""
+    p5, p50, p95 = np.nanpercentile(simulacion["margen"], [5, 50, 95])
+    return {
+        "P5": float(p5),
+        "P50": float(p50),
+        "P95": float(p95),
+        "utilidad_media": float(simulacion["utilidad_neta"].mean()),
+        "prob_perdida": float((simulacion["utilidad_neta"] < 0).mean()),
+    }
@@ -0,0 +1,513 @@
+# utils/repositorio.py
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Any, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import streamlit as st
+
+from utils.circuit_breaker import CircuitBreaker
+from utils.conexion import DEFAULT_POOL_SIZE, leer_config, obtener_supabase
+from utils.limitador import LimitadorAdaptativo
+from utils.retry import hedged, is_transient, retry_with_backoff
+
+# Filtros declarativos: (operador, columna, valor), p. ej. ("gte", "Fecha_Cierre", "2024-01-01").
+# "not_is" se traduce a .not_.is_() y "or" a .or_(valor) (la columna se ignora).
+Filtro = tuple
+
+# Llave primaria de cada tabla (el backend local la usa al crear la tabla)
+LLAVES = {
+    "Rutas": "ID_Ruta",
+    "Traficos": "ID_Programacion",
+    "Usuarios": "ID_Usuario",
+}
+
+# Columna de "última modificación" (trigger en Supabase); el backend local la sella en cada escritura
+COLUMNA_MODIFICACION = "updated_at"
+
+_IDENTIFICADOR = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+class Resultado(NamedTuple):
+    """Misma forma que la respuesta de supabase-py: .data (lista de dicts) y .count."""
+    data: List[dict]
+    count: Optional[int] = None
+
+
+def columnas_select(columnas: Union[str, Sequence[str]]) -> str:
+    """Arma el parámetro select; postgrest-py borra espacios fuera de comillas."""
+    if isinstance(columnas, str):
+        return columnas
+    return ",".join(c if _IDENTIFICADOR.fullmatch(c) else f'"{c}"' for c in columnas)
+
+
+def aplicar_filtros(q, filtros: Optional[Sequence[Filtro]]):
+    for op, columna, valor in filtros or ():
+        if op == "not_is":
+            q = q.not_.is_(columna, valor)
+        elif op == "or":
+            q = q.or_(valor)
+        else:
+            q = getattr(q, op)(columna, valor)
+    return q
+
+
+class Repositorio:
+    """
+    Operaciones de persistencia que usan las páginas. Los filtros son los mismos
+    (operador, columna, valor) de utils/datos.py para cualquier backend.
+    """
+
+    nombre = "base"
+
+    def seleccionar(
+        self,
+        tabla: str,
+        columnas: Union[str, Sequence[str]] = "*",
+        filtros: Optional[Sequence[Filtro]] = None,
+        orden: Optional[str] = None,
+        desc: bool = False,
+        limite: Optional[int] = None,
+        rango: Optional[Tuple[int, int]] = None,
+        contar: bool = False,
+    ) -> Resultado:
+        raise NotImplementedError
+
+    def insertar(self, tabla: str, filas: Union[dict, List[dict]]) -> List[dict]:
+        raise NotImplementedError
+
+    def upsertar(self, tabla: str, filas: Union[dict, List[dict]], ignorar_duplicados: bool = False) -> List[dict]:
+        """Insert por llave primaria: la fila existente se actualiza (o se deja igual con ignorar_duplicados)."""
+        raise NotImplementedError
+
+    def actualizar(self, tabla: str, valores: dict, filtros: Sequence[Filtro]) -> List[dict]:
+        raise NotImplementedError
+
+    def eliminar(self, tabla: str, filtros: Sequence[Filtro]) -> List[dict]:
+        raise NotImplementedError
+
+    def reservar_ids(self, nombre: str, cantidad: int) -> int:
+        """Reserva atómica de `cantidad` números; devuelve el último del bloque (ver sql/reservar_ids.sql)."""
+        raise NotImplementedError
+
+
+def _exigir_filtros(filtros: Sequence[Filtro], operacion: str) -> None:
+    # PostgREST rechaza update/delete sin filtro; el backend local hace lo mismo
+    if not filtros:
+        raise ValueError(f"{operacion} sin filtros no está permitido")
+
+
+class RepositorioSupabase(Repositorio):
+    nombre = "supabase"
+
+    def __init__(self, cliente=None):
+        self.cliente = cliente or obtener_supabase()
+
+    def seleccionar(self, tabla, columnas="*", filtros=None, orden=None, desc=False,
+                    limite=None, rango=None, contar=False) -> Resultado:
+        q = self.cliente.table(tabla).select(columnas_select(columnas), count="exact" if contar else None)
+        q = aplicar_filtros(q, filtros)
+        if orden:
+            q = q.order(orden, desc=desc)
+        if rango:
+            q = q.range(*rango)
+        if limite:
+            q = q.limit(limite)
+        res = q.execute()
+        return Resultado(res.data, res.count)
+
+    def insertar(self, tabla, filas) -> List[dict]:
+        return self.cliente.table(tabla).insert(filas).execute().data
+
+    def upsertar(self, tabla, filas, ignorar_duplicados=False) -> List[dict]:
+        # Con ignore_duplicates PostgREST solo devuelve las filas que sí insertó
+        return self.cliente.table(tabla).upsert(
+            filas, on_conflict=LLAVES.get(tabla, ""), ignore_duplicates=ignorar_duplicados
+        ).execute().data
+
+    def actualizar(self, tabla, valores, filtros) -> List[dict]:
+        _exigir_filtros(filtros, "update")
+        return aplicar_filtros(self.cliente.table(tabla).update(valores), filtros).execute().data
+
+    def eliminar(self, tabla, filtros) -> List[dict]:
+        _exigir_filtros(filtros, "delete")
+        return aplicar_filtros(self.cliente.table(tabla).delete(), filtros).execute().data
+
+    def reservar_ids(self, nombre, cantidad) -> int:
+        return int(self.cliente.rpc("reservar_ids", {"p_nombre": nombre, "p_cantidad": cantidad}).execute().data)
+
+
+# ---------- Backend local (SQLite) ----------
+
+def _cita(nombre: str) -> str:
+    return '"' + nombre.replace('"', '""') + '"'
+
+
+def _partir(texto: str, separador: str = ",") -> List[str]:
+    """Parte en el separador ignorando lo que va entre comillas o paréntesis."""
+    partes, actual, comillas, nivel = [], "", False, 0
+    for c in texto:
+        if c == '"':
+            comillas = not comillas
+        elif not comillas and c == "(":
+            nivel += 1
+        elif not comillas and c == ")":
+            nivel -= 1
+        if c == separador and not comillas and nivel == 0:
+            partes.append(actual)
+            actual = ""
+        else:
+            actual += c
+    partes.append(actual)
+    return [p.strip() for p in partes if p.strip()]
+
+
+def _a_sqlite(valor: Any) -> Any:
+    if hasattr(valor, "item") and not isinstance(valor, (str, bytes)):
+        valor = valor.item()  # escalares de numpy
+    if isinstance(valor, float) and math.isnan(valor):
+        return None
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, (dict, list, tuple)):
+        return json.dumps(valor, ensure_ascii=False)
+    return valor
+
+
+def _patron(valor: str) -> str:
+    # PostgREST acepta * como comodín además de %
+    return str(valor).replace("*", "%")
+
+
+_COMPARADORES = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+class RepositorioSQLite(Repositorio):
+    """
+    Las mismas tablas en un archivo SQLite local, para trabajar sin red y para
+    medir las rutas calientes sin el viaje a Supabase. Las tablas y columnas se
+    crean solas con el primer insert (SQLite no exige tipos).
+    """
+
+    nombre = "sqlite"
+
+    def __init__(self, ruta: str = ":memory:"):
+        self.ruta = ruta
+        # Un solo connection compartido entre hilos (la paginación lee en paralelo)
+        self._con = sqlite3.connect(ruta, check_same_thread=False)
+        self._con.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+
+    # ---------- esquema ----------
+    def _columnas(self, tabla: str) -> List[str]:
+        return [f["name"] for f in self._con.execute(f"PRAGMA table_info({_cita(tabla)})")]
+
+    def _asegurar_columnas(self, tabla: str, columnas: Iterable[str]) -> None:
+        existentes = self._columnas(tabla)
+        if not existentes:
+            llave = LLAVES.get(tabla)
+            definicion = [f"{_cita(llave)} PRIMARY KEY"] if llave else []
+            definicion.append(_cita(COLUMNA_MODIFICACION))
+            self._con.execute(f"CREATE TABLE {_cita(tabla)} ({', '.join(definicion)})")
+            existentes = self._columnas(tabla)
+        for columna in columnas:
+            if columna not in existentes:
+                self._con.execute(f"ALTER TABLE {_cita(tabla)} ADD COLUMN {_cita(columna)}")
+                existentes.append(columna)
+
+    # ---------- traducción de filtros ----------
+    def _condicion(self, op: str, columna: str, valor: Any) -> Tuple[str, list]:
+        if op == "or":
+            return self._condicion_or(valor)
+        col = _cita(columna)
+        if op in _COMPARADORES:
+            return f"{col} {_COMPARADORES[op]} ?", [_a_sqlite(valor)]
+        if op in ("like", "ilike"):
+            return f"{col} LIKE ?", [_patron(valor)]
+        if op == "in_":
+            valores = list(valor)
+            if not valores:
+                return "0", []
+            return f"{col} IN ({', '.join('?' * len(valores))})", [_a_sqlite(v) for v in valores]
+        if op in ("is_", "not_is"):
+            negar = "NOT " if op == "not_is" else ""
+            if valor is None or str(valor).lower() == "null":
+                return f"{col} IS {negar}NULL", []
+            return f"{col} IS {negar}?", [1 if str(valor).lower() == "true" else 0]
+        raise ValueError(f"Filtro no soportado en el backend local: {op}")
+
+    def _condicion_or(self, expresion: str) -> Tuple[str, list]:
+        """Sintaxis de PostgREST: 'col.op.valor,col.op.valor' (con not. opcional)."""
+        partes, parametros = [], []
+        for termino in _partir(expresion):
+            columna, op, valor = termino.split(".", 2)
+            negar = op == "not"
+            if negar:
+                op, valor = valor.split(".", 1)
+            if op == "is":
+                op = "is_"
+            elif op == "in":
+                op, valor = "in_", [v.strip('"') for v in _partir(valor.strip("()"))]
+            sql, params = self._condicion(op, columna.strip('"'), valor)
+            partes.append(f"NOT ({sql})" if negar else sql)
+            parametros.extend(params)
+        return "(" + " OR ".join(partes) + ")", parametros
+
+    def _where(self, filtros: Optional[Sequence[Filtro]]) -> Tuple[str, list]:
+        partes, parametros = [], []
+        for op, columna, valor in filtros or ():
+            sql, params = self._condicion(op, columna, valor)
+            partes.append(sql)
+            parametros.extend(params)
+        return (" WHERE " + " AND ".join(partes) if partes else ""), parametros
+
+    # ---------- operaciones ----------
+    def seleccionar(self, tabla, columnas="*", filtros=None, orden=None, desc=False,
+                    limite=None, rango=None, contar=False) -> Resultado:
+        with self._lock:
+            if not self._columnas(tabla):
+                return Resultado([], 0 if contar else None)
+            nombres = [c.strip('"') for c in _partir(columnas_select(columnas))]
+            seleccion = "*" if nombres == ["*"] else ", ".join(_cita(c) for c in nombres)
+            where, parametros = self._where(filtros)
+            sql = f"SELECT {seleccion} FROM {_cita(tabla)}{where}"
+            if orden:
+                sql += f" ORDER BY {_cita(orden)} {'DESC' if desc else 'ASC'}"
+            if rango:
+                inicio, fin = rango
+                n = fin - inicio + 1 if not limite else min(limite, fin - inicio + 1)
+                sql += f" LIMIT {int(n)} OFFSET {int(inicio)}"
+            elif limite:
+                sql += f" LIMIT {int(limite)}"
+            data = [dict(f) for f in self._con.execute(sql, parametros)]
+            total = None
+            if contar:
+                total = self._con.execute(f"SELECT COUNT(*) FROM {_cita(tabla)}{where}", parametros).fetchone()[0]
+            return Resultado(data, total)
+
+    def insertar(self, tabla, filas) -> List[dict]:
+        filas = [filas] if isinstance(filas, dict) else list(filas)
+        if not filas:
+            return []
+        sello = datetime.now(timezone.utc).isoformat()
+        with self._lock, self._con:
+            self._asegurar_columnas(tabla, dict.fromkeys(c for f in filas for c in f))
+            for fila in filas:
+                fila = {**fila, COLUMNA_MODIFICACION: sello}
+                cols = ", ".join(_cita(c) for c in fila)
+                marcas = ", ".join("?" * len(fila))
+                self._con.execute(
+                    f"INSERT INTO {_cita(tabla)} ({cols}) VALUES ({marcas})",
+                    [_a_sqlite(v) for v in fila.values()],
+                )
+        return [dict(f) for f in filas]
+
+    def upsertar(self, tabla, filas, ignorar_duplicados=False) -> List[dict]:
+        filas = [filas] if isinstance(filas, dict) else list(filas)
+        llave = LLAVES.get(tabla)
+        if not filas:
+            return []
+        sello = datetime.now(timezone.utc).isoformat()
+        escritas = []
+        with self._lock, self._con:
+            self._asegurar_columnas(tabla, dict.fromkeys(c for f in filas for c in f))
+            for fila in filas:
+                fila = {**fila, COLUMNA_MODIFICACION: sello}
+                cols = ", ".join(_cita(c) for c in fila)
+                marcas = ", ".join("?" * len(fila))
+                sql = f"INSERT INTO {_cita(tabla)} ({cols}) VALUES ({marcas})"
+                if llave and ignorar_duplicados:
+                    sql += f" ON CONFLICT({_cita(llave)}) DO NOTHING"
+                elif llave:
+                    asignaciones = ", ".join(f"{_cita(c)} = excluded.{_cita(c)}" for c in fila if c != llave)
+                    sql += f" ON CONFLICT({_cita(llave)}) DO UPDATE SET {asignaciones}"
+                if self._con.execute(sql, [_a_sqlite(v) for v in fila.values()]).rowcount:
+                    escritas.append(fila)
+        return escritas
+
+    def actualizar(self, tabla, valores, filtros) -> List[dict]:
+        _exigir_filtros(filtros, "update")
+        valores = {**valores, COLUMNA_MODIFICACION: datetime.now(timezone.utc).isoformat()}
+        with self._lock, self._con:
+            if not self._columnas(tabla):
+                return []
+            self._asegurar_columnas(tabla, valores)
+            where, parametros = self._where(filtros)
+            asignaciones = ", ".join(f"{_cita(c)} = ?" for c in valores)
+            self._con.execute(
+                f"UPDATE {_cita(tabla)} SET {asignaciones}{where}",
+                [_a_sqlite(v) for v in valores.values()] + parametros,
+            )
+            return [dict(f) for f in self._con.execute(f"SELECT * FROM {_cita(tabla)}{where}", parametros)]
+
+    def eliminar(self, tabla, filtros) -> List[dict]:
+        _exigir_filtros(filtros, "delete")
+        with self._lock, self._con:
+            if not self._columnas(tabla):
+                return []
+            where, parametros = self._where(filtros)
+            borradas = [dict(f) for f in self._con.execute(f"SELECT * FROM {_cita(tabla)}{where}", parametros)]
+            self._con.execute(f"DELETE FROM {_cita(tabla)}{where}", parametros)
+            return borradas
+
+    def reservar_ids(self, nombre, cantidad) -> int:
+        if cantidad < 1:
+            raise ValueError("cantidad debe ser positiva")
+        with self._lock, self._con:
+            self._con.execute("CREATE TABLE IF NOT EXISTS _secuencias (nombre PRIMARY KEY, ultimo INTEGER NOT NULL)")
+            fila = self._con.execute("SELECT ultimo FROM _secuencias WHERE nombre = ?", (nombre,)).fetchone()
+            if fila is None:
+                # Igual que sql/reservar_ids.sql: arranca después del ID más alto (IG000123 -> 123)
+                ultimo = 0
+                llave = LLAVES.get(nombre)
+                if llave and self._columnas(nombre):
+                    ultimo = self._con.execute(
+                        f"SELECT MAX(CAST(SUBSTR({_cita(llave)}, 3) AS INTEGER)) FROM {_cita(nombre)}"
+                    ).fetchone()[0] or 0
+                self._con.execute("INSERT INTO _secuencias (nombre, ultimo) VALUES (?, ?)", (nombre, ultimo))
+            self._con.execute("UPDATE _secuencias SET ultimo = ultimo + ? WHERE nombre = ?", (cantidad, nombre))
+            return self._con.execute("SELECT ultimo FROM _secuencias WHERE nombre = ?", (nombre,)).fetchone()[0]
+
+
+class RepositorioConReintentos(Repositorio):
+    """
+    Envuelve cualquier backend con reintentos acotados por un plazo total.
+    Lecturas, updates y deletes son idempotentes; los inserts solo se reintentan
+    cuando es seguro que no se aplicaron (error de conexión, 429/503, rollback).
+    Por fuera va un circuit breaker: con el backend caído se falla al instante
+    y utils/datos.py sirve la última copia buena. Cada intento individual pasa por
+    el limitador adaptativo (las esperas del backoff no ocupan turno); la espera de
+    turno descuenta del mismo plazo total.
+    """
+
+    def __init__(
+        self,
+        backend: Repositorio,
+        plazo_lectura: float,
+        plazo_escritura: float,
+        hedge_tras: float = 0.0,
+        circuito: Optional[CircuitBreaker] = None,
+        limitador: Optional[LimitadorAdaptativo] = None,
+    ):
+        self.backend = backend
+        self.nombre = backend.nombre
+        self.plazo_lectura = plazo_lectura
+        self.plazo_escritura = plazo_escritura
+        self.hedge_tras = hedge_tras
+        self.circuito = circuito or CircuitBreaker(
+            lambda: backend.seleccionar("Rutas", ["ID_Ruta"], limite=1)
+        )
+        self.limitador = limitador or LimitadorAdaptativo()
+
+    def estado(self) -> dict:
+        """Estado del circuito y del limitador (límite actual, en curso, en cola)."""
+        return {
+            "backend": self.nombre,
+            "circuito": self.circuito.estado,
+            "abierto_desde": self.circuito.abierto_desde,
+            **self.limitador.estado(),
+        }
+
+    def _llamar(self, fn, plazo: float, idempotente: bool = True, hedge: bool = False):
+        # Un solo plazo para todo: la cola del limitador, los intentos y el backoff
+        limite = time.monotonic() + plazo
+
+        def restante() -> float:
+            return max(0.0, limite - time.monotonic())
+
+        def intento():
+            return self.limitador.ejecutar(fn, timeout=restante())
+
+        if hedge and self.hedge_tras > 0:
+            def primero():
+                return hedged(intento, hedge_after=self.hedge_tras, timeout=restante())
+        else:
+            primero = intento
+        return self.circuito.llamar(lambda: retry_with_backoff(
+            primero,
+            deadline=restante(),
+            retry_if=lambda exc: is_transient(exc, idempotent=idempotente),
+        ))
+
+    def seleccionar(self, *args, **kwargs) -> Resultado:
+        return self._llamar(lambda: self.backend.seleccionar(*args, **kwargs), self.plazo_lectura, hedge=True)
+
+    def insertar(self, tabla, filas) -> List[dict]:
+        return self._llamar(lambda: self.backend.insertar(tabla, filas), self.plazo_escritura, idempotente=False)
+
+    def upsertar(self, tabla, filas, ignorar_duplicados=False) -> List[dict]:
+        # Por llave primaria: repetirlo deja el mismo resultado, se reintenta como un update
+        return self._llamar(
+            lambda: self.backend.upsertar(tabla, filas, ignorar_duplicados), self.plazo_escritura
+        )
+
+    def actualizar(self, tabla, valores, filtros) -> List[dict]:
+        return self._llamar(lambda: self.backend.actualizar(tabla, valores, filtros), self.plazo_escritura)
+
+    def eliminar(self, tabla, filtros) -> List[dict]:
+        return self._llamar(lambda: self.backend.eliminar(tabla, filtros), self.plazo_escritura)
+
+    def reservar_ids(self, nombre, cantidad) -> int:
+        # Reintentar es seguro: si el primer intento sí llegó, solo queda un hueco en la numeración
+        return self._llamar(lambda: self.backend.reservar_ids(nombre, cantidad), self.plazo_escritura)
+
+
+def importar_tablas(
+    origen: Repositorio,
+    destino: Repositorio,
+    tablas: Sequence[str] = ("Rutas", "Traficos", "Usuarios"),
+    tam_pagina: int = 1000,
+) -> dict:
+    """Copia las tablas de un backend a otro (p. ej. Supabase -> SQLite para pruebas de carga)."""
+    copiadas = {}
+    for tabla in tablas:
+        llave = LLAVES.get(tabla)
+        inicio, total = 0, 0
+        while True:
+            lote = origen.seleccionar(tabla, orden=llave, rango=(inicio, inicio + tam_pagina - 1)).data
+            if not lote:
+                break
+            destino.insertar(tabla, lote)
+            total += len(lote)
+            inicio += len(lote)
+        copiadas[tabla] = total
+    return copiadas
+
+
+@st.cache_resource(show_spinner=False)
+def obtener_repositorio() -> Repositorio:
+    """
+    Backend de datos único por proceso, elegido en .streamlit/secrets.toml:
+        BACKEND_DATOS = "supabase" (por defecto) | "sqlite"
+        SQLITE_RUTA = "datos_local.sqlite3"
+    Todas las llamadas pasan por reintentos con plazo total (SUPABASE_PLAZO_LECTURA /
+    SUPABASE_PLAZO_ESCRITURA, en segundos). SUPABASE_HEDGE_TRAS > 0 activa una segunda
+    lectura idéntica si la primera no respondió en ese tiempo. El circuit breaker se abre
+    tras CIRCUITO_UMBRAL fallas seguidas y sondea cada CIRCUITO_ESPERA segundos.
+    LIMITADOR_INICIAL fija las peticiones simultáneas al arrancar; el máximo es el
+    tamaño del pool HTTP (SUPABASE_POOL_SIZE).
+    """
+    backend = leer_config("BACKEND_DATOS", "supabase").strip().lower()
+    if backend == "sqlite":
+        base = RepositorioSQLite(leer_config("SQLITE_RUTA", "datos_local.sqlite3"))
+    else:
+        base = RepositorioSupabase()
+    return RepositorioConReintentos(
+        base,
+        plazo_lectura=leer_config("SUPABASE_PLAZO_LECTURA", 15.0),
+        plazo_escritura=leer_config("SUPABASE_PLAZO_ESCRITURA", 20.0),
+        hedge_tras=leer_config("SUPABASE_HEDGE_TRAS", 0.0),
+        circuito=CircuitBreaker(
+            lambda: base.seleccionar("Rutas", ["ID_Ruta"], limite=1),
+            umbral=int(leer_config("CIRCUITO_UMBRAL", 3)),
+            espera=leer_config("CIRCUITO_ESPERA", 15.0),
+        ),
+        limitador=LimitadorAdaptativo(
+            inicial=int(leer_config("LIMITADOR_INICIAL", 8)),
+            maximo=int(leer_config("SUPABASE_POOL_SIZE", DEFAULT_POOL_SIZE)),
+        ),
+    )
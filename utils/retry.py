@@ -1,18 +1,129 @@
 # utils/retry.py
+import asyncio
 import random
+import sqlite3
 import time
-from typing import Callable, TypeVar, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Awaitable, Callable, TypeVar, Optional
+
+import httpx
+
+try:
+    from postgrest.exceptions import APIError
+    HAS_POSTGREST = True
+except Exception:
+    HAS_POSTGREST = False
 
 T = TypeVar("T")
 
 RETRIABLE_HTTP_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524}
 
+# Respuestas que garantizan que el servidor no procesó la petición (sirven también para inserts)
+NOT_PROCESSED_HTTP_CODES = {429, 503}
+
+# Errores de Postgres/PostgREST transitorios; en todos la sentencia no quedó aplicada
+RETRIABLE_PG_CODES = {
+    "40001",  # serialization_failure
+    "40P01",  # deadlock_detected
+    "53300",  # too_many_connections
+    "57014",  # statement_timeout / query_canceled
+    "57P01",  # admin_shutdown
+    "08000", "08001", "08003", "08006",  # conexión con la base
+    "PGRST000", "PGRST001", "PGRST002", "PGRST003",  # PostgREST sin conexión / pool agotado
+}
+
+# La conexión ni siquiera se estableció: seguro reintentar cualquier operación
+_CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# Pudo haber llegado al servidor: solo se reintenta si la operación es idempotente
+_NETWORK_ERRORS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+# Caídas del lado del servidor: lo único que cuenta el circuit breaker
+BACKEND_DOWN_HTTP_CODES = {500, 502, 503, 504, 520, 521, 522, 523, 524}
+BACKEND_DOWN_PG_CODES = {
+    "53300", "57P01",
+    "08000", "08001", "08003", "08006",
+    "PGRST000", "PGRST001", "PGRST002", "PGRST003",
+}
+# Sin PoolTimeout: es la espera por una conexión del pool local, no el backend
+_BACKEND_NETWORK_ERRORS = (
+    httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout, httpx.WriteTimeout,
+    httpx.NetworkError, httpx.RemoteProtocolError,
+)
+
+_TRANSIENT_HINTS = ("timed out", "timeout", "cloudflare", "522", "connection reset", "temporarily unavailable")
+
+class RechazoLocal(Exception):
+    """La petición ni salió del proceso (p. ej. sin turno en el limitador): no se reintenta."""
+
+
 def _get_status_code(exc: Exception) -> Optional[int]:
     # requests.HTTPError has response; some libs wrap it differently
     resp = getattr(exc, "response", None)
     if resp is not None:
         return getattr(resp, "status_code", None)
-    return getattr(exc, "status_code", None)
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status
+    # postgrest-py pone el status HTTP en .code cuando la respuesta no es JSON (p. ej. 52x de Cloudflare)
+    code = getattr(exc, "code", None)
+    if isinstance(code, str) and code.isdigit() and len(code) == 3:
+        return int(code)
+    return None
+
+def is_transient(exc: BaseException, idempotent: bool = True) -> bool:
+    """
+    Clasifica errores de httpx / supabase-py / sqlite.
+    idempotent=False (inserts): solo se reintenta si es seguro que no se aplicó nada.
+    """
+    if isinstance(exc, RechazoLocal):
+        return False
+    if isinstance(exc, _CONNECT_ERRORS):
+        return True
+    if isinstance(exc, _NETWORK_ERRORS):
+        return idempotent
+
+    if HAS_POSTGREST and isinstance(exc, APIError) and exc.code in RETRIABLE_PG_CODES:
+        return True
+
+    status = _get_status_code(exc)
+    if status is not None:
+        if status not in RETRIABLE_HTTP_CODES:
+            return False
+        return idempotent or status in NOT_PROCESSED_HTTP_CODES
+
+    if isinstance(exc, sqlite3.OperationalError):
+        msg = str(exc).lower()
+        return "locked" in msg or "busy" in msg
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return idempotent
+
+    msg = str(exc).lower()
+    return idempotent and any(h in msg for h in _TRANSIENT_HINTS)
+
+def is_overload(exc: BaseException) -> bool:
+    """El backend pide bajar el ritmo: 429/503 o PostgREST sin conexiones libres."""
+    if _get_status_code(exc) in NOT_PROCESSED_HTTP_CODES:
+        return True
+    return HAS_POSTGREST and isinstance(exc, APIError) and exc.code in {"53300", "PGRST003"}
+
+def is_backend_failure(exc: BaseException) -> bool:
+    """
+    El backend o la red hacia él fallaron: conexión, timeout de httpx, 5xx/52x o
+    Postgres sin conexiones. No cuentan los plazos propios del cliente (hedged,
+    cola del limitador), los 429 ni los errores de la petición (4xx, conflictos).
+    """
+    if isinstance(exc, RechazoLocal):
+        return False
+    if isinstance(exc, _BACKEND_NETWORK_ERRORS):
+        return True
+    if HAS_POSTGREST and isinstance(exc, APIError) and exc.code in BACKEND_DOWN_PG_CODES:
+        return True
+    return _get_status_code(exc) in BACKEND_DOWN_HTTP_CODES
+
+def _backoff(attempt: int, base_delay: float, max_delay: float, jitter: float) -> float:
+    delay = min(max_delay, base_delay * (2 ** (attempt - 1)))
+    return max(0.0, delay * (1 + random.uniform(-jitter, jitter)))
 
 def retry_with_backoff(
     fn: Callable[[], T],
@@ -21,11 +132,16 @@ def retry_with_backoff(
     base_delay: float = 0.6,
     max_delay: float = 8.0,
     jitter: float = 0.25,
+    deadline: Optional[float] = None,
+    retry_if: Callable[[BaseException], bool] = is_transient,
 ) -> T:
     """
     Retries fn() on transient network / 5xx / Cloudflare 52x-ish issues.
     Exponential backoff + jitter.
+    deadline: presupuesto total en segundos; no se duerme más allá de él
+    (evita tener el hilo del script bloqueado ~30 s durante un incidente).
     """
+    limite = time.monotonic() + deadline if deadline is not None else None
     last_exc: Exception | None = None
 
     for attempt in range(1, tries + 1):
@@ -33,19 +149,126 @@ def retry_with_backoff(
             return fn()
         except Exception as exc:
             last_exc = exc
-            status = _get_status_code(exc)
 
-            # Si podemos inferir status y NO es transitorio, no reintentes
-            if status is not None and status not in RETRIABLE_HTTP_CODES:
+            # Si no es transitorio, no reintentes
+            if not retry_if(exc):
                 raise
 
             if attempt == tries:
                 break
 
-            # backoff exponencial + jitter
-            delay = min(max_delay, base_delay * (2 ** (attempt - 1)))
-            delay = delay * (1 + random.uniform(-jitter, jitter))
-            time.sleep(max(0.0, delay))
+            # backoff exponencial + jitter, recortado al plazo restante
+            delay = _backoff(attempt, base_delay, max_delay, jitter)
+            if limite is not None and time.monotonic() + delay >= limite:
+                break
+            time.sleep(delay)
+
+    assert last_exc is not None
+    raise last_exc
+
+# Hilos para las peticiones "hedged"; la petición lenta sigue en su hilo hasta terminar
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+def hedged(fn: Callable[[], T], *, hedge_after: float, timeout: Optional[float] = None) -> T:
+    """
+    Solo para lecturas idempotentes: si fn() no respondió en hedge_after segundos,
+    lanza una segunda petición igual y se queda con la primera que termine bien.
+    """
+    inicio = time.monotonic()
+    primera = _hedge_pool.submit(fn)
+    try:
+        return primera.result(timeout=hedge_after)
+    except FutureTimeout:
+        pass
+
+    pendientes = {primera, _hedge_pool.submit(fn)}
+    last_exc: BaseException | None = None
+    while pendientes:
+        restante = None if timeout is None else max(0.0, timeout - (time.monotonic() - inicio))
+        hechos, pendientes = wait(pendientes, timeout=restante, return_when=FIRST_COMPLETED)
+        if not hechos:
+            raise TimeoutError(f"Sin respuesta en {timeout}s (petición duplicada incluida)")
+        for futuro in hechos:
+            if futuro.exception() is None:
+                return futuro.result()
+            last_exc = futuro.exception()
 
     assert last_exc is not None
     raise last_exc
+
+
+async def hedged_async(fn: Callable[[], Awaitable[T]], *, hedge_after: float, timeout: Optional[float] = None) -> T:
+    """Como hedged() para corutinas; la petición que pierde se cancela en vez de seguir sola."""
+    loop = asyncio.get_running_loop()
+    inicio = loop.time()
+    primera = asyncio.ensure_future(fn())
+    hechos, _ = await asyncio.wait({primera}, timeout=hedge_after)
+    if hechos:
+        return primera.result()
+
+    pendientes = {primera, asyncio.ensure_future(fn())}
+    last_exc: BaseException | None = None
+    try:
+        while pendientes:
+            restante = None if timeout is None else max(0.0, timeout - (loop.time() - inicio))
+            hechos, pendientes = await asyncio.wait(pendientes, timeout=restante, return_when=asyncio.FIRST_COMPLETED)
+            if not hechos:
+                raise TimeoutError(f"Sin respuesta en {timeout}s (petición duplicada incluida)")
+            for tarea in hechos:
+                if tarea.exception() is None:
+                    return tarea.result()
+                last_exc = tarea.exception()
+    finally:
+        for tarea in pendientes:
+            tarea.cancel()
+
+    assert last_exc is not None
+    raise last_exc
+
+async def retry_with_backoff_async(
+    fn: Callable[[], Awaitable[T]],
+    *,
+    tries: int = 5,
+    base_delay: float = 0.6,
+    max_delay: float = 8.0,
+    jitter: float = 0.25,
+    deadline: Optional[float] = None,
+    retry_if: Callable[[BaseException], bool] = is_transient,
+    hedge_after: Optional[float] = None,
+) -> T:
+    """
+    retry_with_backoff() para corutinas: mismo backoff, mismo `retry_if` y mismo plazo
+    total, que aquí también corta el intento en curso. hedge_after (solo lecturas
+    idempotentes): cada intento va por hedged_async() acotado al plazo restante.
+    """
+    loop = asyncio.get_running_loop()
+    limite = loop.time() + deadline if deadline is not None else None
+    last_exc: Exception | None = None
+
+    for attempt in range(1, tries + 1):
+        restante = None if limite is None else limite - loop.time()
+        if restante is not None and restante <= 0:
+            break
+        try:
+            if hedge_after:
+                intento = hedged_async(fn, hedge_after=hedge_after, timeout=restante)
+            else:
+                intento = fn()
+            return await (intento if restante is None else asyncio.wait_for(intento, timeout=restante))
+        except Exception as exc:
+            last_exc = exc
+
+            if not retry_if(exc):
+                raise
+
+            if attempt == tries:
+                break
+
+            delay = _backoff(attempt, base_delay, max_delay, jitter)
+            if limite is not None and loop.time() + delay >= limite:
+                break
+            await asyncio.sleep(delay)
+
+    if last_exc is None:
+        raise TimeoutError(f"Plazo de {deadline}s agotado")
+    raise last_exc
@@ -0,0 +1,77 @@
+# utils/single_flight.py
+import threading
+from collections import Counter
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+class _Vuelo:
+    __slots__ = ("evento", "resultado", "error")
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Junta llamadas idénticas concurrentes: la primera ejecuta fn y las que llegan
+    mientras sigue en curso esperan y reciben el mismo resultado (o el mismo error).
+    No es un caché: en cuanto la llamada termina, la siguiente vuelve a ejecutar.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_vuelo: dict = {}
+        self.ejecutadas: Counter = Counter()
+        self.coalescidas: Counter = Counter()
+        self.errores: Counter = Counter()
+
+    def hacer(self, llave: Hashable, fn: Callable[[], Any], etiqueta: str = "") -> Tuple[Any, bool]:
+        """Devuelve (resultado, compartido); compartido=True si se reutilizó otra llamada."""
+        with self._lock:
+            vuelo = self._en_vuelo.get(llave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._en_vuelo[llave] = _Vuelo()
+                self.ejecutadas[etiqueta] += 1
+            else:
+                self.coalescidas[etiqueta] += 1
+
+        if not lider:
+            vuelo.evento.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado, True
+
+        try:
+            vuelo.resultado = fn()
+        except BaseException as exc:
+            vuelo.error = exc
+            with self._lock:
+                self.errores[etiqueta] += 1
+            raise
+        finally:
+            with self._lock:
+                self._en_vuelo.pop(llave, None)
+            vuelo.evento.set()
+        return vuelo.resultado, False
+
+    def estadisticas(self) -> dict:
+        """Contadores por etiqueta (p. ej. por tabla) desde que arrancó el proceso."""
+        with self._lock:
+            etiquetas = set(self.ejecutadas) | set(self.coalescidas)
+            return {
+                "en_vuelo": len(self._en_vuelo),
+                "ejecutadas": sum(self.ejecutadas.values()),
+                "coalescidas": sum(self.coalescidas.values()),
+                "errores": sum(self.errores.values()),
+                "por_etiqueta": {
+                    e: {
+                        "ejecutadas": self.ejecutadas[e],
+                        "coalescidas": self.coalescidas[e],
+                        "errores": self.errores[e],
+                    }
+                    for e in sorted(etiquetas)
+                },
+            }
@@ -0,0 +1,100 @@
+# utils/snapshot_disco.py
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+import pandas as pd
+
+from utils.conexion import leer_config
+
+# --------- Opcional: Parquet con pyarrow (si no está, se usa pickle) ---------
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except Exception:
+    HAS_PYARROW = False
+
+# Se sube cuando cambia lo que se guarda en el meta; los archivos viejos se ignoran
+FORMATO = 2
+
+# Carpeta local de snapshots; vacío en secrets = desactivado
+DIRECTORIO = leer_config("SNAPSHOT_DIR", ".snapshots")
+
+_lock_escritura = threading.Lock()
+# Las escrituras corren en hilos: una versión vieja que termina tarde no pisa a una nueva
+_ultima_secuencia: dict = {}
+
+
+def _base(tabla: str, columnas: Optional[tuple]) -> str:
+    proyeccion = "todas" if columnas is None else hashlib.sha1("|".join(columnas).encode()).hexdigest()[:12]
+    return os.path.join(DIRECTORIO, f"{tabla}__{proyeccion}")
+
+
+def guardar(tabla: str, columnas: Optional[tuple], df: pd.DataFrame, meta: dict) -> bool:
+    """
+    Escribe el snapshot y su meta (versión, marca de agua, fecha de la última carga completa).
+    Escritura atómica: un proceso que arranca nunca ve un archivo a medias.
+    """
+    if not DIRECTORIO:
+        return False
+    base = _base(tabla, columnas)
+    try:
+        os.makedirs(DIRECTORIO, exist_ok=True)
+        with _lock_escritura:
+            secuencia = meta.get("secuencia", 0)
+            if secuencia < _ultima_secuencia.get(base, -1):
+                return False
+            _ultima_secuencia[base] = secuencia
+            archivo = None
+            if HAS_PYARROW:
+                try:
+                    df.to_parquet(base + ".parquet.tmp", index=False)
+                    archivo = base + ".parquet"
+                except Exception:
+                    archivo = None  # tipos mezclados en una columna: se guarda con pickle
+            if archivo is None:
+                df.to_pickle(base + ".pkl.tmp")
+                archivo = base + ".pkl"
+            os.replace(archivo + ".tmp", archivo)
+            meta = {
+                **meta,
+                "formato": FORMATO,
+                "tabla": tabla,
+                "columnas": list(columnas) if columnas is not None else None,
+                "archivo": os.path.basename(archivo),
+                "guardado_en": time.time(),
+            }
+            with open(base + ".json.tmp", "w", encoding="utf-8") as f:
+                json.dump(meta, f, default=str)
+            os.replace(base + ".json.tmp", base + ".json")
+        return True
+    except Exception:
+        # El snapshot en disco es solo para arrancar rápido; si falla, se sigue sin él
+        return False
+
+
+def cargar(tabla: str, columnas: Optional[tuple]) -> Optional[Tuple[pd.DataFrame, dict]]:
+    """Devuelve (df, meta) si hay un snapshot válido para esa tabla/proyección."""
+    if not DIRECTORIO:
+        return None
+    base = _base(tabla, columnas)
+    try:
+        with open(base + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("formato") != FORMATO or meta.get("tabla") != tabla:
+            return None
+        if meta.get("columnas") != (list(columnas) if columnas is not None else None):
+            return None
+        archivo = os.path.join(DIRECTORIO, meta["archivo"])
+        if archivo.endswith(".parquet"):
+            if not HAS_PYARROW:
+                return None
+            df = pd.read_parquet(archivo)
+        else:
+            df = pd.read_pickle(archivo)
+        return df, meta
+    except Exception:
+        return None
@@ -1,9 +1,10 @@
 import streamlit as st
 import hashlib
 import base64
-from supabase import create_client
+from utils.repositorio import obtener_repositorio
+from utils.circuit_breaker import CircuitoAbierto
+from utils.retry import is_transient
 from PIL import Image
-from utils.retry import retry_with_backoff
 
 # =========================
 # 🔐 LOGIN Y AUTENTICACIÓN
@@ -13,10 +14,8 @@ from utils.retry import retry_with_backoff
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
-# Conexión a Supabase
-url = st.secrets["SUPABASE_URL"]
-key = st.secrets["SUPABASE_KEY"]
-supabase = create_client(url, key)
+# Conexión a la base de datos (Supabase o backend local, según secrets)
+repo = obtener_repositorio()
 
 # Formulario de login (si no hay sesión activa)
 if "usuario" not in st.session_state:
@@ -25,19 +24,10 @@ if "usuario" not in st.session_state:
     password = st.text_input("Contraseña", type="password")
 
     def verificar_credenciales(correo, password):
-        def _call():
-            # OJO: asegúrate que el nombre de la tabla sea exacto ("Usuarios")
-            res = supabase.table("Usuarios").select("*").eq("ID_Usuario", correo).execute()
-
-            # supabase-py a veces regresa error en res.error o en res.data vacío
-            if getattr(res, "error", None):
-                raise RuntimeError(res.error)
-
-            return res
-
         try:
-            # Reintenta si hay 52x/5xx/timeouts intermitentes
-            res = retry_with_backoff(_call, tries=5, base_delay=0.6, max_delay=10.0)
+            # OJO: asegúrate que el nombre de la tabla sea exacto ("Usuarios")
+            # El repositorio ya reintenta 52x/5xx/timeouts intermitentes dentro de un plazo total
+            res = repo.seleccionar("Usuarios", filtros=[("eq", "ID_Usuario", correo)])
 
             if res.data:
                 user = res.data[0]
@@ -48,10 +38,10 @@ if "usuario" not in st.session_state:
             return None
 
         except Exception as e:
-            msg = str(e)
-
             # Mensaje más claro cuando es tema de red/Supabase/Cloudflare
-            if "522" in msg or "timed out" in msg or "Cloudflare" in msg or "Connection timed out" in msg:
+            if isinstance(e, CircuitoAbierto):
+                st.error(f"❌ {e}")
+            elif is_transient(e):
                 st.error("❌ Supabase no está respondiendo (timeout 522 / incidente regional). Intenta de nuevo en 1–2 minutos.")
             else:
                 st.error(f"❌ Error de conexión: {e}")